@@ -5,7 +5,7 @@ from typing import Optional
 import click
 
 from bisheng.utils.exceptions import PrintFailureError
-from bisheng.runner import Runner
+from bisheng.runner import Runner, RunMode
 from bisheng.utils.defaults import CONFIG_FILE_NAME
 
 
@@ -114,12 +114,86 @@ def init(config_dir, engine_type, debug, filename):
     help="Print verbose logs.",
     default=False,
 )
+@click.option(
+    "--mode",
+    type=click.Choice([mode.value for mode in RunMode]),
+    required=False,
+    default=RunMode.THREAD.value,
+    help="Dispatch prompts from a pool of worker threads ('thread') or from a single asyncio event loop ('async').",
+)
+@click.option(
+    "--concurrency",
+    type=int,
+    required=False,
+    help="Maximum number of prompts in flight at once in async mode. If not provided, it is set to the number of "
+         "prompts, capped at 256.",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    type=bool,
+    required=False,
+    default=False,
+    help="Invoke the engine for every prompt without reading or writing the response cache.",
+)
+@click.option(
+    "--refresh",
+    is_flag=True,
+    type=bool,
+    required=False,
+    default=False,
+    help="Invoke the engine for every prompt and replace the cached responses.",
+)
+@click.option(
+    "--full",
+    is_flag=True,
+    type=bool,
+    required=False,
+    default=False,
+    help="Regenerate every shape of the output deck, not only the shapes whose prompt changed since the last run.",
+)
+@click.option(
+    "--resume",
+    is_flag=True,
+    type=bool,
+    required=False,
+    default=False,
+    help="Resume a run that did not complete, skipping the prompts recorded in its journal.",
+)
+@click.option(
+    "--retry-failed",
+    is_flag=True,
+    type=bool,
+    required=False,
+    default=False,
+    help="Dispatch only the prompts that failed in the previous run, according to its journal.",
+)
+@click.option(
+    "--dry-run",
+    is_flag=True,
+    type=bool,
+    required=False,
+    default=False,
+    help="Estimate the tokens, cost and duration of the run without invoking the engine.",
+)
+@click.option(
+    "--stream",
+    is_flag=True,
+    type=bool,
+    required=False,
+    default=False,
+    help="Dispatch each prompt as soon as it is decoded, while the rest of the deck is decoded.",
+)
 # @click.pass_context
-def run(config_dir: str, num_threads: Optional[int], verbose: bool):
+def run(config_dir: str, num_threads: Optional[int], verbose: bool, mode: str, concurrency: Optional[int],
+        no_cache: bool, refresh: bool, full: bool, resume: bool, retry_failed: bool, dry_run: bool,
+        stream: bool):
     try:
         runner = Runner.load(config_dir)
         # click.confirm("Do you want to continue?", abort=True)
-        runner.run(num_threads=num_threads, verbose=verbose)
+        runner.run(num_threads=num_threads, verbose=verbose, mode=mode, concurrency=concurrency, no_cache=no_cache,
+                   refresh=refresh, full=full, resume=resume, retry_failed=retry_failed, dry_run=dry_run,
+                   stream=stream)
     except PrintFailureError:
         exit(1)
 
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from typing import Iterator
 
 
 class BaseDecoder(ABC):
@@ -10,3 +11,24 @@ class BaseDecoder(ABC):
     @abstractmethod
     def get_encoder_metadata(self) -> dict:
         pass
+
+    def batch(self, prompts: list) -> list:
+        """
+        Groups prompts that can be generated in one request into batch prompts. Returns the prompts unchanged by
+        default.
+
+        :param prompts:
+        :return:
+        """
+        return prompts
+
+    def iter_prompts(self) -> Iterator:
+        """
+        Decodes the prompts lazily, yielding each prompt once its instruction and dependencies are known, so that it
+        can be dispatched while the rest of the input is decoded. Every prompt is in `prompts` once the iterator is
+        exhausted. Decodes everything before yielding the first prompt by default.
+
+        :return:
+        """
+        self.decode()
+        yield from self.prompts
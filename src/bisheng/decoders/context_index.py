@@ -0,0 +1,125 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Bumped whenever the chunking, tokenization or index layout changes, so that cached indexes are rebuilt
+_INDEX_VERSION = 1
+_TOKEN_PATTERN = re.compile(r"\w+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+# BM25 term frequency saturation and document length normalization
+_K1 = 1.5
+_B = 0.75
+
+
+def _tokenize(text: str) -> list[str]:
+    return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in _STOPWORDS]
+
+
+class ContextIndex:
+    """A BM25 index over the chunks of a context file, used to give each prompt only the relevant parts of it.
+
+    The context is split into chunks of `chunk_size` words, consecutive chunks overlapping by `chunk_overlap` words.
+    Each chunk is indexed once in an inverted index (term to chunk frequencies). `search` scores the chunks sharing a
+    term with the query and returns the best `top_k` in their order in the context.
+
+    The index is cached on disk under `cache_dir`, keyed by a hash of the context and the chunking settings, so it is
+    built once per context file.
+    """
+
+    def __init__(self, chunks: list[str], postings: dict[str, dict[int, int]], lengths: list[int]):
+        self.chunks = chunks
+        self._postings = postings
+        self._lengths = lengths
+        self._average_length = sum(lengths) / len(lengths) if lengths else 0.0
+
+    @classmethod
+    def build(cls, context: str, chunk_size: int, chunk_overlap: int) -> "ContextIndex":
+        """
+        Chunks the context and indexes every chunk.
+
+        :param context:
+        :param chunk_size: Words per chunk.
+        :param chunk_overlap: Words shared by consecutive chunks.
+        :return:
+        """
+        words = context.split()
+        step = max(chunk_size - chunk_overlap, 1)
+        chunks = [" ".join(words[start:start + chunk_size])
+                  for start in range(0, max(len(words) - chunk_overlap, 1), step)]
+
+        postings: dict[str, dict[int, int]] = {}
+        lengths = []
+        for chunk_id, chunk in enumerate(chunks):
+            tokens = _tokenize(chunk)
+            lengths.append(len(tokens))
+            for token in tokens:
+                frequencies = postings.setdefault(token, {})
+                frequencies[chunk_id] = frequencies.get(chunk_id, 0) + 1
+        return cls(chunks, postings, lengths)
+
+    @classmethod
+    def load_or_build(cls, context: str, chunk_size: int, chunk_overlap: int,
+                      cache_dir: Optional[str]) -> "ContextIndex":
+        """
+        Returns the index of the context cached under CACHE_DIR, building and caching it if it is missing.
+
+        :param context:
+        :param chunk_size:
+        :param chunk_overlap:
+        :param cache_dir: The directory of cached indexes, or None to disable the cache.
+        :return:
+        """
+        if cache_dir is None:
+            return cls.build(context, chunk_size, chunk_overlap)
+
+        key = hashlib.sha256(json.dumps([_INDEX_VERSION, chunk_size, chunk_overlap, context]).encode()).hexdigest()
+        path = os.path.join(os.path.expanduser(cache_dir), f"{key}.json")
+        if os.path.isfile(path):
+            try:
+                with open(path) as file:
+                    data = json.load(file)
+                postings = {term: {int(chunk_id): frequency for chunk_id, frequency in frequencies.items()}
+                            for term, frequencies in data["postings"].items()}
+                return cls(data["chunks"], postings, data["lengths"])
+            except (ValueError, KeyError) as e:
+                logger.warning(f"Ignoring corrupt context index {path}: {e}")
+
+        index = cls.build(context, chunk_size, chunk_overlap)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump({"chunks": index.chunks, "postings": index._postings, "lengths": index._lengths}, file)
+        os.replace(temporary_path, path)
+        return index
+
+    def search(self, query: str, top_k: int) -> list[str]:
+        """
+        Returns the TOP_K chunks scoring highest for the query with BM25, in their order in the context.
+
+        :param query:
+        :param top_k:
+        :return:
+        """
+        scores: dict[int, float] = {}
+        num_chunks = len(self.chunks)
+        for term in set(_tokenize(query)):
+            frequencies = self._postings.get(term)
+            if not frequencies:
+                continue
+            idf = math.log(1 + (num_chunks - len(frequencies) + 0.5) / (len(frequencies) + 0.5))
+            for chunk_id, frequency in frequencies.items():
+                norm = _K1 * (1 - _B + _B * self._lengths[chunk_id] / self._average_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * frequency * (_K1 + 1) / (frequency + norm)
+
+        best = sorted(scores, key=lambda chunk_id: (-scores[chunk_id], chunk_id))[:top_k]
+        return [self.chunks[chunk_id] for chunk_id in sorted(best)]
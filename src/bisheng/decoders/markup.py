@@ -0,0 +1,55 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import re
+
+from pptx.shapes.base import BaseShape
+from pptx.slide import Slide
+
+# The bisheng tags of a text frame; GENERATE_CHART is listed before GENERATE so that the alternation matches it whole
+_TAG_PATTERN = re.compile(r"<(/?)(SYSTEM|GENERATE_CHART|GENERATE|FORMAT|DEPENDS)>")
+
+
+def scan_markup(text: str) -> dict[str, str]:
+    """
+    Returns the content of each bisheng tag in the text, keyed by tag name, reading the text once.
+
+    The content of a tag runs from its first opening tag to its last closing tag, as the greedy patterns of
+    `defaults` (e.g. `<GENERATE>(.*)</GENERATE>`) match it, so a tag that is opened or closed several times keeps the
+    text in between. Tags without a closing tag after their first opening tag are left out.
+
+    :param text:
+    :return:
+    """
+    first_opening_ends: dict[str, int] = {}
+    last_closing_starts: dict[str, int] = {}
+    for match in _TAG_PATTERN.finditer(text):
+        closing, name = match.groups()
+        if closing:
+            last_closing_starts[name] = match.start()
+        else:
+            first_opening_ends.setdefault(name, match.end())
+    return {name: text[start:last_closing_starts[name]] for name, start in first_opening_ends.items()
+            if last_closing_starts.get(name, -1) >= start}
+
+
+class MarkupScanner:
+    """Scans the notes of each slide and the text of each shape for bisheng tags once, caching the result.
+
+    python-pptx rebuilds `text_frame.text` from the XML on every access, so each text frame is read once per deck
+    rather than once per tag.
+    """
+
+    def __init__(self):
+        self._notes: dict[int, dict[str, str]] = {}
+        self._shapes: dict[tuple[int, int], dict[str, str]] = {}
+
+    def scan_notes(self, slide_id: int, slide: Slide) -> dict[str, str]:
+        if slide_id not in self._notes:
+            self._notes[slide_id] = scan_markup(slide.notes_slide.notes_text_frame.text)
+        return self._notes[slide_id]
+
+    def scan_shape(self, slide_id: int, shape: BaseShape) -> dict[str, str]:
+        key = (slide_id, shape.shape_id)
+        if key not in self._shapes:
+            self._shapes[key] = scan_markup(shape.text_frame.text) if shape.has_text_frame else {}
+        return self._shapes[key]
@@ -1,6 +1,6 @@
 import os
 import re
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
 import pptx
 from pptx.shapes.base import BaseShape
@@ -8,57 +8,50 @@ from pptx.slide import Slide
 
 from bisheng.utils import defaults
 from bisheng.utils.defaults import (
-    SYSTEM_PROMPT_PATTERN,
     DEFAULT_SYSTEM_PROMPT,
-    GENERATE_PROMPT_PATTERN,
-    OUTPUT_PROMPT_PATTERN
+    REFERENCE_PATTERN
 )
 
 from bisheng.decoders.base_decoder import BaseDecoder
+from bisheng.decoders.context_index import ContextIndex
+from bisheng.decoders.markup import MarkupScanner
 from bisheng.prompting.base_prompt import BasePrompt
+from bisheng.prompting.batch_prompt import BatchPrompt
+from bisheng.prompting.prompt_graph import dependency_order, find_cycle
 from bisheng.prompting.templates.template_factory import TemplateFactory
+from bisheng.utils.deck_index import DeckIndex
+from bisheng.utils.exceptions import DependencyCycleError
 
 
-def _has_system_prompt(slide) -> bool:
-    return len(re.findall(SYSTEM_PROMPT_PATTERN, slide.notes_slide.notes_text_frame.text.strip(), re.DOTALL)) > 0
-
-
-def _get_system_prompt(slide) -> Optional[str]:
-    return re.findall(SYSTEM_PROMPT_PATTERN, slide.notes_slide.notes_text_frame.text.strip(), re.DOTALL)[0] \
-        if _has_system_prompt(slide) \
-        else DEFAULT_SYSTEM_PROMPT
-
-
-def _has_generate_prompt(shape) -> bool:
-    return len(re.findall(GENERATE_PROMPT_PATTERN, shape.text_frame.text.strip(), re.DOTALL)) > 0
-
-
-def _get_generate_prompt(shape) -> Optional[str]:
-    return re.findall(GENERATE_PROMPT_PATTERN, shape.text_frame.text.strip(), re.DOTALL)[0]
-
-
-def _has_output_prompt(shape) -> bool:
-    return len(re.findall(OUTPUT_PROMPT_PATTERN, shape.text_frame.text.strip(), re.DOTALL)) > 0
-
-
-def _get_output_prompt(shape) -> Optional[str]:
-    return re.findall(OUTPUT_PROMPT_PATTERN, shape.text_frame.text.strip(), re.DOTALL)[0]
+def _split_references(depends: str) -> list[str]:
+    return [reference.strip() for reference in re.split(r"[,\n]", depends) if reference.strip()]
 
 
 class PptxDecoder(BaseDecoder):
     class PptxPromptBehavior(BasePrompt):
 
-        def __init__(self, slide: Slide, shape: BaseShape, system_prompt, instruction):
+        def __init__(self, slide: Slide, shape: BaseShape, system_prompt, instruction, instruction_prefix="",
+                     instruction_suffix=None, output_format="", instruction_template=None,
+                     instruction_parameters=None, slide_id=None):
             self.slide = slide
+            # `Slide.slide_id` scans the deck's slide list, so the decoder passes the id from its deck index
+            self.slide_id = slide.slide_id if slide_id is None else slide_id
             self.shape = shape
             self.system_prompt = system_prompt
             self.instruction = instruction
+            self.instruction_prefix = instruction_prefix
+            self.instruction_suffix = instruction if instruction_suffix is None else instruction_suffix
+            self.output_format = output_format
+            self.instruction_template = instruction_template
+            self.instruction_parameters = instruction_parameters or {}
+            # the prompt generating each shape referenced in the generate prompt, keyed by the reference
+            self.dependencies: dict[str, PptxDecoder.PptxPromptBehavior] = {}
 
         def to_json(self):
             return {
                 "instruction": self.instruction,
                 "system_prompt": self.system_prompt,
-                "slide_id": self.slide.slide_id,
+                "slide_id": self.slide_id,
                 "slide_name": self.slide.name,
                 "shape_id": self.shape.shape_id,
                 "shape_name": self.shape.name
@@ -70,9 +63,34 @@ class PptxDecoder(BaseDecoder):
         def get_instruction_prompt(self):
             return self.instruction
 
+        def get_instruction_prefix(self):
+            return self.instruction_prefix
+
+        def get_instruction_suffix(self):
+            return self.instruction_suffix
+
+        def get_output_format(self):
+            return self.output_format
+
+        def get_dependencies(self):
+            return list(dict.fromkeys(self.dependencies.values()))
+
+        def resolve(self, responses: dict):
+            texts = {reference: responses[dependency].response.strip()
+                     for reference, dependency in self.dependencies.items()}
+            generate_prompt = re.sub(REFERENCE_PATTERN, lambda match: texts[match.group(1).strip()],
+                                     self.instruction_parameters["generate_prompt"])
+            instruction_parameters = {**self.instruction_parameters, "generate_prompt": generate_prompt}
+            self.instruction = self.instruction_template.create_instruction(**instruction_parameters)
+            self.instruction_prefix = self.instruction_template.create_instruction_prefix(**instruction_parameters)
+            self.instruction_suffix = self.instruction_template.create_instruction_suffix(**instruction_parameters)
+
         def get_slide(self):
             return self.slide
 
+        def get_slide_id(self):
+            return self.slide_id
+
         def get_shape(self):
             return self.shape
 
@@ -80,49 +98,169 @@ class PptxDecoder(BaseDecoder):
                  prompts_path: str,
                  shots_path: str,
                  context_path: str,
-                 instruction: str
+                 instruction: str,
+                 batching: Optional[dict] = None,
+                 retrieval: Optional[dict] = None
                  ):
         self.prompts_path = prompts_path
         self.shots_path = shots_path
         self.context_path = context_path
         self.instruction = instruction
+        self.batching = batching or {}
+        self.retrieval = retrieval or {}
         self._process_files(context_path, prompts_path, shots_path)
+        self._markup = MarkupScanner()
+        self._context_index = self._create_context_index()
 
         self.prompts: List[PptxDecoder.PptxPromptBehavior] = []
         self.template_factory = TemplateFactory(config=instruction)
 
     def _create_prompt(self, shape, slide, instruction_template) -> PptxPromptBehavior:
-        system_prompt = _get_system_prompt(slide)
-        generate_prompt = _get_generate_prompt(shape)
-        output_filter = _get_output_prompt(shape) if _has_output_prompt(shape) else defaults.DEFAULT_OUTPUT_INDICATOR
-
-        prompt_slides = self.prompts_pptx.slides
-        shot_slides = self.shots_pptx.slides
-        shot_slide_idx = prompt_slides.index(slide)
-        shot_slide = shot_slides[shot_slide_idx]
-        shot_shape_idx = slide.shapes.index(shape)
-        shot_shape = shot_slide.shapes[shot_shape_idx]
+        slide_id = self.deck_index.slide_id(slide)
+        markup = self._markup.scan_shape(slide_id, shape)
+        system_prompt = self._markup.scan_notes(slide_id, slide).get("SYSTEM", DEFAULT_SYSTEM_PROMPT)
+        generate_prompt = markup["GENERATE"]
+        # the shapes listed in <DEPENDS> are given to the engine after the generate prompt
+        generate_prompt += "".join(f"\nTEXT OF {reference}: {{{{ref:{reference}}}}}"
+                                   for reference in _split_references(markup.get("DEPENDS", "")))
+        output_filter = markup.get("FORMAT", defaults.DEFAULT_OUTPUT_INDICATOR)
+
+        shot_shape = self.shots_index.get_shape(*self.deck_index.locate(slide, shape))
         shot_text = shot_shape.text_frame.text.strip()
 
         all_params = {
             "generate_prompt": generate_prompt,
             "shot_text": shot_text,
-            "context": self.context,
+            "context": self._get_context(generate_prompt, shot_text),
             "output_filter": output_filter
         }
         required_params = instruction_template.get_required_params()
         instruction_parameters = {k: v for k, v in all_params.items() if k in required_params}
         instruction = instruction_template.create_instruction(**instruction_parameters)
-        return PptxDecoder.PptxPromptBehavior(slide, shape, system_prompt, instruction)
+        return PptxDecoder.PptxPromptBehavior(slide, shape, system_prompt, instruction,
+                                              instruction_template.create_instruction_prefix(**instruction_parameters),
+                                              instruction_template.create_instruction_suffix(**instruction_parameters),
+                                              output_filter, instruction_template, instruction_parameters,
+                                              slide_id)
+
+    def _create_context_index(self) -> Optional[ContextIndex]:
+        """
+        Indexes the context for retrieval when `retrieval` is enabled.
+
+        :return:
+        """
+        if not self.retrieval.get("enabled", bool(self.retrieval)):
+            return None
+        return ContextIndex.load_or_build(
+            self.context,
+            chunk_size=self.retrieval.get("chunk_size", defaults.RETRIEVAL_CHUNK_SIZE),
+            chunk_overlap=self.retrieval.get("chunk_overlap", defaults.RETRIEVAL_CHUNK_OVERLAP),
+            cache_dir=self.retrieval.get("cache_dir", defaults.RETRIEVAL_CACHE_DIR),
+        )
+
+    def _get_context(self, generate_prompt: str, shot_text: str) -> str:
+        """
+        Returns the context to embed in a prompt: the whole context, or with retrieval only the chunks most relevant
+        to the prompt's generate and shot text (the whole context if none is relevant).
+
+        :param generate_prompt:
+        :param shot_text:
+        :return:
+        """
+        if self._context_index is None:
+            return self.context
+        chunks = self._context_index.search(f"{generate_prompt}\n{shot_text}",
+                                            top_k=self.retrieval.get("top_k", defaults.RETRIEVAL_TOP_K))
+        return "\n...\n".join(chunks) if chunks else self.context
 
     def _find_prompts(self):
-        slides = self.prompts_pptx.slides
-        for slide in slides:
-            qualified_shapes = list(filter(lambda shape: shape.has_text_frame, slide.shapes))
-            qualified_shapes = list(filter(_has_generate_prompt, qualified_shapes))
-            self.prompts.extend([self._create_prompt(shape, slide, self.template_factory.create()) for shape in
-                                 qualified_shapes])
+        for _ in self.iter_prompts():
+            pass
+
+    def iter_prompts(self) -> Iterator[PptxPromptBehavior]:
+        """
+        Yields the prompt of each shape with a generate prompt as soon as it is created, in deck order. The prompts
+        referencing other shapes are yielded last, once the whole deck is read and their references are resolved,
+        each after the prompts it depends on.
+
+        :return:
+        """
+        referencing = []
+        for slide in self.prompts_pptx.slides:
+            slide_id = self.deck_index.slide_id(slide)
+            for shape in slide.shapes:
+                if "GENERATE" not in self._markup.scan_shape(slide_id, shape):
+                    continue
+                prompt = self._create_prompt(shape, slide, self.template_factory.create())
+                self.prompts.append(prompt)
+                if re.search(REFERENCE_PATTERN, prompt.instruction_parameters.get("generate_prompt", "")):
+                    referencing.append(prompt)
+                else:
+                    yield prompt
         self.num_prompts = len(self.prompts)
+        self._link_dependencies()
+        yield from dependency_order(referencing)
+
+    def _get_reference(self, prompt: PptxPromptBehavior) -> str:
+        return f"{self.deck_index.slide_position(prompt.get_slide_id()) + 1}/{prompt.get_shape().name}"
+
+    def _link_dependencies(self):
+        """
+        Resolves the `{{ref:...}}` references of each generate prompt to the prompts of the referenced shapes, and
+        checks that no shape depends on its own generated text.
+
+        A reference is `slide/shape`, with the 1-based slide number and the shape name, or just the shape name for a
+        shape of the same slide.
+
+        :return:
+        """
+        prompts_by_reference = {}
+        for prompt in self.prompts:
+            reference = self._get_reference(prompt)
+            # shapes sharing a name on a slide cannot be referenced
+            prompts_by_reference[reference] = None if reference in prompts_by_reference else prompt
+
+        for prompt in self.prompts:
+            slide_number = self._get_reference(prompt).split("/", 1)[0]
+            for reference in re.findall(REFERENCE_PATTERN, prompt.instruction_parameters.get("generate_prompt", "")):
+                reference = reference.strip()
+                qualified_reference = reference if re.match(r"\d+/", reference) else f"{slide_number}/{reference}"
+                dependency = prompts_by_reference.get(qualified_reference)
+                if dependency is None:
+                    raise ValueError(f"Shape {self._get_reference(prompt)} refers to {reference}, which is not a "
+                                     f"uniquely named shape with a generate prompt")
+                prompt.dependencies[reference] = dependency
+
+        cycle = find_cycle(self.prompts)
+        if cycle is not None:
+            raise DependencyCycleError(
+                "Shapes depend on each other's text: " + " -> ".join(self._get_reference(p) for p in cycle))
+
+    def batch(self, prompts: list) -> list:
+        """
+        Combines the prompts of each slide into batch prompts of at most `batching.max_shapes` shapes (or every shape
+        of the slide), when `batching` is enabled. Prompts of a slide with a different instruction prefix are batched
+        separately, and a slide with a single prompt is left as is.
+
+        :param prompts:
+        :return:
+        """
+        if not self.batching.get("enabled", bool(self.batching)):
+            return prompts
+        max_shapes = self.batching.get("max_shapes")
+
+        groups = {}
+        for prompt in prompts:
+            key = (prompt.get_slide_id(), prompt.get_system_prompt(), prompt.get_instruction_prefix())
+            groups.setdefault(key, []).append(prompt)
+
+        batched = []
+        for group in groups.values():
+            size = max_shapes or len(group)
+            for start in range(0, len(group), size):
+                chunk = group[start:start + size]
+                batched.append(BatchPrompt(chunk) if len(chunk) > 1 else chunk[0])
+        return batched
 
     def _process_files(self, context_path, prompts_path, shots_path):
         if os.path.isfile(prompts_path):
@@ -138,6 +276,9 @@ class PptxDecoder(BaseDecoder):
                 self.context = file.read()
         else:
             raise FileNotFoundError(f"File not found: {context_path}")
+        # read once, since the shots and output decks are looked up by position for every prompt
+        self.deck_index = DeckIndex(self.prompts_pptx.slides)
+        self.shots_index = DeckIndex(self.shots_pptx.slides)
 
     def decode(self, *args, **input_data: dict):
         self._find_prompts()
@@ -145,6 +286,7 @@ class PptxDecoder(BaseDecoder):
     def get_encoder_metadata(self) -> dict:
         encoder_metadata = {
             "context": self.context,
-            "slides": self.prompts_pptx.slides
+            "slides": self.prompts_pptx.slides,
+            "deck_index": self.deck_index
         }
         return encoder_metadata
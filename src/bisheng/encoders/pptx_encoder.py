@@ -5,6 +5,8 @@ import pptx
 from pptx.util import Pt
 
 from bisheng.encoders.base_encoder import BaseEncoder
+from bisheng.prompting.failed_response import FailedResponse
+from bisheng.utils.deck_index import DeckIndex
 
 
 class PptxEncoder(BaseEncoder):
@@ -20,14 +22,16 @@ class PptxEncoder(BaseEncoder):
 
     def encode(self, **input_data):
         results = input_data["results"]
-        slides = input_data["slides"]
+        # decoders that do not index their deck only provide its slides
+        deck_index = input_data.get("deck_index") or DeckIndex(input_data["slides"])
 
-        artifact_slides = self.artifact_pptx.slides
+        artifact_index = DeckIndex(self.artifact_pptx.slides)
         for prompt, response in results.items():
-            artifact_slide_idx = slides.index(prompt.get_slide())
-            artifact_slide = artifact_slides[artifact_slide_idx]
-            artifact_shape_idx = prompt.get_slide().shapes.index(prompt.get_shape())
-            artifact_shape = artifact_slide.shapes[artifact_shape_idx]
+            if isinstance(response, FailedResponse):
+                continue
+            slide_position, shape_position = deck_index.locate(prompt.get_slide(), prompt.get_shape())
+            artifact_slide = artifact_index.get_slide(slide_position)
+            artifact_shape = artifact_index.get_shape(slide_position, shape_position)
 
             artifact_slide.notes_slide.notes_text_frame.text += response.rationale
             artifact_slide.notes_slide.notes_text_frame.text += "\n\n\n"
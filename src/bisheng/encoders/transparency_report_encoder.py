@@ -26,8 +26,8 @@ class TransparencyReportEncoder(BaseEncoder):
             f.write("\t\"context\": \"" + str(context) + "\",\n")
             f.write("\t\"results\": ")
             records = []
-            record = {}
             for prompt, response in results.items():
+                record = {}
                 record["prompt"] = prompt.to_json()
                 record["response"] = response.to_json()
                 records.append(record)
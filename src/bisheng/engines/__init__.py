@@ -1,5 +1,6 @@
 from .base_engine import BaseEngine
 from .engine_factory import EngineFactory
+from .engine_pool import EnginePool
 from .boto3_engine import Boto3Engine
 
-__all__ = ["BaseEngine", "Boto3Engine", "EngineFactory"]
+__all__ = ["BaseEngine", "Boto3Engine", "EngineFactory", "EnginePool"]
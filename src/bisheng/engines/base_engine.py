@@ -1,3 +1,4 @@
+import asyncio
 from abc import ABC, abstractmethod
 
 from bisheng.prompting.base_prompt import BasePrompt
@@ -9,3 +10,38 @@ class BaseEngine(ABC):
     @abstractmethod
     def invoke(self, prompt: BasePrompt) -> BaseResponse:
         pass
+
+    async def ainvoke(self, prompt: BasePrompt) -> BaseResponse:
+        """
+        Invokes the engine from an asyncio event loop.
+
+        Engines without native asyncio support run `invoke` in a worker thread.
+
+        :param prompt:
+        :return:
+        """
+        return await asyncio.to_thread(self.invoke, prompt)
+
+    def warm(self):
+        """
+        Prepares the engine before it serves its first prompt (e.g. opens connections). No-op by default.
+
+        :return:
+        """
+        pass
+
+    def close(self):
+        """
+        Releases any resources held by the engine once a run is finished. No-op by default.
+
+        :return:
+        """
+        pass
+
+    async def aclose(self):
+        """
+        Releases the engine's resources from an asyncio event loop, including any asyncio connections.
+
+        :return:
+        """
+        self.close()
@@ -2,5 +2,7 @@
 # SPDX-License-Identifier: Apache-2.0
 
 from .driver import BedrockEngine
+from .converse_driver import BedrockConverseEngine
+from .streaming_driver import BedrockStreamingEngine
 
-__all__ = ["BedrockEngine"]
+__all__ = ["BedrockEngine", "BedrockConverseEngine", "BedrockStreamingEngine"]
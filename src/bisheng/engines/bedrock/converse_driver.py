@@ -0,0 +1,89 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import json
+import logging
+from urllib.parse import quote
+
+from bisheng.engines.bedrock.driver import BedrockEngine
+from bisheng.engines.bedrock.response import BedrockResponse
+from bisheng.prompting.base_prompt import BasePrompt
+
+logger = logging.getLogger(__name__)
+
+_CACHE_POINT = {"cachePoint": {"type": "default"}}
+
+
+class BedrockConverseEngine(BedrockEngine):
+    """A Bedrock engine built on the Converse API that caches the part of the prompt shared by the whole deck.
+
+    The system prompt and the stable instruction prefix (the context) are sent first and followed by a cache
+    checkpoint; only the per-prompt suffix (input data, examples and output format) follows it. Once the first prompt
+    has written the prefix to the provider's prompt cache, later prompts read it from the cache instead of paying
+    full input-token latency and cost. Cache read and write token counts are reported in each response's usage.
+
+    Prompts shorter than the model's minimum cacheable length are sent as usual and simply not cached.
+    """
+
+    def _build_converse_request(self, prompt: BasePrompt) -> dict:
+        prefix = prompt.get_instruction_prefix()
+        system = [{"text": prompt.get_system_prompt()}]
+        if prefix:
+            content = [{"text": prefix}, _CACHE_POINT, {"text": prompt.get_instruction_suffix()}]
+        else:
+            system.append(_CACHE_POINT)
+            content = [{"text": prompt.get_instruction_suffix()}]
+
+        return {
+            "system": system,
+            "messages": [{"role": self._hyperparameters["role"], "content": content}],
+            "inferenceConfig": {
+                "maxTokens": self._hyperparameters["max_tokens"],
+                "temperature": self._hyperparameters["temperature"],
+                "topP": self._hyperparameters["top_p"],
+            },
+            "additionalModelRequestFields": {"top_k": self._hyperparameters["top_k"]},
+        }
+
+    def invoke(self, prompt: BasePrompt):
+        request = self._build_converse_request(prompt)
+        reservation = self._rate_limiter.reserve(self._estimate_tokens(prompt)) if self._rate_limiter else None
+
+        response = None
+        try:
+            response = self._parse_converse_response(self.boto3_client.converse(modelId=self._model_id, **request))
+        finally:
+            self._record_usage(reservation, response)
+
+        return response
+
+    async def ainvoke(self, prompt: BasePrompt):
+        request = self._build_converse_request(prompt)
+        headers = {"Content-Type": "application/json", "Accept": "application/json"}
+        reservation = await self._rate_limiter.areserve(self._estimate_tokens(prompt)) if self._rate_limiter else None
+
+        response = None
+        try:
+            response = self._parse_converse_response(json.loads(await self._asend(
+                "Converse",
+                f"/model/{quote(self._model_id, safe='')}/converse",
+                headers,
+                json.dumps(request).encode()
+            )))
+        finally:
+            self._record_usage(reservation, response)
+
+        return response
+
+    @staticmethod
+    def _parse_converse_response(body: dict) -> BedrockResponse:
+        response_text = "".join(block.get("text", "") for block in body["output"]["message"]["content"])
+        usage = body.get("usage", {})
+        usage = {
+            "input_tokens": usage.get("inputTokens", 0),
+            "output_tokens": usage.get("outputTokens", 0),
+            "cache_read_input_tokens": usage.get("cacheReadInputTokens", 0),
+            "cache_write_input_tokens": usage.get("cacheWriteInputTokens", 0),
+        }
+        logger.debug(f"Prompt cache read {usage['cache_read_input_tokens']} tokens, "
+                     f"wrote {usage['cache_write_input_tokens']} tokens")
+        return BedrockEngine._parse_response_text(response_text, usage)
@@ -4,10 +4,14 @@ import re
 import json
 import uuid
 from typing import Optional
+from urllib.parse import quote
 
 from bisheng.engines.bedrock.response import BedrockResponse
 from bisheng.engines.boto3_engine import Boto3Engine
+from bisheng.engines.rate_limiter import RateLimiter, Reservation
 from bisheng.prompting.base_prompt import BasePrompt
+from bisheng.utils.metrics import metrics
+from bisheng.utils.tokens import estimate_tokens
 
 _SERVICE_NAME = 'bedrock-runtime'
 
@@ -23,6 +27,7 @@ class BedrockEngine(Boto3Engine):
                  guardrail_id: Optional[str],
                  guardrail_version: Optional[str],
                  hyperparameters: Optional[dict],
+                 rate_limit: Optional[dict] = None,
                  **kwargs):
         super().__init__(boto3_service_name=_SERVICE_NAME, **kwargs)
         # self._provider = model["provider"]
@@ -34,27 +39,105 @@ class BedrockEngine(Boto3Engine):
         self._guardrail_version = guardrail_version
         self._hyperparameters = hyperparameters
         self._session_id: str = str(uuid.uuid4())
+        # quotas apply per model and region
+        self._rate_limiter = RateLimiter.get_instance(
+            f"{self.boto3_client.meta.region_name}/{model_id}", **rate_limit) if rate_limit else None
+
+    def _build_request_body(self, prompt: BasePrompt) -> dict:
+        return {"anthropic_version": self._version, "max_tokens": self._hyperparameters["max_tokens"],
+                "system": prompt.get_system_prompt(), "messages": [{
+                    "role": self._hyperparameters["role"],
+                    "content": [{"type": "text", "text": prompt.get_instruction_prompt()}, ],
+                }], "temperature": self._hyperparameters["temperature"],
+                "top_p": self._hyperparameters["top_p"],
+                "top_k": self._hyperparameters["top_k"]
+                }
 
     def invoke(self, prompt: BasePrompt):
-        request_body = {"anthropic_version": self._version, "max_tokens": self._hyperparameters["max_tokens"],
-                        "system": prompt.get_system_prompt(), "messages": [{
-                            "role": self._hyperparameters["role"],
-                            "content": [{"type": "text", "text": prompt.get_instruction_prompt()}, ],
-                        }], "temperature": self._hyperparameters["temperature"],
-                        "top_p": self._hyperparameters["top_p"],
-                        "top_k": self._hyperparameters["top_k"]
-                        }
-
-        response = self.boto3_client.invoke_model(
-            body=json.dumps(request_body),
-            contentType='application/json',
-            accept='application/json',
-            modelId=self._model_id,
-            trace=self._trace
-        ).get("body").read()
-
-        response_text = json.loads(response)["content"][0]["text"]
+        request_body = self._build_request_body(prompt)
+        reservation = self._rate_limiter.reserve(self._estimate_tokens(prompt)) if self._rate_limiter else None
+
+        response = None
+        try:
+            response = self._parse_response_body(self.boto3_client.invoke_model(
+                body=json.dumps(request_body),
+                contentType='application/json',
+                accept='application/json',
+                modelId=self._model_id,
+                trace=self._trace
+            ).get("body").read())
+        finally:
+            self._record_usage(reservation, response)
+
+        return response
+
+    async def ainvoke(self, prompt: BasePrompt):
+        request_body = self._build_request_body(prompt)
+        headers = {"Content-Type": "application/json", "Accept": "application/json"}
+        if self._trace:
+            headers["X-Amzn-Bedrock-Trace"] = self._trace
+        reservation = await self._rate_limiter.areserve(self._estimate_tokens(prompt)) if self._rate_limiter else None
+
+        response = None
+        try:
+            response = self._parse_response_body(await self._asend(
+                "InvokeModel",
+                f"/model/{quote(self._model_id, safe='')}/invoke",
+                headers,
+                json.dumps(request_body).encode()
+            ))
+        finally:
+            self._record_usage(reservation, response)
+
+        return response
+
+    def _estimate_tokens(self, prompt: BasePrompt) -> int:
+        """
+        Returns the worst-case number of tokens a prompt counts against the tokens-per-minute quota: its estimated
+        input tokens plus `max_tokens`.
+
+        :param prompt:
+        :return:
+        """
+        return (estimate_tokens(prompt.get_system_prompt(), prompt.get_instruction_prompt())
+                + self._hyperparameters["max_tokens"])
+
+    def _record_usage(self, reservation: Optional[Reservation], response: Optional[BedrockResponse]):
+        """
+        Records the tokens used by a request and reconciles its rate limiter reservation.
+
+        When no usage is available (the request failed), the `max_tokens` part of the reservation is returned and the
+        estimated input tokens stay charged.
+
+        :param reservation:
+        :param response:
+        :return:
+        """
+        usage = response.usage if response is not None else None
+        if usage:
+            for name, count in usage.items():
+                metrics.increment(f"bedrock.{name}", count)
+        if reservation is None:
+            return
+
+        if usage:
+            used_tokens = sum(usage.values())
+        else:
+            used_tokens = reservation.tokens - self._hyperparameters["max_tokens"]
+        self._rate_limiter.reconcile(reservation, used_tokens)
+
+    @staticmethod
+    def _parse_response_body(body: bytes) -> BedrockResponse:
+        response_body = json.loads(body)
+        usage = response_body.get("usage")
+        return BedrockEngine._parse_response_text(
+            response_body["content"][0]["text"],
+            {"input_tokens": usage.get("input_tokens", 0),
+             "output_tokens": usage.get("output_tokens", 0)} if usage else None
+        )
 
+    @staticmethod
+    def _parse_response_text(response_text: str, usage: Optional[dict]) -> BedrockResponse:
         rationale_regex = r"<rationale>(.*)</rationale>"
         response_regex = r"<response>(.*)</response>"
         rationale_matches = re.findall(rationale_regex, response_text, re.DOTALL)
@@ -63,5 +146,6 @@ class BedrockEngine(Boto3Engine):
         return BedrockResponse(
             rationale=rationale_matches[0] if len(rationale_matches) > 0 else "",
             response=response_matches[0] if len(response_matches) > 0 else "",
-            sources=""
+            sources="",
+            usage=usage
         )
@@ -1,13 +1,20 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
+from typing import Optional
 
 from bisheng.prompting.base_response import BaseResponse
 
 
 class BedrockResponse(BaseResponse):
 
+    # `input_tokens` and `output_tokens` reported by Bedrock, when available
+    usage: Optional[dict] = None
+
     def to_json(self):
-        return {
+        data = {
             "response": self.response,
             "rationale": self.rationale,
         }
+        if self.usage:
+            data["usage"] = self.usage
+        return data
@@ -0,0 +1,89 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import json
+import logging
+import time
+
+from bisheng.engines.bedrock.driver import BedrockEngine
+from bisheng.engines.bedrock.response import BedrockResponse
+from bisheng.engines.request_context import current_request_context
+from bisheng.engines.stream_parser import TagStreamParser
+from bisheng.prompting.base_prompt import BasePrompt
+from bisheng.utils.metrics import metrics
+from bisheng.utils.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class BedrockStreamingEngine(BedrockEngine):
+    """A Bedrock engine that streams the generation with `invoke_model_with_response_stream`.
+
+    Content deltas are parsed as they arrive, and the prompt is treated as complete as soon as `</response>` closes:
+    the stream is closed and the response returned without waiting for the rest of the generation. Time to first
+    token is recorded as the `bedrock.time_to_first_token_seconds` metric.
+
+    When the stream is closed early, Bedrock has not reported the output token count yet; it is estimated from the
+    text received so far. The prompt's deadline and cancellation are checked between events, and a stream that goes
+    silent is ended by botocore's read timeout.
+    """
+
+    def invoke(self, prompt: BasePrompt):
+        request_body = self._build_request_body(prompt)
+        reservation = self._rate_limiter.reserve(self._estimate_tokens(prompt)) if self._rate_limiter else None
+
+        response = None
+        try:
+            response = self._stream(request_body)
+        finally:
+            self._record_usage(reservation, response)
+
+        return response
+
+    def _stream(self, request_body: dict) -> BedrockResponse:
+        start = time.perf_counter()
+        stream = self.boto3_client.invoke_model_with_response_stream(
+            body=json.dumps(request_body),
+            contentType='application/json',
+            accept='application/json',
+            modelId=self._model_id,
+            trace=self._trace
+        ).get("body")
+
+        context = current_request_context()
+        parser = TagStreamParser()
+        received_first_token = False
+        generated = []
+        usage = {}
+        try:
+            for event in stream:
+                if context is not None:
+                    context.check()
+                chunk = event.get("chunk")
+                if chunk is None:
+                    continue
+                payload = json.loads(chunk["bytes"])
+                if payload.get("type") == "message_start":
+                    usage.update(payload["message"].get("usage", {}))
+                elif payload.get("type") == "message_delta":
+                    usage.update(payload.get("usage", {}))
+                if payload.get("type") != "content_block_delta" or "text" not in payload.get("delta", {}):
+                    continue
+
+                if not received_first_token:
+                    received_first_token = True
+                    metrics.observe("bedrock.time_to_first_token_seconds", time.perf_counter() - start)
+                generated.append(payload["delta"]["text"])
+                if parser.feed(payload["delta"]["text"]):
+                    logger.debug("Response closed, ending the stream early")
+                    break
+        finally:
+            stream.close()
+        metrics.observe("bedrock.response_seconds", time.perf_counter() - start)
+
+        return BedrockResponse(
+            rationale=parser.get("rationale"),
+            response=parser.get("response"),
+            sources="",
+            usage={"input_tokens": usage.get("input_tokens", 0),
+                   "output_tokens": usage.get("output_tokens", estimate_tokens("".join(generated)))}
+        )
@@ -1,10 +1,22 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
+import asyncio
+import json
+import random
 from abc import ABC
 from typing import Optional
 
+import aiohttp
+import boto3
+from botocore.exceptions import ClientError
+from yarl import URL
+
 from bisheng.engines import BaseEngine
-from bisheng.utils import create_boto3_client
+from bisheng.engines.request_context import current_request_context
+from bisheng.utils import create_boto3_client, sign_request, is_throttling_error, register_throttling_listener
+from bisheng.utils.metrics import metrics
+
+_RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
 
 
 class Boto3Engine(BaseEngine, ABC):
@@ -42,3 +54,91 @@ class Boto3Engine(BaseEngine, ABC):
             max_retry=max_retry,
             retry_mode=retry_mode
         )
+        register_throttling_listener(self.boto3_client, self._on_throttled)
+        # stops botocore from sending (or retrying) a request whose prompt missed its deadline or was cancelled
+        self.boto3_client.meta.events.register("before-send", self._check_request_context)
+        self._aws_profile = aws_profile
+        self._max_retry = max_retry
+        self._credentials = None
+        self._http_session: Optional[aiohttp.ClientSession] = None
+
+    @staticmethod
+    def _on_throttled():
+        metrics.increment("aws.throttled_attempts")
+        context = current_request_context()
+        if context is not None:
+            context.throttled = True
+
+    @staticmethod
+    def _check_request_context(**kwargs):
+        context = current_request_context()
+        if context is not None:
+            context.check()
+
+    async def aclose(self):
+        if self._http_session is not None:
+            await self._http_session.close()
+            self._http_session = None
+        await super().aclose()
+
+    async def _asend(self, operation_name: str, path: str, headers: dict, body: bytes) -> bytes:
+        """
+        Sends a SigV4-signed POST to the client's endpoint on the running event loop and returns the response body.
+
+        Throttling and server errors are retried with jittered exponential backoff up to `max_retry` attempts, like
+        botocore does for the synchronous client, without sleeping past the prompt's deadline. Other errors are raised
+        as a botocore `ClientError`.
+
+        Args:
+            operation_name (str): The API operation, used in error messages (e.g. `"InvokeModel"`).
+            path (str): The URL path, already quoted.
+            headers (dict): The request headers.
+            body (bytes): The request body.
+        """
+        if self._credentials is None:
+            session = boto3.Session(profile_name=self._aws_profile, region_name=self.boto3_client.meta.region_name)
+            self._credentials = session.get_credentials()
+        if self._http_session is None:
+            # the runner bounds the prompts in flight, so the connector does not
+            self._http_session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+
+        url = f"{self.boto3_client.meta.endpoint_url}{path}"
+        service_name = self.boto3_client.meta.service_model.signing_name
+        context = current_request_context()
+        attempt = 0
+        while True:
+            if context is not None:
+                context.check()
+            signed_headers = sign_request(self._credentials, service_name, self.boto3_client.meta.region_name,
+                                          "POST", url, headers, body)
+            timeout = aiohttp.ClientTimeout(total=context.remaining() if context is not None else None)
+            # the path is sent as signed, without aiohttp re-quoting it
+            async with self._http_session.post(URL(url, encoded=True), headers=signed_headers, data=body,
+                                               timeout=timeout) as response:
+                payload = await response.read()
+            if response.status < 300:
+                return payload
+
+            error = self._to_client_error(operation_name, response.status, response.headers, payload)
+            attempt += 1
+            if response.status not in _RETRYABLE_STATUS_CODES or attempt >= self._max_retry:
+                raise error
+            if is_throttling_error(error):
+                self._on_throttled()
+            backoff = random.uniform(0, min(20.0, 2 ** attempt))
+            if context is not None and context.deadline is not None:
+                backoff = min(backoff, context.remaining())
+            await asyncio.sleep(backoff)
+
+    @staticmethod
+    def _to_client_error(operation_name: str, status: int, headers, body: bytes) -> ClientError:
+        headers = {name.lower(): value for name, value in headers.items()}
+        code = headers.get("x-amzn-errortype", "").split(":")[0]
+        try:
+            message = json.loads(body).get("message", "")
+        except ValueError:
+            message = body.decode(errors="replace")
+        return ClientError({
+            "Error": {"Code": code or str(status), "Message": message},
+            "ResponseMetadata": {"HTTPStatusCode": status, "HTTPHeaders": headers},
+        }, operation_name)
@@ -1,12 +1,16 @@
 from pydantic import BaseModel
 from bisheng.engines import BaseEngine
-from bisheng.engines.bedrock import BedrockEngine
+from bisheng.engines.bedrock import BedrockEngine, BedrockConverseEngine, BedrockStreamingEngine
 from bisheng.engines.gaab import GaabStreamingEngine
+from bisheng.engines.router import EngineRouter
 from bisheng.utils import import_class
 
 _DRIVER_MAP = {
     "bedrock": BedrockEngine,
-    "gaab": GaabStreamingEngine
+    "bedrock-streaming": BedrockStreamingEngine,
+    "bedrock-converse": BedrockConverseEngine,
+    "gaab": GaabStreamingEngine,
+    "router": EngineRouter
 }
 
 
@@ -0,0 +1,141 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import concurrent.futures
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from bisheng.engines.base_engine import BaseEngine
+from bisheng.engines.engine_factory import EngineFactory
+from bisheng.utils import is_connection_error
+from bisheng.utils.metrics import MetricsRegistry, metrics as default_metrics
+
+logger = logging.getLogger(__name__)
+
+
+class EnginePool:
+    """A bounded pool of engines shared by the runner's worker threads.
+
+    Engines are created (and warmed) at most `size` times for the whole run and handed out with `checkout`, so the
+    cost of building boto3 sessions, authenticating and opening websockets is paid once per worker instead of once per
+    prompt. An engine whose connection failed is closed and replaced on the next checkout; other errors, such as
+    throttling, missed deadlines or unparsable responses, leave it in the pool.
+
+    Attributes:
+        size (int): The maximum number of engines alive at once.
+    """
+
+    def __init__(self, engine_factory: EngineFactory, size: int, metrics: MetricsRegistry = default_metrics):
+        self.size = max(size, 1)
+        self._engine_factory = engine_factory
+        self._metrics = metrics
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._engines: list[BaseEngine] = []
+        self._used: set[int] = set()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def warm(self):
+        """
+        Creates and warms every engine in the pool concurrently, before the first prompt is dispatched.
+
+        :return:
+        """
+        with self._lock:
+            missing = self.size - len(self._engines)
+        if missing <= 0:
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=missing) as executor:
+            futures = [executor.submit(self._create) for _ in range(missing)]
+            for future in concurrent.futures.as_completed(futures):
+                self._idle.put(future.result())
+
+    @contextmanager
+    def checkout(self):
+        """
+        Borrows an engine for the duration of the `with` block, creating one if the pool is not full yet.
+
+        :return:
+        """
+        engine = self._acquire()
+        broken = False
+        try:
+            yield engine
+        except Exception as e:
+            broken = is_connection_error(e)
+            raise
+        finally:
+            if broken:
+                self._discard(engine)
+            else:
+                self._release(engine)
+
+    def close(self):
+        """
+        Closes every engine created by the pool.
+
+        :return:
+        """
+        with self._lock:
+            engines, self._engines = self._engines, []
+            self._used.clear()
+        while not self._idle.empty():
+            self._idle.get_nowait()
+        for engine in engines:
+            self._close(engine)
+
+    def _acquire(self) -> BaseEngine:
+        self._slots.acquire()
+        try:
+            engine = self._idle.get_nowait()
+        except queue.Empty:
+            try:
+                engine = self._create()
+            except Exception:
+                self._slots.release()
+                raise
+
+        with self._lock:
+            if id(engine) in self._used:
+                self._metrics.increment("engine_pool.reused")
+            else:
+                self._used.add(id(engine))
+        return engine
+
+    def _release(self, engine: BaseEngine):
+        self._idle.put(engine)
+        self._slots.release()
+
+    def _create(self) -> BaseEngine:
+        start = time.perf_counter()
+        engine = self._engine_factory.create()
+        engine.warm()
+        self._metrics.observe("engine_pool.setup_seconds", time.perf_counter() - start)
+        self._metrics.increment("engine_pool.created")
+        with self._lock:
+            self._engines.append(engine)
+        return engine
+
+    def _discard(self, engine: BaseEngine):
+        with self._lock:
+            if engine in self._engines:
+                self._engines.remove(engine)
+            self._used.discard(id(engine))
+        self._slots.release()
+        self._close(engine)
+
+    @staticmethod
+    def _close(engine: BaseEngine):
+        try:
+            engine.close()
+        except Exception as e:
+            logger.debug(f"Failed to close engine: {e}")
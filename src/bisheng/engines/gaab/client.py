@@ -0,0 +1,441 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import asyncio
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+import websocket
+import websockets
+
+from bisheng.engines.gaab.stream_parser import GaabStreamParser
+from bisheng.engines.request_context import current_request_context
+from bisheng.utils import CognitoTokenProvider
+
+logger = logging.getLogger(__name__)
+
+_STOP_TOKEN = '##END_CONVERSATION##'
+_CONVERSATION_ID_KEY = 'conversationId'
+# longest wait for a free slot between checks of the prompt's deadline and cancellation
+_SLOT_WAIT_STEP_SECONDS = 0.5
+
+
+class GaabRequest:
+    """A prompt in flight on a GAAB websocket connection.
+
+    Frames received for the request's conversation are parsed as they arrive; `future` completes with the request
+    itself once the stop token arrives, or with an exception if the connection drops first.
+
+    Attributes:
+        conversation_id (str): The id used to route response frames back to this request.
+        parser (GaabStreamParser): The response parsed from the frames received so far, excluding the stop token.
+        future (Future): Resolved when the response is complete.
+        last_activity (float): The `time.monotonic()` time the request was sent or last received a frame.
+    """
+
+    def __init__(self, conversation_id: str):
+        self.conversation_id = conversation_id
+        self.parser = GaabStreamParser()
+        self.future: concurrent.futures.Future = concurrent.futures.Future()
+        self.last_activity = time.monotonic()
+
+    def on_frame(self, frame: dict):
+        self.last_activity = time.monotonic()
+        if frame.get("data") == _STOP_TOKEN:
+            self.future.set_result(self)
+        else:
+            self.parser.feed(frame)
+
+    def wait(self, timeout: Optional[float] = None) -> "GaabRequest":
+        return self.future.result(timeout)
+
+    def cancel(self, error: Exception):
+        """
+        Abandons the request: its slot on the connection is freed and frames still arriving for it are dropped.
+
+        :param error: The exception the request's future completes with.
+        :return:
+        """
+        try:
+            self.future.set_exception(error)
+        except concurrent.futures.InvalidStateError:
+            # the response completed in the meantime
+            pass
+
+
+class _RequestRouter:
+    """Tracks the requests in flight on one connection and routes incoming frames to them by conversation id."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests: dict[str, GaabRequest] = {}
+
+    def _register(self) -> GaabRequest:
+        request = GaabRequest(str(uuid.uuid4()))
+        with self._lock:
+            self._requests[request.conversation_id] = request
+        request.future.add_done_callback(lambda _: self._forget(request))
+        return request
+
+    def _forget(self, request: GaabRequest):
+        with self._lock:
+            self._requests.pop(request.conversation_id, None)
+
+    def _route(self, frame: dict) -> list[GaabRequest]:
+        """
+        Returns the request a frame belongs to, or every request in flight if the frame cannot be attributed.
+
+        A frame carrying a conversation id that is no longer registered (e.g. a late frame of a request abandoned and
+        resent after a stall) belongs to no request. A frame without a conversation id belongs to the only request in
+        flight; with several in flight it cannot be attributed.
+
+        :param frame:
+        :return:
+        """
+        with self._lock:
+            if _CONVERSATION_ID_KEY in frame:
+                request = self._requests.get(frame[_CONVERSATION_ID_KEY])
+                return [] if request is None else [request]
+            return list(self._requests.values())
+
+    def _dispatch(self, message: str):
+        frame = json.loads(message)
+        requests = self._route(frame)
+        if not requests:
+            logger.debug(f"Dropping GAAB frame with no matching request: {message}")
+        elif len(requests) > 1:
+            logger.warning("Received a GAAB frame without a conversation id while several requests were in flight; "
+                           "set max_in_flight_per_connection to 1 for this deployment.")
+            # the frame could belong to any of them, so none of their responses can be trusted
+            error = ConnectionError("Received a GAAB frame without a conversation id while several requests were in "
+                                    "flight on the connection")
+            for request in requests:
+                request.cancel(error)
+        elif not requests[0].future.done():
+            requests[0].on_frame(frame)
+
+    def _fail_all(self, error: Exception):
+        with self._lock:
+            requests, self._requests = list(self._requests.values()), {}
+        for request in requests:
+            if not request.future.done():
+                request.future.set_exception(error)
+
+
+class GaabConnection(_RequestRouter):
+    """A single websocket connection that multiplexes several in-flight requests.
+
+    Each request is sent with its own conversation id, and incoming frames are routed to the matching request by the
+    `conversationId` echoed by GAAB. The connection reconnects lazily on the next send if the socket was closed.
+    """
+
+    def __init__(self, url_factory: Callable[[], str], connect_timeout: float):
+        super().__init__()
+        self._url_factory = url_factory
+        self._connect_timeout = connect_timeout
+        self._ws: Optional[websocket.WebSocketApp] = None
+        self._connected = threading.Event()
+
+    def connect(self):
+        with self._lock:
+            if self._ws is not None:
+                return
+            self._connected.clear()
+            self._ws = websocket.WebSocketApp(self._url_factory(),
+                                              on_open=self._on_open,
+                                              on_message=self._on_message,
+                                              on_error=self._on_error,
+                                              on_close=self._on_close)
+            thread = threading.Thread(target=self._ws.run_forever, daemon=True)
+            thread.start()
+
+    def wait_for_connection(self, timeout: Optional[float] = None) -> bool:
+        return self._connected.wait(timeout)
+
+    def send(self, request_body: dict) -> GaabRequest:
+        self.connect()
+        if not self.wait_for_connection(self._connect_timeout):
+            raise ConnectionError("Timed out waiting for the GAAB websocket connection to open")
+
+        request = self._register()
+        try:
+            self._ws.send(json.dumps({**request_body, _CONVERSATION_ID_KEY: request.conversation_id}))
+        except Exception as e:
+            request.future.set_exception(e)
+        logger.debug(f"Sent request for conversation {request.conversation_id}")
+        return request
+
+    def close(self):
+        with self._lock:
+            ws, self._ws = self._ws, None
+        if ws is not None:
+            ws.close()
+        self._fail_all(ConnectionError("GAAB websocket connection closed"))
+
+    def _on_open(self, ws):
+        logger.debug("WebSocket connection opened")
+        self._connected.set()
+
+    def _on_message(self, ws, message):
+        self._dispatch(message)
+
+    def _on_error(self, ws, error):
+        logger.error(f"WebSocket error: {error}")
+
+    def _on_close(self, ws, close_status_code, close_msg):
+        logger.debug(f"WebSocket connection closed with code {close_status_code}: {close_msg}")
+        with self._lock:
+            if self._ws is ws:
+                self._ws = None
+            self._connected.clear()
+        self._fail_all(ConnectionError(f"GAAB websocket connection closed ({close_status_code}): {close_msg}"))
+
+
+class GaabClient:
+    """A small pool of multiplexed GAAB websocket connections shared by every engine in the process.
+
+    Requests are spread over `num_connections` sockets, each carrying at most `max_in_flight_per_connection` prompts
+    at a time. Callers block in `send` when every connection is full, until a slot frees up or their prompt is
+    cancelled or misses its deadline. Engines share one client per websocket URL
+    and user through `get_instance`, and the sockets are closed once the last engine releases it.
+    """
+
+    _instances: dict[tuple, "GaabClient"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(
+        self,
+        ws_url: str,
+        token_provider: CognitoTokenProvider,
+        num_connections: int,
+        max_in_flight_per_connection: int,
+        connect_timeout: float,
+    ):
+        self.ws_url = ws_url
+        self._token_provider = token_provider
+        self._connections = [
+            GaabConnection(self._build_url, connect_timeout)
+            for _ in range(max(num_connections, 1))
+        ]
+        self._lock = threading.Lock()
+        self._load = {connection: 0 for connection in self._connections}
+        self._slots = threading.BoundedSemaphore(len(self._connections) * max(max_in_flight_per_connection, 1))
+        self._num_references = 0
+
+    @classmethod
+    def get_instance(
+        cls,
+        ws_url: str,
+        token_provider: CognitoTokenProvider,
+        num_connections: int,
+        max_in_flight_per_connection: int,
+        connect_timeout: float,
+    ) -> "GaabClient":
+        """
+        Returns the shared client for the given URL and token provider and registers the caller as a user of it.
+
+        Every call must be balanced by a call to `release`.
+
+        :param ws_url:
+        :param token_provider:
+        :param num_connections:
+        :param max_in_flight_per_connection:
+        :param connect_timeout:
+        :return:
+        """
+        key = (ws_url, id(token_provider))
+        with cls._instances_lock:
+            if key not in cls._instances:
+                cls._instances[key] = cls(ws_url, token_provider, num_connections, max_in_flight_per_connection,
+                                          connect_timeout)
+            client = cls._instances[key]
+            client._num_references += 1
+            return client
+
+    def release(self):
+        with GaabClient._instances_lock:
+            self._num_references -= 1
+            if self._num_references > 0:
+                return
+            for key, client in list(GaabClient._instances.items()):
+                if client is self:
+                    del GaabClient._instances[key]
+        self.close()
+
+    def connect(self):
+        for connection in self._connections:
+            connection.connect()
+
+    def wait_for_connection(self, timeout: Optional[float] = None) -> bool:
+        return all(connection.wait_for_connection(timeout) for connection in self._connections)
+
+    def send(self, request_body: dict) -> GaabRequest:
+        """
+        Sends a request on the least loaded connection and returns its in-flight handle.
+
+        :param request_body:
+        :return:
+        """
+        self._acquire_slot()
+        with self._lock:
+            connection = min(self._connections, key=lambda c: self._load[c])
+            self._load[connection] += 1
+        try:
+            request = connection.send(request_body)
+        except Exception:
+            self._done(connection)
+            raise
+        request.future.add_done_callback(lambda _: self._done(connection))
+        return request
+
+    def close(self):
+        for connection in self._connections:
+            connection.close()
+
+    def _acquire_slot(self):
+        context = current_request_context()
+        if context is None:
+            self._slots.acquire()
+            return
+        while True:
+            context.check()
+            step = _SLOT_WAIT_STEP_SECONDS if context.deadline is None else min(_SLOT_WAIT_STEP_SECONDS,
+                                                                                context.remaining())
+            if self._slots.acquire(timeout=step):
+                return
+
+    def _done(self, connection: GaabConnection):
+        with self._lock:
+            self._load[connection] -= 1
+        self._slots.release()
+
+    def _build_url(self) -> str:
+        return f"{self.ws_url}?Authorization={self._token_provider.get_token()}"
+
+
+class AsyncGaabConnection(_RequestRouter):
+    """The asyncio counterpart of `GaabConnection`, built on the `websockets` library.
+
+    A reader task routes incoming frames to the requests in flight; it runs on the event loop instead of a dedicated
+    thread.
+    """
+
+    def __init__(self, url_factory: Callable[[], Awaitable[str]], connect_timeout: float):
+        super().__init__()
+        self._url_factory = url_factory
+        self._connect_timeout = connect_timeout
+        self._ws = None
+        self._reader: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
+
+    async def connect(self):
+        async with self._connect_lock:
+            if self._ws is not None:
+                return
+            url = await self._url_factory()
+            self._ws = await asyncio.wait_for(websockets.connect(url), self._connect_timeout)
+            self._reader = asyncio.create_task(self._read(self._ws))
+
+    async def send(self, request_body: dict) -> GaabRequest:
+        await self.connect()
+        request = self._register()
+        try:
+            await self._ws.send(json.dumps({**request_body, _CONVERSATION_ID_KEY: request.conversation_id}))
+        except Exception as e:
+            request.future.set_exception(e)
+        logger.debug(f"Sent request for conversation {request.conversation_id}")
+        return request
+
+    async def close(self):
+        ws, self._ws = self._ws, None
+        if ws is not None:
+            await ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+            self._reader = None
+        self._fail_all(ConnectionError("GAAB websocket connection closed"))
+
+    async def _read(self, ws):
+        error = ConnectionError("GAAB websocket connection closed")
+        try:
+            async for message in ws:
+                self._dispatch(message)
+        except Exception as e:
+            error = ConnectionError(f"GAAB websocket connection closed: {e}")
+        finally:
+            if self._ws is ws:
+                self._ws = None
+            self._fail_all(error)
+
+
+class AsyncGaabClient:
+    """The asyncio counterpart of `GaabClient`: a few multiplexed connections shared by every prompt of a run.
+
+    At most `max_in_flight_per_connection` prompts are sent on each of the `num_connections` connections; callers
+    wait on a semaphore when all of them are busy, until their prompt is cancelled or misses its deadline.
+    """
+
+    def __init__(
+        self,
+        ws_url: str,
+        token_provider: CognitoTokenProvider,
+        num_connections: int,
+        max_in_flight_per_connection: int,
+        connect_timeout: float,
+    ):
+        self.ws_url = ws_url
+        self._token_provider = token_provider
+        self._connections = [
+            AsyncGaabConnection(self._build_url, connect_timeout)
+            for _ in range(max(num_connections, 1))
+        ]
+        self._load = {connection: 0 for connection in self._connections}
+        self._slots = asyncio.Semaphore(len(self._connections) * max(max_in_flight_per_connection, 1))
+
+    async def send(self, request_body: dict) -> GaabRequest:
+        """
+        Sends a request on the least loaded connection and returns its in-flight handle.
+
+        :param request_body:
+        :return:
+        """
+        await self._acquire_slot()
+        connection = min(self._connections, key=lambda c: self._load[c])
+        self._load[connection] += 1
+        try:
+            request = await connection.send(request_body)
+        except BaseException:
+            self._done(connection)
+            raise
+        request.future.add_done_callback(lambda _: self._done(connection))
+        return request
+
+    async def close(self):
+        await asyncio.gather(*(connection.close() for connection in self._connections))
+
+    async def _acquire_slot(self):
+        context = current_request_context()
+        if context is None:
+            await self._slots.acquire()
+            return
+        while True:
+            context.check()
+            step = _SLOT_WAIT_STEP_SECONDS if context.deadline is None else min(_SLOT_WAIT_STEP_SECONDS,
+                                                                                context.remaining())
+            try:
+                await asyncio.wait_for(self._slots.acquire(), step)
+                return
+            except asyncio.TimeoutError:
+                continue
+
+    def _done(self, connection: AsyncGaabConnection):
+        self._load[connection] -= 1
+        self._slots.release()
+
+    async def _build_url(self) -> str:
+        token = await asyncio.to_thread(self._token_provider.get_token)
+        return f"{self.ws_url}?Authorization={token}"
@@ -1,130 +1,156 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
+import concurrent.futures
 import json
-import queue
-import re
-import threading
-
-import websocket
+import logging
+import time
+from typing import Optional
 
+from bisheng.engines.gaab.client import AsyncGaabClient, GaabClient, GaabRequest
 from bisheng.engines.gaab.response import GaabResponse
+from bisheng.engines.request_context import RequestContext, current_request_context
 from bisheng.engines.websocket_engine import WebSocketEngine
 from bisheng.prompting.base_prompt import BasePrompt
+from bisheng.utils import defaults
+from bisheng.utils.exceptions import StreamStalledError
+from bisheng.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
 
 _ACTION_NAME = 'sendMessage'
-_STOP_TOKEN = '##END_CONVERSATION##'
 _CONNECTION_OPEN_TIMEOUT = 5
-
-
-def check_for_specific_message(message):
-    return message["data"] == _STOP_TOKEN
+# How often a waiting prompt checks its deadline, cancellation and stream activity
+_WATCHDOG_INTERVAL = 1.0
 
 
 class GaabStreamingEngine(WebSocketEngine):
 
-    def __init__(self, ws_url: str, **kwargs):
+    def __init__(self,
+                 ws_url: str,
+                 num_connections: int = defaults.GAAB_NUM_CONNECTIONS,
+                 max_in_flight_per_connection: int = defaults.GAAB_MAX_IN_FLIGHT_PER_CONNECTION,
+                 **kwargs):
         super().__init__(**kwargs)
-        self.ws = None
-        self.is_connected = False
-        self.ws_url = f"{ws_url}?Authorization={self.token}"
-        self.message_queue = queue.Queue()
-        self.responses = []
-        self.event = threading.Event()
-        self.is_connected = threading.Event()
+        self.ws_url = ws_url
+        self._num_connections = num_connections
+        self._max_in_flight_per_connection = max_in_flight_per_connection
+        self._async_client: Optional[AsyncGaabClient] = None
+        self.client = GaabClient.get_instance(
+            ws_url=ws_url,
+            token_provider=self.token_provider,
+            num_connections=num_connections,
+            max_in_flight_per_connection=max_in_flight_per_connection,
+            connect_timeout=_CONNECTION_OPEN_TIMEOUT
+        )
+        self._closed = False
 
     def connect(self):
-        self.ws = websocket.WebSocketApp(self.ws_url,
-                                         on_open=self.on_open,
-                                         on_message=self.on_message,
-                                         on_error=self.on_error,
-                                         on_close=self.on_close)
-        wst = threading.Thread(target=self.ws.run_forever)
-        wst.daemon = True
-        wst.start()
-
-    def on_open(self, ws):
-        print("WebSocket connection opened")
-        self.is_connected.wait(_CONNECTION_OPEN_TIMEOUT)
-        self.is_connected.set()
-        # self.send_queued_messages()
-
-    def on_error(self, ws, error):
-        print(f"Error occurred: {error}")
-
-    def on_close(self, ws, close_status_code, close_msg):
-        print(f"WebSocket connection closed with code {close_status_code}")
-        print(f"WebSocket connection closed with message {close_msg}")
-        self.is_connected = False
-
-    def on_message(self, ws, message):
-        print("Received message:", message)
-        if "data" in json.loads(message).keys():
-            message = json.loads(message)
-            if check_for_specific_message(message):
-                self.event.set()
-            else:
-                self.message_queue.put(message["data"])
-        elif "sourceDocument" in json.loads(message).keys():
-            self.message_queue.put(message)
-        elif "generated_question" in json.loads(message).keys():
-            message = json.loads(message)
-            self.message_queue.put(message["generated_question"])
-
-    def wait_for_specific_message(self):
-        self.event.wait()
-        self.event.clear()
-
-    def get_messages(self):
-        messages = []
-        current_word = ""
-
-        while not self.message_queue.empty():
-            token = self.message_queue.get()
-            if isinstance(token, str) and token.startswith(" "):
-                if current_word:
-                    messages.append(current_word)
-                    current_word = ""
-                current_word += token.strip()
-            else:
-                current_word += token
-
-        if current_word:
-            messages.append(current_word)
-
-        return messages
+        self.client.connect()
 
-    def invoke(self, prompt: BasePrompt):
-        request_body = {
+    def wait_for_connection(self, timeout=None):
+        return self.client.wait_for_connection(timeout)
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self.client.release()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+        await super().aclose()
+
+    def _build_request_body(self, prompt: BasePrompt, token: str) -> dict:
+        return {
             "action": _ACTION_NAME,
             "question": prompt.get_instruction_prompt(),
-            "authToken": self.token,
-            "conversationId": "",
+            "authToken": token,
             "promptTemplate": prompt.get_system_prompt() + "\n\n{context}\n\n{history}\n\n{input}",
         }
 
-        if not self.is_connected.is_set():
-            self.wait_for_connection(5)
-        self.ws.send(json.dumps(request_body))
-        print(f"Sent message: {request_body}")
-        rationale_matches, response_matches, source_matches = self.process_response()
+    def invoke(self, prompt: BasePrompt):
+        context = current_request_context() or RequestContext(stall_timeout=defaults.STALL_TIMEOUT_SECONDS)
+        attempt = 0
+        while True:
+            request = self.client.send(self._build_request_body(prompt, self.token))
+            try:
+                while not request.future.done():
+                    try:
+                        request.wait(self._watchdog_timeout(context))
+                    except concurrent.futures.TimeoutError:
+                        self._check_request(request, context)
+                return self.process_response(request.wait())
+            except StreamStalledError as e:
+                attempt = self._on_stalled(attempt, context, e)
+
+    async def ainvoke(self, prompt: BasePrompt):
+        if self._async_client is None:
+            self._async_client = AsyncGaabClient(
+                ws_url=self.ws_url,
+                token_provider=self.token_provider,
+                num_connections=self._num_connections,
+                max_in_flight_per_connection=self._max_in_flight_per_connection,
+                connect_timeout=_CONNECTION_OPEN_TIMEOUT
+            )
+        context = current_request_context() or RequestContext(stall_timeout=defaults.STALL_TIMEOUT_SECONDS)
+        attempt = 0
+        while True:
+            token = await asyncio.to_thread(self.token_provider.get_token)
+            request = await self._async_client.send(self._build_request_body(prompt, token))
+            future = asyncio.wrap_future(request.future)
+            try:
+                while not future.done():
+                    await asyncio.wait({future}, timeout=self._watchdog_timeout(context))
+                    if not future.done():
+                        self._check_request(request, context)
+                return self.process_response(await future)
+            except StreamStalledError as e:
+                attempt = self._on_stalled(attempt, context, e)
+            except asyncio.CancelledError:
+                request.cancel(ConnectionAbortedError("Prompt cancelled"))
+                raise
+
+    @staticmethod
+    def _watchdog_timeout(context: RequestContext) -> float:
+        remaining = context.remaining()
+        return _WATCHDOG_INTERVAL if remaining is None else min(_WATCHDOG_INTERVAL, remaining)
+
+    @staticmethod
+    def _check_request(request: GaabRequest, context: RequestContext):
+        """
+        Abandons the request and raises if the prompt was cancelled, missed its deadline, or its stream stalled.
+
+        :param request:
+        :param context:
+        :return:
+        """
+        try:
+            context.check()
+            idle = time.monotonic() - request.last_activity
+            if context.stall_timeout is not None and idle > context.stall_timeout:
+                raise StreamStalledError(f"No GAAB frames received for {round(idle, 1)}s")
+        except Exception as e:
+            request.cancel(e)
+            raise
+
+    @staticmethod
+    def _on_stalled(attempt: int, context: RequestContext, error: StreamStalledError) -> int:
+        metrics.increment("gaab.stalled_streams")
+        if attempt >= context.stall_retries:
+            raise error
+        logger.warning(f"GAAB stream stalled; resending the prompt (attempt {attempt + 2})")
+        return attempt + 1
+
+    def process_response(self, request: GaabRequest) -> GaabResponse:
+        parser = request.parser
+        logger.debug(f"Conversation {request.conversation_id} finished after {parser.num_tokens} tokens with "
+                     f"{len(parser.source_documents)} source documents")
         return GaabResponse(
-            rationale=rationale_matches[0] if len(rationale_matches) > 0 else "",
-            response=response_matches[0] if len(response_matches) > 0 else "",
-            sources=source_matches[0] if len(source_matches) > 0 else ""
+            rationale=parser.rationale,
+            response=parser.response,
+            sources=json.dumps(parser.source_documents) if parser.source_documents else "",
+            source_documents=parser.source_documents
         )
-
-    def process_response(self):
-        self.wait_for_specific_message()
-        message = (" ".join(self.get_messages()))
-        print(message)
-        rationale_regex = r"<rationale>(.*)</rationale>"
-        response_regex = r"<response>(.*)</response>"
-        source_regex = r"({\"sourceDocument\":.*)INPUT DATA"
-        rationale_matches = re.findall(rationale_regex, message, re.DOTALL)
-        response_matches = re.findall(response_regex, message, re.DOTALL)
-        source_matches = re.findall(source_regex, message, re.DOTALL)
-        return rationale_matches, response_matches, source_matches
-
-    def wait_for_connection(self, timeout=None):
-        return self.is_connected.wait(timeout)
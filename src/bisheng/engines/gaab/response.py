@@ -7,10 +7,13 @@ from bisheng.prompting.base_response import BaseResponse
 class GaabResponse(BaseResponse):
 
     sources: str
+    # the `sourceDocument` payloads streamed by GAAB, as structured data
+    source_documents: list[dict] = []
 
     def to_json(self):
         return {
             "response": self.response,
             "rationale": self.rationale,
             "sources": self.sources,
+            "source_documents": self.source_documents,
         }
@@ -0,0 +1,62 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+from bisheng.engines.stream_parser import TagStreamParser
+
+_DATA_KEY = "data"
+_SOURCE_DOCUMENT_KEY = "sourceDocument"
+_GENERATED_QUESTION_KEY = "generated_question"
+
+
+class GaabStreamParser:
+    """A single-pass parser for the frames of one GAAB response.
+
+    Frames are consumed as they arrive, already decoded by the client. `sourceDocument` payloads are kept as
+    structured data, and token and generated-question frames are fed to a `TagStreamParser` that extracts the
+    `<rationale>` and `<response>` spans. Nothing else of the generation is retained, so memory is bounded by the size
+    of the response and its sources.
+
+    Tokens are joined the way GAAB streams words: a token starting with a space begins a new word, separated from the
+    previous one by a single space.
+
+    Attributes:
+        source_documents (list): The `sourceDocument` payloads, in arrival order.
+        num_tokens (int): The number of token frames received.
+    """
+
+    def __init__(self):
+        self.source_documents: list[dict] = []
+        self.num_tokens = 0
+        self._tags = TagStreamParser()
+        self._has_text = False
+        self._pending_separator = False
+
+    @property
+    def rationale(self) -> str:
+        return self._tags.get("rationale")
+
+    @property
+    def response(self) -> str:
+        return self._tags.get("response")
+
+    def feed(self, frame: dict):
+        if _DATA_KEY in frame:
+            self.num_tokens += 1
+            self._feed_token(frame[_DATA_KEY])
+        elif _SOURCE_DOCUMENT_KEY in frame:
+            self.source_documents.append(frame[_SOURCE_DOCUMENT_KEY])
+        elif _GENERATED_QUESTION_KEY in frame:
+            self._feed_token(frame[_GENERATED_QUESTION_KEY])
+
+    def _feed_token(self, token):
+        token = token if isinstance(token, str) else str(token)
+        if token.startswith(" "):
+            self._pending_separator = self._pending_separator or self._has_text
+            token = token.strip()
+        if not token:
+            return
+
+        if self._pending_separator:
+            token = " " + token
+            self._pending_separator = False
+        self._has_text = True
+        self._tags.feed(token)
@@ -0,0 +1,204 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import asyncio
+import logging
+import threading
+import time
+from typing import Iterator, Optional
+
+from bisheng.engines.request_context import RequestContext, current_request_context
+from bisheng.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# how often a request waiting for its reservation checks whether it was cancelled
+_WAIT_STEP_SECONDS = 0.5
+
+
+class TokenBucket:
+    """A bucket refilled continuously at `rate_per_minute`, holding at most one minute's worth of budget.
+
+    Takes are never refused: the level may go negative, and the caller is told how long to wait until its take is
+    covered. Callers are therefore served in the order they took from the bucket.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self._rate = self.capacity / 60
+        self._level = self.capacity
+        self._updated = time.monotonic()
+
+    def take(self, amount: float) -> float:
+        """
+        Removes `amount` from the bucket and returns the number of seconds until the bucket is no longer in debt.
+
+        :param amount:
+        :return:
+        """
+        self._refill()
+        self._level -= amount
+        return max(0.0, -self._level / self._rate)
+
+    def adjust(self, amount: float):
+        """
+        Gives back (positive) or takes (negative) budget without waiting, e.g. to reconcile an estimate.
+
+        :param amount:
+        :return:
+        """
+        self._refill()
+        self._level = min(self.capacity, self._level + amount)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._level = min(self.capacity, self._level + (now - self._updated) * self._rate)
+        self._updated = now
+
+
+class Reservation:
+    """The budget charged for one request, returned by `RateLimiter.reserve` and passed back to `reconcile`.
+
+    Attributes:
+        tokens (int): The tokens charged up front (estimated input tokens plus `max_tokens`).
+    """
+
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+
+
+class RateLimiter:
+    """Paces requests to stay within a model's requests-per-minute and tokens-per-minute quotas.
+
+    Each request reserves one request and its worst-case token count before it is sent, waiting if either bucket is
+    in debt. Once the response arrives the reservation is reconciled with the tokens actually used, so that the
+    unused part of `max_tokens` is returned to the budget. Engines share one limiter per model through
+    `get_instance`, since the quotas apply to the account as a whole.
+    """
+
+    _instances: dict[str, "RateLimiter"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, requests_per_minute: Optional[int] = None, tokens_per_minute: Optional[int] = None):
+        self._lock = threading.Lock()
+        self._requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    @classmethod
+    def get_instance(
+        cls,
+        model_id: str,
+        requests_per_minute: Optional[int] = None,
+        tokens_per_minute: Optional[int] = None,
+    ) -> "RateLimiter":
+        """
+        Returns the shared limiter for the model, creating it with the given budgets on first use.
+
+        :param model_id:
+        :param requests_per_minute:
+        :param tokens_per_minute:
+        :return:
+        """
+        with cls._instances_lock:
+            if model_id not in cls._instances:
+                cls._instances[model_id] = cls(requests_per_minute, tokens_per_minute)
+            return cls._instances[model_id]
+
+    def reserve(self, tokens: int) -> Reservation:
+        """
+        Blocks until a request of `tokens` tokens fits within the budgets, and charges it.
+
+        The wait stops early, and the reservation is given back, if the prompt's request context is cancelled or
+        reaches its deadline.
+
+        :param tokens:
+        :return:
+        """
+        reservation, wait = self._take(tokens)
+        try:
+            for step in self._wait_steps(wait, current_request_context()):
+                time.sleep(step)
+        except BaseException:
+            self._release(reservation)
+            raise
+        return reservation
+
+    async def areserve(self, tokens: int) -> Reservation:
+        """
+        The asyncio counterpart of `reserve`.
+
+        :param tokens:
+        :return:
+        """
+        reservation, wait = self._take(tokens)
+        try:
+            for step in self._wait_steps(wait, current_request_context()):
+                await asyncio.sleep(step)
+        except BaseException:
+            self._release(reservation)
+            raise
+        return reservation
+
+    @staticmethod
+    def _wait_steps(wait: float, context: Optional[RequestContext]) -> Iterator[float]:
+        """
+        Yields the sleeps making up a wait of WAIT seconds. With a request context the wait is cut into steps of at
+        most `_WAIT_STEP_SECONDS`, ending at the context's deadline, and the context is checked before each step, so
+        that a cancelled or late prompt stops waiting.
+
+        :param wait:
+        :param context:
+        :return:
+        """
+        if wait <= 0:
+            return
+        if context is None:
+            yield wait
+            return
+        ready_at = time.monotonic() + wait
+        while (left := ready_at - time.monotonic()) > 0:
+            context.check()
+            step = min(left, _WAIT_STEP_SECONDS)
+            if context.deadline is not None:
+                # a step ending at the deadline is followed by a check that raises
+                step = min(step, context.remaining())
+            yield step
+
+    def reconcile(self, reservation: Reservation, used_tokens: int):
+        """
+        Replaces the tokens charged for a request with the tokens it actually used.
+
+        :param reservation:
+        :param used_tokens:
+        :return:
+        """
+        if self._tokens is None:
+            return
+        with self._lock:
+            self._tokens.adjust(reservation.tokens - used_tokens)
+
+    def _release(self, reservation: Reservation):
+        """
+        Gives back the budget charged for a request that was not sent.
+
+        :param reservation:
+        :return:
+        """
+        with self._lock:
+            if self._requests is not None:
+                self._requests.adjust(1)
+            if self._tokens is not None:
+                self._tokens.adjust(reservation.tokens)
+
+    def _take(self, tokens: int) -> tuple[Reservation, float]:
+        with self._lock:
+            wait = 0.0
+            if self._requests is not None:
+                wait = max(wait, self._requests.take(1))
+            if self._tokens is not None:
+                if tokens > self._tokens.capacity:
+                    logger.warning(f"A request reserving {tokens} tokens exceeds the budget of "
+                                   f"{int(self._tokens.capacity)} tokens per minute; lower max_tokens.")
+                wait = max(wait, self._tokens.take(tokens))
+        if wait > 0:
+            metrics.observe("rate_limiter.wait_seconds", wait)
+        return Reservation(tokens), wait
@@ -0,0 +1,82 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from bisheng.utils.exceptions import PromptCancelledError, PromptTimeoutError
+
+
+class RequestContext:
+    """Per-prompt state shared between the runner and the engine serving the prompt.
+
+    The runner opens a context around each invocation; engines and the AWS helpers record what they observe in it
+    (e.g. a throttled attempt that botocore retried transparently) without changing the `invoke` signature. The
+    runner also sets the prompt's policy in it: a deadline, a stall timeout for streamed responses, and a
+    cancellation flag that engines check while they wait.
+
+    Attributes:
+        throttled (bool): Whether any attempt for the prompt was throttled, even if a retry later succeeded.
+        deadline (Optional[float]): The `time.monotonic()` time by which the prompt must finish.
+        stall_timeout (Optional[float]): Seconds without a token after which a stream is considered hung.
+        stall_retries (int): How many times a hung stream is resent before the prompt fails.
+    """
+
+    def __init__(
+        self,
+        deadline: Optional[float] = None,
+        stall_timeout: Optional[float] = None,
+        stall_retries: int = 0,
+    ):
+        self.throttled = False
+        self.deadline = deadline
+        self.stall_timeout = stall_timeout
+        self.stall_retries = stall_retries
+        self._cancelled = threading.Event()
+        self._cancel_reason = ""
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self, reason: str):
+        self._cancel_reason = reason
+        self._cancelled.set()
+
+    def remaining(self) -> Optional[float]:
+        """
+        Returns the seconds left before the deadline (at least 0), or None without a deadline.
+
+        :return:
+        """
+        return None if self.deadline is None else max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        """
+        Raises if the prompt was cancelled or missed its deadline. Engines call this at safe points.
+
+        :return:
+        """
+        if self.cancelled:
+            raise PromptCancelledError(self._cancel_reason)
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            raise PromptTimeoutError("Prompt missed its deadline")
+
+
+_current_context: ContextVar[Optional[RequestContext]] = ContextVar("bisheng_request_context", default=None)
+
+
+def current_request_context() -> Optional[RequestContext]:
+    return _current_context.get()
+
+
+@contextmanager
+def request_context(context: Optional[RequestContext] = None):
+    context = context or RequestContext()
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
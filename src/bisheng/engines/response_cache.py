@@ -0,0 +1,137 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+from bisheng.prompting.base_prompt import BasePrompt
+from bisheng.prompting.base_response import BaseResponse, dump_response, load_response
+from bisheng.utils.hashing import hash_request
+from bisheng.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseCache:
+    """A persistent, content-addressed cache of engine responses stored in a local SQLite database.
+
+    Responses are keyed by a hash of the full request: the engine configuration that affects generation (engine type,
+    model, hyperparameters, ...), the system prompt and the instruction. Rerunning a deck therefore only invokes the
+    engine for prompts whose request changed. Entries older than `max_age_seconds` are dropped, and least recently
+    used entries are evicted once the cache grows beyond `max_size_bytes`.
+
+    With `refresh`, lookups always miss but responses are still stored, which regenerates every prompt and replaces
+    the cached responses.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        engine_config: dict,
+        max_size_bytes: int,
+        max_age_seconds: float,
+        refresh: bool = False,
+    ):
+        self.path = os.path.expanduser(path)
+        self._engine_config = engine_config
+        self._max_size_bytes = max_size_bytes
+        self._max_age_seconds = max_age_seconds
+        self._refresh = refresh
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, response_type TEXT NOT NULL, body TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def key(self, prompt: BasePrompt) -> str:
+        return hash_request(self._engine_config, prompt.get_system_prompt(), prompt.get_instruction_prompt())
+
+    def get(self, prompt: BasePrompt) -> Optional[BaseResponse]:
+        """
+        Returns the cached response for the prompt, or None on a miss.
+
+        :param prompt:
+        :return:
+        """
+        if self._refresh:
+            metrics.increment("cache.misses")
+            return None
+
+        key = self.key(prompt)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response_type, body FROM responses WHERE key = ? AND created_at >= ?",
+                (key, now - self._max_age_seconds)
+            ).fetchone()
+            if row is not None:
+                self._connection.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+                self._connection.commit()
+
+        response = load_response(*row) if row is not None else None
+        metrics.increment("cache.hits" if response is not None else "cache.misses")
+        return response
+
+    def put(self, prompt: BasePrompt, response: BaseResponse):
+        """
+        Stores the response for the prompt, replacing any previous entry.
+
+        :param prompt:
+        :param response:
+        :return:
+        """
+        response_type, body = dump_response(response)
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response_type, body, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (self.key(prompt), response_type, body, len(body), now, now)
+            )
+            self._connection.commit()
+
+    def evict(self):
+        """
+        Drops expired entries, then the least recently used entries until the cache fits in its size budget.
+
+        :return:
+        """
+        with self._lock:
+            expired = self._connection.execute(
+                "DELETE FROM responses WHERE created_at < ?", (time.time() - self._max_age_seconds,)
+            ).rowcount
+            total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            evicted = 0
+            if total_size > self._max_size_bytes:
+                rows = self._connection.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+                keys = []
+                for key, size in rows:
+                    if total_size <= self._max_size_bytes:
+                        break
+                    keys.append((key,))
+                    total_size -= size
+                self._connection.executemany("DELETE FROM responses WHERE key = ?", keys)
+                evicted = len(keys)
+            self._connection.commit()
+        if expired or evicted:
+            logger.debug(f"Evicted {expired} expired and {evicted} least recently used cached responses")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
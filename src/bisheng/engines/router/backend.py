@@ -0,0 +1,177 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import logging
+import threading
+import time
+from typing import Optional
+
+from bisheng.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Weight of the latest observation in the moving averages of latency and errors
+_EWMA_ALPHA = 0.3
+
+
+class CircuitBreaker:
+    """Stops sending requests to a backend that keeps failing.
+
+    The circuit opens after `failure_threshold` consecutive failures. While open the backend is skipped; after
+    `recovery_seconds` a single trial request is let through (half-open). The circuit closes again if the trial
+    succeeds, and reopens for another `recovery_seconds` if it fails.
+    """
+
+    def __init__(self, failure_threshold: int, recovery_seconds: float):
+        self._failure_threshold = max(failure_threshold, 1)
+        self._recovery_seconds = recovery_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allows(self) -> bool:
+        if self._opened_at is None:
+            return True
+        return not self._trial_in_flight and time.monotonic() - self._opened_at >= self._recovery_seconds
+
+    def on_dispatch(self):
+        if self._opened_at is not None:
+            self._trial_in_flight = True
+
+    def on_cancel(self):
+        self._trial_in_flight = False
+
+    def on_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def on_failure(self) -> bool:
+        """
+        Records a failed request and returns True if it opened (or reopened) the circuit.
+
+        :return:
+        """
+        self._failures += 1
+        if self._opened_at is not None or self._failures >= self._failure_threshold:
+            self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+            return True
+        return False
+
+
+class RouterBackend:
+    """The live state of one backend of an engine router: its load, latency and error statistics and its circuit.
+
+    Every worker has its own router (and its own engine for each backend), but the state of a backend is shared by
+    all of them through `get_instance`, so that the load, the quota and the circuit apply to the backend as a whole.
+    Methods are thread-safe; the caller holds no lock.
+
+    Attributes:
+        name (str): The name of the backend in logs and metrics.
+        weight (float): The relative share of prompts the backend receives at equal latency.
+        max_in_flight (Optional[int]): The most prompts in flight on the backend at once, or None without a quota.
+        latency (Optional[float]): The moving average of the latency of successful requests, in seconds.
+        error_rate (float): The moving average of the fraction of failed requests.
+        in_flight (int): The number of prompts in flight on the backend.
+    """
+
+    _instances: dict[str, "RouterBackend"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(
+        self,
+        name: str,
+        weight: float = 1.0,
+        max_in_flight: Optional[int] = None,
+        failure_threshold: int = 5,
+        recovery_seconds: float = 30.0,
+    ):
+        self.name = name
+        self.weight = weight
+        self.max_in_flight = max_in_flight
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self._breaker = CircuitBreaker(failure_threshold, recovery_seconds)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls, name: str, **kwargs) -> "RouterBackend":
+        """
+        Returns the shared state of the backend, creating it with the given settings on first use.
+
+        :param name:
+        :param kwargs:
+        :return:
+        """
+        with cls._instances_lock:
+            if name not in cls._instances:
+                cls._instances[name] = cls(name, **kwargs)
+            return cls._instances[name]
+
+    @property
+    def available(self) -> bool:
+        """Whether the circuit lets a request through, regardless of the quota."""
+        with self._lock:
+            return self._breaker.allows()
+
+    def score(self, default_latency: float) -> float:
+        """
+        Returns the expected cost of sending the next prompt to the backend; the router picks the lowest.
+
+        The latency is scaled by the prompts already in flight, divided by the weight and inflated by the error rate.
+        A backend without latency observations yet is assumed to be as fast as DEFAULT_LATENCY.
+
+        :param default_latency:
+        :return:
+        """
+        with self._lock:
+            latency = self.latency if self.latency is not None else default_latency
+            return latency * (self.in_flight + 1) / self.weight / max(1.0 - self.error_rate, 0.1)
+
+    def try_acquire(self) -> bool:
+        """
+        Claims a slot on the backend, or returns False if its circuit is open or its quota is used up.
+
+        :return:
+        """
+        with self._lock:
+            if not self._breaker.allows():
+                return False
+            if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+                return False
+            self._breaker.on_dispatch()
+            self.in_flight += 1
+            return True
+
+    def release(self, latency: Optional[float], failed: bool):
+        """
+        Frees the slot claimed by `try_acquire` and records the outcome of the request.
+
+        :param latency: The duration of the request in seconds, or None if it was cancelled.
+        :param failed: Whether the request failed.
+        :return:
+        """
+        with self._lock:
+            self.in_flight -= 1
+            if latency is None:
+                # a cancelled request says nothing about the backend, but may have been the circuit's trial
+                self._breaker.on_cancel()
+                return
+            self.error_rate += _EWMA_ALPHA * ((1.0 if failed else 0.0) - self.error_rate)
+            if failed:
+                opened = self._breaker.on_failure()
+            else:
+                opened = False
+                self.latency = latency if self.latency is None else self.latency + _EWMA_ALPHA * (
+                    latency - self.latency)
+                self._breaker.on_success()
+
+        metrics.increment(f"router.{self.name}.{'failures' if failed else 'requests'}")
+        if opened:
+            metrics.increment("router.circuit_opened")
+            logger.warning(f"Backend {self.name} keeps failing; skipping it for a while")
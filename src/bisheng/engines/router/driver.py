@@ -0,0 +1,160 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from bisheng.engines.base_engine import BaseEngine
+from bisheng.engines.request_context import current_request_context
+from bisheng.engines.router.backend import RouterBackend
+from bisheng.prompting.base_prompt import BasePrompt
+from bisheng.prompting.base_response import BaseResponse
+from bisheng.utils import defaults
+from bisheng.utils.exceptions import PromptCancelledError, PromptTimeoutError, StreamStalledError
+from bisheng.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Router settings of a backend entry; the other keys configure the backend's engine
+_ROUTING_KEYS = {"name", "weight", "max_in_flight"}
+# How often a prompt waiting for a backend below its quota checks again
+_CAPACITY_POLL_INTERVAL = 0.05
+
+
+class EngineRouter(BaseEngine):
+    """An engine spreading prompts over several backend engines (e.g. regions or models), with failover.
+
+    Each prompt goes to the available backend with the lowest expected cost: its moving average latency scaled by the
+    prompts it already has in flight, divided by its weight and inflated by its error rate. A backend at its
+    `max_in_flight` quota is skipped, and prompts wait when every backend is at its quota. A backend that keeps
+    failing is skipped by a circuit breaker until it recovers. A prompt whose request fails is sent to the next best
+    backend it has not tried yet, and the last error is raised once every backend failed or is unavailable.
+
+    Attributes:
+        backends (list[RouterBackend]): The shared state of each backend, in configuration order.
+    """
+
+    def __init__(
+        self,
+        backends: list[dict],
+        failure_threshold: int = defaults.ROUTER_FAILURE_THRESHOLD,
+        recovery_seconds: float = defaults.ROUTER_RECOVERY_SECONDS,
+    ):
+        """
+        Initialize the router and the engine of each backend.
+
+        Args:
+            backends (list[dict]): The engine block of each backend, with optional `name`, `weight` and
+                `max_in_flight` keys.
+            failure_threshold (int): Consecutive failures after which a backend's circuit opens.
+            recovery_seconds (float): How long an open circuit skips its backend before a trial request.
+        """
+        # imported here since the factory maps the "router" type to this class
+        from bisheng.engines.engine_factory import EngineFactory
+
+        if not backends:
+            raise ValueError("An engine router needs at least one backend")
+        self.backends: list[RouterBackend] = []
+        self._engines: dict[str, BaseEngine] = {}
+        for config in backends:
+            name = config.get("name") or self._default_name(config)
+            self.backends.append(RouterBackend.get_instance(
+                name,
+                weight=config.get("weight", 1.0),
+                max_in_flight=config.get("max_in_flight"),
+                failure_threshold=failure_threshold,
+                recovery_seconds=recovery_seconds,
+            ))
+            self._engines[name] = EngineFactory(
+                config={k: v for k, v in config.items() if k not in _ROUTING_KEYS}).create()
+
+    @staticmethod
+    def _default_name(config: dict) -> str:
+        return "/".join(str(config[key]) for key in ("type", "aws_region", "model_id") if config.get(key))
+
+    def invoke(self, prompt: BasePrompt) -> BaseResponse:
+        tried = set()
+        while True:
+            backend = self._select(tried)
+            while backend is None:
+                time.sleep(_CAPACITY_POLL_INTERVAL)
+                backend = self._select(tried)
+            start = time.monotonic()
+            try:
+                response = self._engines[backend.name].invoke(prompt)
+            except Exception as e:
+                self._on_failed(backend, tried, start, e)
+                continue
+            backend.release(time.monotonic() - start, failed=False)
+            return response
+
+    async def ainvoke(self, prompt: BasePrompt) -> BaseResponse:
+        tried = set()
+        while True:
+            backend = self._select(tried)
+            while backend is None:
+                await asyncio.sleep(_CAPACITY_POLL_INTERVAL)
+                backend = self._select(tried)
+            start = time.monotonic()
+            try:
+                response = await self._engines[backend.name].ainvoke(prompt)
+            except asyncio.CancelledError:
+                backend.release(None, failed=False)
+                raise
+            except Exception as e:
+                self._on_failed(backend, tried, start, e)
+                continue
+            backend.release(time.monotonic() - start, failed=False)
+            return response
+
+    def _select(self, tried: set) -> Optional[RouterBackend]:
+        """
+        Claims the best backend not tried yet for the prompt, or returns None if they are all at their quota.
+
+        Raises a `ConnectionError` when no backend can serve the prompt because they were all tried or their circuits
+        are open.
+
+        :param tried: The names of the backends already tried for the prompt.
+        :return:
+        """
+        context = current_request_context()
+        if context is not None:
+            context.check()
+
+        candidates = [backend for backend in self.backends if backend.name not in tried and backend.available]
+        if not candidates:
+            raise ConnectionError(f"No backend available; tried {sorted(tried) or 'none'}")
+
+        latencies = [backend.latency for backend in self.backends if backend.latency is not None]
+        default_latency = sum(latencies) / len(latencies) if latencies else 1.0
+        for backend in sorted(candidates, key=lambda candidate: candidate.score(default_latency)):
+            if backend.try_acquire():
+                return backend
+        return None
+
+    def _on_failed(self, backend: RouterBackend, tried: set, start: float, error: Exception):
+        if (isinstance(error, (PromptCancelledError, PromptTimeoutError))
+                and not isinstance(error, StreamStalledError)):
+            # the prompt was cancelled or missed its deadline, which is no fault of the backend and no other backend
+            # can fix; a stalled stream is the backend's fault
+            backend.release(None, failed=False)
+            raise error
+        backend.release(time.monotonic() - start, failed=True)
+        tried.add(backend.name)
+        if len(tried) == len(self.backends):
+            raise error
+        metrics.increment("router.failovers")
+        logger.info(f"Backend {backend.name} failed ({error!r}); failing over")
+
+    def warm(self):
+        for engine in self._engines.values():
+            engine.warm()
+
+    def close(self):
+        for engine in self._engines.values():
+            engine.close()
+
+    async def aclose(self):
+        for engine in self._engines.values():
+            await engine.aclose()
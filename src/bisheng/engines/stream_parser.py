@@ -0,0 +1,108 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+from typing import Iterable, Optional
+
+_RATIONALE_TAG = "rationale"
+_RESPONSE_TAG = "response"
+
+
+class TagStreamParser:
+    """Incrementally extracts tagged spans (e.g. `<rationale>` and `<response>`) from streamed model output.
+
+    Text is fed in arbitrary deltas; tags split across deltas are handled by carrying over the shortest tail that could
+    still be the start of a tag. Only the contents of the tracked spans are retained, so memory is bounded by the
+    size of the response rather than the whole generation. A span ends at the first matching closing tag, and the
+    parser reports completion as soon as `complete_tag` closes. Like the `<tag>(.*)</tag>` patterns of the
+    non-streaming engines, a span that never closed, e.g. because the generation was cut off, reads as empty.
+    """
+
+    def __init__(self, tags: Iterable[str] = (_RATIONALE_TAG, _RESPONSE_TAG), complete_tag: str = _RESPONSE_TAG):
+        self._open_tags = {f"<{tag}>": tag for tag in tags}
+        self._complete_tag = complete_tag
+        self._spans: dict[str, list[str]] = {}
+        self._closed: set[str] = set()
+        self._current: Optional[str] = None
+        self._pending = ""
+
+    @property
+    def complete(self) -> bool:
+        return self._complete_tag in self._closed
+
+    def feed(self, delta: str) -> bool:
+        """
+        Consumes the next chunk of generated text.
+
+        :param delta:
+        :return: True once the completion tag has closed.
+        """
+        if self.complete:
+            return True
+
+        text = self._pending + delta
+        self._pending = ""
+        position = 0
+        while position < len(text) and not self.complete:
+            if self._current is None:
+                position = self._scan_for_open(text, position)
+            else:
+                position = self._scan_for_close(text, position)
+        return self.complete
+
+    def get(self, tag: str) -> str:
+        """
+        Returns the text of the tag, or an empty string if it never opened or did not close.
+
+        :param tag:
+        :return:
+        """
+        if tag not in self._closed:
+            return ""
+        return "".join(self._spans[tag])
+
+    def _scan_for_open(self, text: str, position: int) -> int:
+        best = None
+        for open_tag, tag in self._open_tags.items():
+            if tag in self._spans:
+                continue
+            index = text.find(open_tag, position)
+            if index >= 0 and (best is None or index < best[0]):
+                best = (index, open_tag, tag)
+
+        if best is None:
+            self._pending = self._partial_tail(text, position, self._open_tags)
+            return len(text)
+
+        index, open_tag, tag = best
+        self._current = tag
+        self._spans[tag] = []
+        return index + len(open_tag)
+
+    def _scan_for_close(self, text: str, position: int) -> int:
+        close_tag = f"</{self._current}>"
+        index = text.find(close_tag, position)
+        if index < 0:
+            tail = self._partial_tail(text, position, [close_tag])
+            self._spans[self._current].append(text[position:len(text) - len(tail)])
+            self._pending = tail
+            return len(text)
+
+        self._spans[self._current].append(text[position:index])
+        self._closed.add(self._current)
+        self._current = None
+        return index + len(close_tag)
+
+    @staticmethod
+    def _partial_tail(text: str, position: int, tags: Iterable[str]) -> str:
+        """
+        Returns the longest suffix of text[position:] that is a proper prefix of one of the tags.
+
+        :param text:
+        :param position:
+        :param tags:
+        :return:
+        """
+        start = max(position, text.rfind("<", position))
+        if start < position or text[start:start + 1] != "<":
+            return ""
+        tail = text[start:]
+        return tail if any(tag.startswith(tail) and tag != tail for tag in tags) else ""
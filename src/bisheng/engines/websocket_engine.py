@@ -4,7 +4,9 @@ from abc import ABC, abstractmethod
 from typing import Optional
 
 from bisheng.engines import BaseEngine
-from bisheng.utils import create_boto3_client, generate_cognito_jwt_token
+from bisheng.utils import CognitoTokenProvider
+
+_CONNECTION_TIMEOUT = 2
 
 
 class WebSocketEngine(BaseEngine, ABC):
@@ -20,15 +22,20 @@ class WebSocketEngine(BaseEngine, ABC):
         max_retry: int = 10,
         retry_mode: str = "adaptive"
     ):
-        boto3_client = create_boto3_client(
-            boto3_service_name="cognito-idp",
+        self.token_provider = CognitoTokenProvider.get_instance(
+            app_client_id=app_client_id,
+            user_name=user_name,
+            password=password,
             aws_profile=aws_profile,
             aws_region=aws_region,
             endpoint_url=endpoint_url,
             max_retry=max_retry,
             retry_mode=retry_mode
         )
-        self.token = generate_cognito_jwt_token(boto3_client, app_client_id, user_name, password)
+
+    @property
+    def token(self) -> str:
+        return self.token_provider.get_token()
 
     @abstractmethod
     def connect(self):
@@ -38,18 +45,6 @@ class WebSocketEngine(BaseEngine, ABC):
     def wait_for_connection(self, timeout):
         pass
 
-    @abstractmethod
-    def on_open(self, ws):
-        pass
-
-    @abstractmethod
-    def on_error(self, ws, error):
-        print("WebSocket error:", error)
-
-    @abstractmethod
-    def on_close(self, ws, close_status_code, close_msg):
-        print("WebSocket connection closed")
-
-    @abstractmethod
-    def on_message(self, ws, message):
-        pass
\ No newline at end of file
+    def warm(self):
+        self.connect()
+        self.wait_for_connection(timeout=_CONNECTION_TIMEOUT)
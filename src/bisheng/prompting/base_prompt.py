@@ -11,6 +11,47 @@ class BasePrompt(ABC):
     def get_instruction_prompt(self) -> str:
         pass
 
+    def get_instruction_prefix(self) -> str:
+        """
+        Returns the stable leading part of the instruction (e.g. the shared context), or an empty string.
+
+        :return:
+        """
+        return ""
+
+    def get_instruction_suffix(self) -> str:
+        """
+        Returns the per-prompt part of the instruction, sent after the prefix.
+
+        :return:
+        """
+        return self.get_instruction_prompt()
+
+    def get_output_format(self) -> str:
+        """
+        Returns the output format the instruction asks for (e.g. a word limit), or an empty string.
+
+        :return:
+        """
+        return ""
+
+    def get_dependencies(self) -> list:
+        """
+        Returns the prompts whose generated text this prompt's instruction needs, or an empty list.
+
+        :return:
+        """
+        return []
+
+    def resolve(self, responses: dict):
+        """
+        Completes the instruction with the responses to the prompts it depends on, once they are all generated. Does
+        nothing by default.
+
+        :param responses: The responses generated so far, keyed by prompt.
+        :return:
+        """
+
     @abstractmethod
     def to_json(self):
         pass
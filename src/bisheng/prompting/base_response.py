@@ -1,6 +1,7 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 from abc import ABC, abstractmethod
+from typing import Optional
 
 from pydantic import BaseModel
 
@@ -14,3 +15,42 @@ class BaseResponse(BaseModel, ABC):
     @abstractmethod
     def to_json(self):
         pass
+
+
+def dump_response(response: BaseResponse) -> tuple[str, str]:
+    """
+    Serializes a response to its type name and JSON body, so that it can be stored and loaded by `load_response`.
+
+    :param response:
+    :return:
+    """
+    return _type_name(type(response)), response.model_dump_json()
+
+
+def load_response(response_type: str, body: str) -> Optional[BaseResponse]:
+    """
+    Rebuilds a response serialized by `dump_response`, or returns None if its type is not one of the known response
+    classes. The type name is only looked up, never imported, so that a tampered cache or journal cannot make the
+    tool import arbitrary modules.
+
+    :param response_type:
+    :param body:
+    :return:
+    """
+    response_cls = _known_response_types().get(response_type)
+    if response_cls is None:
+        return None
+    return response_cls.model_validate_json(body)
+
+
+def _known_response_types() -> dict[str, type[BaseResponse]]:
+    # imported here, as the response classes import this module
+    from bisheng.engines.bedrock.response import BedrockResponse
+    from bisheng.engines.gaab.response import GaabResponse
+    from bisheng.prompting.failed_response import FailedResponse
+
+    return {_type_name(cls): cls for cls in (BedrockResponse, GaabResponse, FailedResponse)}
+
+
+def _type_name(response_cls: type[BaseResponse]) -> str:
+    return f"{response_cls.__module__}:{response_cls.__qualname__}"
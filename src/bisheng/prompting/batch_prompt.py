@@ -0,0 +1,75 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import re
+from typing import Optional
+
+from bisheng.prompting.base_prompt import BasePrompt
+from bisheng.prompting.base_response import BaseResponse
+
+_BATCH_INSTRUCTION = (
+    "The following {count} tasks each generate the text of one shape. Complete each task independently, following "
+    "its own INPUT DATA, EXAMPLES and OUTPUT FORMAT. Put your explanation for all tasks within the <rationale> XML "
+    "tags. Within the <response> XML tags, put the text generated for each task in a <shape id=\"...\"> XML tag with "
+    "the id of the task, and nothing else.\n"
+)
+_SHAPE_PATTERN = re.compile(r"<shape id=\"([^\"]+)\">(.*?)</shape>", re.DOTALL)
+
+
+class BatchPrompt(BasePrompt):
+    """Several prompts sharing a system prompt and an instruction prefix, generated in one request.
+
+    The request contains the shared prefix (e.g. the context) once, followed by the per-prompt part of each
+    instruction tagged with its id, and asks for one tagged `<shape>` per id in the response. `split` turns the
+    response back into one response per prompt.
+
+    Attributes:
+        prompts (list[BasePrompt]): The prompts of the batch, in order.
+    """
+
+    def __init__(self, prompts: list[BasePrompt]):
+        self.prompts = prompts
+
+    def get_system_prompt(self) -> str:
+        return self.prompts[0].get_system_prompt()
+
+    def get_instruction_prompt(self) -> str:
+        return self.get_instruction_prefix() + self.get_instruction_suffix()
+
+    def get_instruction_prefix(self) -> str:
+        return self.prompts[0].get_instruction_prefix()
+
+    def get_instruction_suffix(self) -> str:
+        tasks = "".join(f"<task id=\"{index}\">\n{prompt.get_instruction_suffix()}\n</task>\n"
+                        for index, prompt in enumerate(self.prompts, start=1))
+        return _BATCH_INSTRUCTION.format(count=len(self.prompts)) + tasks
+
+    def split(self, response: BaseResponse) -> Optional[dict[BasePrompt, BaseResponse]]:
+        """
+        Splits the response to the batch into the response to each of its prompts, sharing the rationale, or returns
+        None if the response does not contain exactly one text per prompt.
+
+        Token usage, where the response reports it, is kept on the first prompt's response only.
+
+        :param response:
+        :return:
+        """
+        texts = {}
+        for shape_id, text in _SHAPE_PATTERN.findall(response.response):
+            if shape_id in texts:
+                return None
+            texts[shape_id] = text.strip()
+        if set(texts) != {str(index) for index in range(1, len(self.prompts) + 1)}:
+            return None
+
+        responses = {}
+        for index, prompt in enumerate(self.prompts, start=1):
+            update = {"response": texts[str(index)]}
+            if index > 1 and "usage" in type(response).model_fields:
+                update["usage"] = None
+            responses[prompt] = response.model_copy(update=update)
+        return responses
+
+    def to_json(self):
+        return {
+            "batch": [prompt.to_json() for prompt in self.prompts],
+        }
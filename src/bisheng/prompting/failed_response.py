@@ -0,0 +1,23 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+from bisheng.prompting.base_response import BaseResponse
+
+
+class FailedResponse(BaseResponse):
+    """Stands in for the response of a prompt that did not complete, so that it still appears in the report.
+
+    Encoders that write generated text skip failed responses, leaving the shape untouched.
+    """
+
+    rationale: str = ""
+    response: str = ""
+    sources: str = ""
+    # why the prompt did not complete, e.g. `timed_out`
+    outcome: str
+    error: str
+
+    def to_json(self):
+        return {
+            "outcome": self.outcome,
+            "error": self.error,
+        }
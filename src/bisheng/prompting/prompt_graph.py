@@ -0,0 +1,163 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+from typing import Optional
+
+from bisheng.prompting.base_prompt import BasePrompt
+from bisheng.prompting.base_response import BaseResponse
+
+
+def find_cycle(prompts: list[BasePrompt]) -> Optional[list[BasePrompt]]:
+    """
+    Returns a cycle of prompts that depend on each other, each followed by one of its dependencies and ending with
+    the first, or None if the dependencies form a DAG.
+
+    :param prompts:
+    :return:
+    """
+    finished = set()
+    for root in prompts:
+        if root in finished:
+            continue
+        # iterative depth-first search, so that long chains of shapes do not hit the recursion limit
+        path = [root]
+        on_path = {root}
+        stack = [iter(root.get_dependencies())]
+        while stack:
+            dependency = next(stack[-1], None)
+            if dependency is None:
+                stack.pop()
+                finished.add(path[-1])
+                on_path.discard(path.pop())
+            elif dependency in on_path:
+                return path[path.index(dependency):] + [dependency]
+            elif dependency not in finished:
+                path.append(dependency)
+                on_path.add(dependency)
+                stack.append(iter(dependency.get_dependencies()))
+    return None
+
+
+def dependency_order(prompts: list[BasePrompt]) -> list[BasePrompt]:
+    """
+    Returns the prompts ordered so that each comes after the prompts of the list it depends on, directly or not, and
+    otherwise in their order in the list. The dependencies must not form a cycle.
+
+    :param prompts:
+    :return:
+    """
+    included = set(prompts)
+    ordered = {}
+    for root in prompts:
+        if root in ordered:
+            continue
+        # iterative depth-first search, each prompt listed once its dependencies are
+        path = [root]
+        on_path = {root}
+        stack = [iter(root.get_dependencies())]
+        while stack:
+            dependency = next(stack[-1], None)
+            if dependency is None:
+                stack.pop()
+                ordered[path[-1]] = None
+                on_path.discard(path.pop())
+            elif dependency in included and dependency not in ordered and dependency not in on_path:
+                path.append(dependency)
+                on_path.add(dependency)
+                stack.append(iter(dependency.get_dependencies()))
+    return list(ordered)
+
+
+def with_dependencies(prompts: list[BasePrompt], deck: list[BasePrompt]) -> list[BasePrompt]:
+    """
+    Adds the prompts that the given prompts depend on, directly or not, since their text is needed even if their
+    shape did not change.
+
+    :param prompts:
+    :param deck: Every prompt of the deck, in deck order.
+    :return: The prompts in deck order.
+    """
+    needed = set()
+    stack = list(prompts)
+    while stack:
+        prompt = stack.pop()
+        if prompt not in needed:
+            needed.add(prompt)
+            stack.extend(prompt.get_dependencies())
+    return [prompt for prompt in deck if prompt in needed]
+
+
+class PromptGraph:
+    """Tracks which prompts of a run can be dispatched, given the prompts each depends on.
+
+    A prompt is ready once every prompt it depends on completed; `complete` resolves the instructions of the prompts
+    it makes ready with the responses of their dependencies. The dependencies of every prompt must be in the graph,
+    and must not form a cycle (see `find_cycle`).
+    """
+
+    def __init__(self, prompts: list[BasePrompt]):
+        self._dependents: dict[BasePrompt, list[BasePrompt]] = {prompt: [] for prompt in prompts}
+        self._waiting: dict[BasePrompt, int] = {}
+        for prompt in prompts:
+            dependencies = prompt.get_dependencies()
+            self._waiting[prompt] = len(dependencies)
+            for dependency in dependencies:
+                self._dependents[dependency].append(prompt)
+        self._responses: dict[BasePrompt, BaseResponse] = {}
+
+    def add(self, prompt: BasePrompt) -> bool:
+        """
+        Adds a prompt after the graph was created, once its dependencies are in the graph, and returns whether it is
+        ready. The instruction of a prompt whose dependencies all completed is resolved at once.
+
+        :param prompt:
+        :return:
+        """
+        self._dependents[prompt] = []
+        dependencies = prompt.get_dependencies()
+        self._waiting[prompt] = sum(dependency not in self._responses for dependency in dependencies)
+        for dependency in dependencies:
+            self._dependents[dependency].append(prompt)
+        if dependencies and self._waiting[prompt] == 0:
+            prompt.resolve(self._responses)
+        return self._waiting[prompt] == 0
+
+    def is_ready(self, prompt: BasePrompt) -> bool:
+        return self._waiting[prompt] == 0
+
+    def dependents(self, prompt: BasePrompt) -> list[BasePrompt]:
+        return self._dependents.get(prompt, [])
+
+    def descendants(self, prompt: BasePrompt) -> list[BasePrompt]:
+        """
+        Returns the prompts depending on the prompt directly or through other prompts, each once.
+
+        :param prompt:
+        :return:
+        """
+        descendants = {}
+        stack = list(self.dependents(prompt))
+        while stack:
+            dependent = stack.pop()
+            if dependent not in descendants:
+                descendants[dependent] = None
+                stack.extend(self.dependents(dependent))
+        return list(descendants)
+
+    def complete(self, prompt: BasePrompt, response: BaseResponse) -> list[BasePrompt]:
+        """
+        Records the response to a prompt, and returns the prompts it made ready with their instructions resolved.
+
+        :param prompt:
+        :param response:
+        :return:
+        """
+        if prompt in self._responses:
+            return []
+        self._responses[prompt] = response
+        ready = []
+        for dependent in self.dependents(prompt):
+            self._waiting[dependent] -= 1
+            if self._waiting[dependent] == 0:
+                dependent.resolve(self._responses)
+                ready.append(dependent)
+        return ready
@@ -17,3 +17,23 @@ class BasePromptTemplate(ABC):
     @abstractmethod
     def create_instruction(self, **input_data) -> str:
         pass
+
+    @classmethod
+    def create_instruction_prefix(cls, **input_data) -> str:
+        """
+        Returns the part of the instruction that is the same for every prompt of a deck, which engines may cache.
+
+        :param input_data:
+        :return:
+        """
+        return ""
+
+    @classmethod
+    def create_instruction_suffix(cls, **input_data) -> str:
+        """
+        Returns the part of the instruction that varies per prompt, sent after the prefix.
+
+        :param input_data:
+        :return:
+        """
+        return cls.create_instruction(**input_data)
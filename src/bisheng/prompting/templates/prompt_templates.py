@@ -25,6 +25,19 @@ class OneShotWithContextPromptTemplate(BasePromptTemplate):
                 f"CONTEXT:{context}\n"
                 f"OUTPUT FORMAT:{output_filter}")
 
+    @staticmethod
+    def create_instruction_prefix(**input_data) -> str:
+        return f"CONTEXT:{input_data.get('context')}\n"
+
+    @staticmethod
+    def create_instruction_suffix(**input_data) -> str:
+        generate_prompt = input_data.get("generate_prompt")
+        shot_text = input_data.get("shot_text")
+        output_filter = input_data.get("output_filter")
+        return (f"INPUT DATA:{generate_prompt}\n"
+                f"EXAMPLES:{shot_text}\n"
+                f"OUTPUT FORMAT:{output_filter}")
+
 
 class GaabWithKnowledgeBasePromptTemplate(BasePromptTemplate):
 
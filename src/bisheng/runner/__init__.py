@@ -1,3 +1,3 @@
-from .runner import Runner
+from .runner import Runner, RunMode
 
-__all__ = ["Runner"]
+__all__ = ["Runner", "RunMode"]
@@ -0,0 +1,227 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import threading
+from typing import Optional
+
+from bisheng.engines.response_cache import ResponseCache
+from bisheng.prompting.failed_response import FailedResponse
+from bisheng.prompting.prompt_graph import PromptGraph
+from bisheng.runner.journal import RunJournal
+from bisheng.runner.retry import Outcome
+from bisheng.utils.metrics import metrics
+
+_BLOCKED_ERROR = "A shape it depends on did not complete"
+
+
+def coalescing_key(prompt) -> tuple:
+    return (prompt.get_system_prompt(), prompt.get_instruction_prompt(),
+            tuple(id(dependency) for dependency in prompt.get_dependencies()))
+
+
+def coalesce_prompts(prompts: list) -> dict:
+    """
+    Groups prompts with identical system prompt and instruction, which would produce the same request. Prompts
+    depending on other shapes are only grouped if they depend on the same shapes.
+
+    Only the first prompt of each group is dispatched; its response is fanned out to the others. The number of
+    engine calls saved is recorded as the `runner.calls_saved` metric.
+
+    :param prompts:
+    :return: The prompts sharing each dispatched prompt's request, keyed by the dispatched prompt.
+    """
+    groups = {}
+    for prompt in prompts:
+        groups.setdefault(coalescing_key(prompt), []).append(prompt)
+
+    calls_saved = len(prompts) - len(groups)
+    if calls_saved:
+        metrics.increment("runner.calls_saved", calls_saved)
+    return {group[0]: group[1:] for group in groups.values()}
+
+
+class PromptAdmission:
+    """Records the results of a run's prompts and decides which of them are dispatched.
+
+    `results` holds every prompt of the run, None until it completes. Only the first prompt of each group of
+    coalesced prompts is dispatched, and `duplicates` lists the others under it. A prompt that finished in the resumed
+    run or is found in the response cache is served without being dispatched, and the prompts depending on a prompt
+    are only admitted once the `graph` says they are ready. Prompts that did not complete are listed in `failed`.
+    """
+
+    def __init__(
+        self,
+        results: dict,
+        graph: PromptGraph,
+        journal: RunJournal,
+        progress,
+        tracker,
+        cache: Optional[ResponseCache] = None,
+        retry_failed: bool = False,
+        stream: bool = False,
+    ):
+        self.results = results
+        self.duplicates = coalesce_prompts(list(results))
+        self.failed = []
+        self._graph = graph
+        self._journal = journal
+        self._cache = cache
+        self._progress = progress
+        self._tracker = tracker
+        self._retry_failed = retry_failed
+        self._stream = stream
+        self._lock = threading.Lock()
+
+    def admit(self, prompts: list) -> list:
+        """
+        Serves the ready prompts that finished in the resumed run or are found in the cache, along with the dependent
+        prompts this makes ready, and returns the prompts left to dispatch.
+
+        Prompts that failed in the resumed run are dispatched again. When retrying failed prompts, a prompt absent
+        from the journal is left out of the run with the prompts depending on it, unless it depends on other prompts:
+        its instruction was resolved with their text, which may have been generated again.
+
+        :param prompts:
+        :return:
+        """
+        pending = []
+        prompts = list(prompts)
+        while prompts:
+            prompt = prompts.pop(0)
+            if prompt not in self.duplicates:
+                # sent as the duplicate of another prompt, or left out of the run
+                continue
+            response = self._journal.get(prompt)
+            if isinstance(response, FailedResponse):
+                response = None
+            elif response is not None:
+                metrics.increment("journal.resumed_prompts")
+            elif self._retry_failed and not prompt.get_dependencies():
+                self._skip(prompt)
+                continue
+            elif self._cache is not None:
+                response = self._cache.get(prompt)
+
+            if response is None:
+                pending.append(prompt)
+            else:
+                prompts.extend(self.record(prompt, response))
+        return pending
+
+    def add(self, prompt, leader) -> list:
+        """
+        Adds a prompt decoded while the run is dispatching, and returns the prompts to dispatch if it is ready.
+
+        The prompt is coalesced with its LEADER, the identical prompt decoded first, and gets its response if the
+        leader already completed. A prompt depending on a failed prompt fails, and a prompt whose leader or
+        dependencies were left out of the run is left out as well.
+
+        :param prompt:
+        :param leader:
+        :return:
+        """
+        dependencies = prompt.get_dependencies()
+        with self._lock:
+            if ((leader is not prompt and leader not in self.results)
+                    or any(dependency not in self.results for dependency in dependencies)):
+                return []
+            if leader is not prompt:
+                metrics.increment("runner.calls_saved")
+                response = self.results[leader]
+            elif any(isinstance(self.results[dependency], FailedResponse) for dependency in dependencies):
+                response = FailedResponse(outcome=Outcome.FAILED.value, error=_BLOCKED_ERROR)
+            else:
+                response = None
+            self.results[prompt] = response
+            ready = self._graph.add(prompt)
+            if response is None and leader is prompt:
+                self.duplicates[prompt] = []
+            elif response is None:
+                self.duplicates[leader].append(prompt)
+            elif not isinstance(response, FailedResponse):
+                self._graph.complete(prompt, response)
+
+        if response is None:
+            return self.admit([prompt]) if leader is prompt and ready else []
+        self._progress.update(self._tracker, advance=1)
+        if leader is prompt:
+            metrics.increment("dag.blocked")
+            self.failed.append(prompt)
+            self._journal.append(prompt, response)
+        return []
+
+    def update_total(self):
+        self._progress.update(self._tracker, total=len(self.results))
+
+    def store(self, prompt, results) -> list:
+        """
+        Journals and caches the response to a dispatched prompt, then records it.
+
+        :param prompt:
+        :param results:
+        :return: The dependent prompts this made ready.
+        """
+        metrics.increment(f"runner.outcomes.{Outcome.SUCCESS.value}")
+        self._journal.append(prompt, results)
+        if self._cache is not None:
+            self._cache.put(prompt, results)
+        return self.record(prompt, results)
+
+    def record(self, prompt, results) -> list:
+        """
+        Records the response to a prompt and its duplicates, and returns the dependent prompts this made ready.
+
+        :param prompt:
+        :param results:
+        :return:
+        """
+        # the prompt is recorded first: a streamed duplicate decoded after it is recorded is not added to its duplicates
+        ready = self._record_result(prompt, results)
+        for duplicate in self.duplicates.get(prompt, []):
+            ready.extend(self._record_result(duplicate, results))
+        return ready
+
+    def fail(self, prompt, response: FailedResponse):
+        """
+        Records a prompt that will not be dispatched again as failed, along with the prompts depending on it.
+
+        :param prompt:
+        :param response:
+        :return:
+        """
+        self.failed.append(prompt)
+        # failures are journaled, not cached, so that --retry-failed can find them
+        self._journal.append(prompt, response)
+        self.record(prompt, response)
+        self._fail_dependents(prompt)
+
+    def _fail_dependents(self, prompt):
+        """
+        Records the prompts depending, directly or not, on a failed prompt or its duplicates as failed.
+
+        :param prompt:
+        :return:
+        """
+        response = FailedResponse(outcome=Outcome.FAILED.value, error=_BLOCKED_ERROR)
+        for failed in [prompt, *self.duplicates.get(prompt, [])]:
+            for dependent in self._graph.descendants(failed):
+                if self.results.get(dependent) is None:
+                    metrics.increment("dag.blocked")
+                    self.failed.append(dependent)
+                    self._journal.append(dependent, response)
+                    self._record_result(dependent, response)
+
+    def _skip(self, prompt):
+        for skipped in [prompt, *self.duplicates.pop(prompt)]:
+            for removed in [skipped, *self._graph.descendants(skipped)]:
+                self.results.pop(removed, None)
+                self.duplicates.pop(removed, None)
+        if not self._stream:
+            self.update_total()
+
+    def _record_result(self, prompt, results) -> list:
+        with self._lock:
+            self.results[prompt] = results
+            self._progress.update(self._tracker, advance=1)
+            if isinstance(results, FailedResponse):
+                return []
+            return self._graph.complete(prompt, results)
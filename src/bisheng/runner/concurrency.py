@@ -0,0 +1,149 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import asyncio
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+from bisheng.utils import is_throttling_error, is_timeout_error
+
+logger = logging.getLogger(__name__)
+
+
+class ConcurrencySlot:
+    """The right to have one prompt in flight. Set `congested` if the prompt was throttled without raising."""
+
+    def __init__(self, ticket: float):
+        self.ticket = ticket
+        self.congested = False
+
+
+class AimdConcurrencyController:
+    """Adapts the number of prompts in flight to the throttling feedback of the service (AIMD).
+
+    The limit starts at `initial` and grows additively while prompts succeed (by `increase` for every `limit`
+    successful completions, i.e. roughly once per round of requests). When a prompt is throttled or times out, the
+    limit is cut multiplicatively by `decrease_factor`. Only prompts dispatched after the last cut can trigger another
+    one, so a burst of throttled requests that were already in flight counts as a single congestion event.
+
+    Attributes:
+        history (list): `(seconds since start, limit)` pairs recorded every time the whole-number limit changes.
+    """
+
+    def __init__(
+        self,
+        initial: int,
+        minimum: int = 1,
+        maximum: Optional[int] = None,
+        increase: float = 1.0,
+        decrease_factor: float = 0.5,
+    ):
+        self._minimum = max(minimum, 1)
+        self._maximum = maximum
+        self._increase = increase
+        self._decrease_factor = decrease_factor
+        self._limit = float(self._clamp(initial))
+        self._in_flight = 0
+        self._start = time.monotonic()
+        self._last_decrease = float("-inf")
+        self._condition = threading.Condition()
+        self._released: Optional[asyncio.Event] = None
+        self.history: list[tuple[float, int]] = [(0.0, self.limit)]
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def acquire(self) -> float:
+        """
+        Blocks until a prompt may be dispatched and returns the dispatch ticket to pass to `release`.
+
+        :return:
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+            return time.monotonic()
+
+    async def aacquire(self) -> float:
+        """
+        Waits on the event loop until a prompt may be dispatched and returns the dispatch ticket.
+
+        :return:
+        """
+        if self._released is None:
+            self._released = asyncio.Event()
+        while True:
+            with self._condition:
+                if self._in_flight < self.limit:
+                    self._in_flight += 1
+                    return time.monotonic()
+                self._released.clear()
+            await self._released.wait()
+
+    @contextmanager
+    def slot(self):
+        """
+        Holds a slot for the duration of the `with` block. Throttling and timeout errors raised inside the block
+        count as congestion.
+
+        :return:
+        """
+        slot = ConcurrencySlot(self.acquire())
+        try:
+            yield slot
+        except Exception as e:
+            slot.congested = slot.congested or is_throttling_error(e) or is_timeout_error(e)
+            raise
+        finally:
+            self.release(slot.ticket, slot.congested)
+
+    @asynccontextmanager
+    async def aslot(self):
+        """
+        The asyncio counterpart of `slot`.
+
+        :return:
+        """
+        slot = ConcurrencySlot(await self.aacquire())
+        try:
+            yield slot
+        except Exception as e:
+            slot.congested = slot.congested or is_throttling_error(e) or is_timeout_error(e)
+            raise
+        finally:
+            self.release(slot.ticket, slot.congested)
+
+    def release(self, ticket: float, congested: bool = False):
+        """
+        Marks a dispatched prompt as finished and adjusts the limit.
+
+        :param ticket: The value returned by `acquire` for this prompt.
+        :param congested: Whether the prompt was throttled or timed out.
+        :return:
+        """
+        with self._condition:
+            self._in_flight -= 1
+            previous = self.limit
+            if not congested:
+                self._limit = self._clamp(self._limit + self._increase / max(self._limit, 1.0))
+            elif ticket > self._last_decrease:
+                self._limit = self._clamp(self._limit * self._decrease_factor)
+                self._last_decrease = time.monotonic()
+
+            if self.limit != previous:
+                elapsed = round(time.monotonic() - self._start, 2)
+                self.history.append((elapsed, self.limit))
+                log = logger.info if self.limit < previous else logger.debug
+                log(f"Concurrency {'decreased' if self.limit < previous else 'increased'} to {self.limit} "
+                    f"after {elapsed}s")
+            self._condition.notify_all()
+        if self._released is not None:
+            self._released.set()
+
+    def _clamp(self, limit: float) -> float:
+        if self._maximum is not None:
+            limit = min(limit, float(self._maximum))
+        return max(limit, float(self._minimum))
@@ -0,0 +1,355 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Iterable, Optional
+
+from bisheng.engines import EngineFactory, EnginePool
+from bisheng.engines.request_context import RequestContext, request_context
+from bisheng.prompting.batch_prompt import BatchPrompt
+from bisheng.prompting.failed_response import FailedResponse
+from bisheng.runner.admission import PromptAdmission
+from bisheng.runner.concurrency import AimdConcurrencyController
+from bisheng.runner.hedging import HedgingPolicy
+from bisheng.runner.retry import RetryPolicy, RetryQueue, classify_error
+from bisheng.runner.scheduler import PromptScheduler
+from bisheng.utils import defaults
+from bisheng.utils.exceptions import PromptTimeoutError
+from bisheng.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class PromptDispatcher:
+    """Sends the prompts of a run to the engine, from a pool of worker threads or from an asyncio event loop.
+
+    Each prompt is invoked within a request context bounded by the `timeouts` block: `prompt_seconds` bounds each
+    prompt from the moment it is dispatched, `run_seconds` bounds the whole run from the moment the dispatcher is
+    created, and `stall_seconds` bounds the silence of a streamed response before it is resent (up to `stall_retries`
+    times). A value of `null` disables the bound.
+
+    Prompts are hedged according to the `hedging` policy if there is one, and failed attempts are retried as the
+    `retry_policy` says. The responses go to the `admission`, and the prompts they make ready are dispatched in turn.
+    """
+
+    def __init__(
+        self,
+        engine_factory: EngineFactory,
+        admission: PromptAdmission,
+        concurrency: AimdConcurrencyController,
+        retry_policy: RetryPolicy,
+        scheduler: PromptScheduler,
+        hedging: Optional[HedgingPolicy] = None,
+        hedge_engine_factory: Optional[EngineFactory] = None,
+        timeouts: Optional[dict] = None,
+    ):
+        self._engine_factory = engine_factory
+        self._admission = admission
+        self._concurrency = concurrency
+        self._retry_policy = retry_policy
+        self._scheduler = scheduler
+        self._hedging = hedging
+        self._hedge_engine_factory = hedge_engine_factory or engine_factory
+        self._attempts = {}
+        self._lock = threading.Lock()
+        self._contexts: set[RequestContext] = set()
+
+        timeouts = timeouts or {}
+        self._prompt_timeout = timeouts.get("prompt_seconds", defaults.PROMPT_TIMEOUT_SECONDS)
+        self._stall_timeout = timeouts.get("stall_seconds", defaults.STALL_TIMEOUT_SECONDS)
+        self._stall_retries = timeouts.get("stall_retries", defaults.STALL_RETRIES)
+        run_timeout = timeouts.get("run_seconds")
+        self._run_deadline = time.monotonic() + run_timeout if run_timeout else None
+
+    def run_threads(self, prompts: Iterable, num_threads: int):
+        """
+        Dispatches the prompts from a pool of NUM_THREADS worker threads, each with an engine of its own.
+
+        :param prompts:
+        :param num_threads:
+        :return:
+        """
+        with ExitStack() as stack:
+            self._engine_pool = stack.enter_context(EnginePool(self._engine_factory, size=num_threads))
+            executor = stack.enter_context(concurrent.futures.ThreadPoolExecutor(max_workers=num_threads))
+            if self._hedging is not None:
+                # each worker waits on its primary request and at most one hedge running on these threads
+                self._hedge_pool = stack.enter_context(EnginePool(self._hedge_engine_factory, size=num_threads))
+                self._hedge_executor = stack.enter_context(
+                    concurrent.futures.ThreadPoolExecutor(max_workers=2 * num_threads))
+            self._engine_pool.warm()
+            futures = {}
+            retries = RetryQueue()
+            try:
+                # a streamed deck is decoded here, while the prompts submitted so far are dispatched
+                for prompt in prompts:
+                    futures[executor.submit(self._run_prompt, prompt)] = prompt
+                while futures or retries:
+                    for prompt in retries.pop_due():
+                        futures[executor.submit(self._run_prompt, prompt)] = prompt
+                    done, _ = concurrent.futures.wait(futures, timeout=retries.next_due_in(),
+                                                      return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in done:
+                        prompt = futures.pop(future)
+                        error = future.exception()
+                        if error is None:
+                            for follow_up in future.result():
+                                futures[executor.submit(self._run_prompt, follow_up)] = follow_up
+                            continue
+                        if not isinstance(error, Exception):
+                            raise error
+                        delay = self._on_prompt_failed(prompt, error)
+                        if delay is not None:
+                            retries.push(prompt, delay)
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                self._cancel_in_flight("The run was aborted")
+                raise
+
+    async def run_async(self, prompts: Iterable):
+        """
+        Dispatches the prompts from the running event loop, with as many in flight as the concurrency controller
+        allows.
+
+        :param prompts:
+        :return:
+        """
+        engine = self._engine_factory.create()
+        hedge_engine = engine
+        if self._hedging is not None and self._hedge_engine_factory is not self._engine_factory:
+            hedge_engine = self._hedge_engine_factory.create()
+
+        async def invoke(prompt):
+            async with self._concurrency.aslot() as slot:
+                if self._hedging is None:
+                    results, context = await self._ainvoke(engine, prompt)
+                else:
+                    results, context = await self._ainvoke_hedged(engine, hedge_engine, prompt)
+                slot.congested = context.throttled
+            return results
+
+        async def run_prompt(prompt):
+            while True:
+                try:
+                    results = await invoke(prompt)
+                except Exception as e:
+                    delay = self._on_prompt_failed(prompt, e)
+                    if delay is None:
+                        return
+                    # the prompt gives up its slot while it backs off
+                    await asyncio.sleep(delay)
+                else:
+                    follow_ups = self._complete(prompt, results)
+                    await asyncio.gather(*(run_prompt(follow_up) for follow_up in follow_ups))
+                    return
+
+        tasks = []
+        try:
+            for prompt in prompts:
+                tasks.append(asyncio.ensure_future(run_prompt(prompt)))
+                # a streamed deck is decoded on the event loop, so the prompts dispatched so far get a turn in between
+                await asyncio.sleep(0)
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            await engine.aclose()
+            if hedge_engine is not engine:
+                await hedge_engine.aclose()
+
+    async def _ainvoke(self, engine, prompt) -> tuple:
+        start = time.monotonic()
+        with self._prompt_context() as context:
+            context.check()
+            try:
+                results = await asyncio.wait_for(engine.ainvoke(prompt), context.remaining())
+            except asyncio.TimeoutError:
+                raise PromptTimeoutError("Prompt missed its deadline")
+        self._observe_latency(prompt, time.monotonic() - start)
+        return results, context
+
+    async def _ainvoke_hedged(self, engine, hedge_engine, prompt) -> tuple:
+        """
+        Invokes the engine for the prompt and, if it is still outstanding after the hedging delay and the budget
+        allows it, sends a duplicate request to the hedge engine. The first request to succeed wins and the other one
+        is cancelled.
+
+        :param engine:
+        :param hedge_engine:
+        :param prompt:
+        :return: The response and the request context of the winning request.
+        """
+        self._hedging.on_dispatch()
+        primary = asyncio.ensure_future(self._ainvoke(engine, prompt))
+        hedge = None
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self._hedging.delay())
+            if done or not self._hedging.try_hedge():
+                return await primary
+
+            hedge = asyncio.ensure_future(self._ainvoke(hedge_engine, prompt))
+            pending = {primary, hedge}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (primary, hedge):
+                    if task in done and task.exception() is None:
+                        if task is hedge:
+                            metrics.increment("hedging.won")
+                        return task.result()
+                for task in (primary, hedge):
+                    if task in done:
+                        error = error or task.exception()
+            raise error
+        finally:
+            for task in (primary, hedge):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def _run_prompt(self, prompt) -> list:
+        with self._concurrency.slot() as slot:
+            if self._hedging is None:
+                results, context = self._invoke(self._engine_pool, prompt)
+            else:
+                results, context = self._invoke_hedged(prompt)
+            slot.congested = context.throttled
+        return self._complete(prompt, results)
+
+    def _complete(self, prompt, results) -> list:
+        """
+        Stores the response to a dispatched prompt and returns the prompts to dispatch next: the prompts of a batch
+        whose response could not be split, which fall back to one request each, or the dependent prompts it made ready.
+
+        :param prompt:
+        :param results:
+        :return:
+        """
+        if not isinstance(prompt, BatchPrompt):
+            return self._admission.admit(self._admission.store(prompt, results))
+
+        responses = prompt.split(results)
+        if responses is None:
+            metrics.increment("batching.fallbacks")
+            logger.warning(f"Could not split the response to a batch of {len(prompt.prompts)} prompts; generating "
+                           f"them one by one")
+            return prompt.prompts
+        ready = []
+        for member, response in responses.items():
+            ready.extend(self._admission.store(member, response))
+        return self._admission.admit(ready)
+
+    def _invoke(self, engine_pool: EnginePool, prompt, context: Optional[RequestContext] = None) -> tuple:
+        start = time.monotonic()
+        with self._prompt_context(context) as context, engine_pool.checkout() as engine:
+            context.check()
+            results = engine.invoke(prompt)
+        self._observe_latency(prompt, time.monotonic() - start)
+        return results, context
+
+    def _invoke_hedged(self, prompt) -> tuple:
+        """
+        The thread counterpart of `_ainvoke_hedged`. Both requests run on the hedge executor while the worker waits;
+        the losing request is cancelled through its request context and stops at the engine's next check.
+
+        :param prompt:
+        :return: The response and the request context of the winning request.
+        """
+        self._hedging.on_dispatch()
+        primary_context = self._create_request_context()
+        primary = self._hedge_executor.submit(self._invoke, self._engine_pool, prompt, primary_context)
+        done, _ = concurrent.futures.wait([primary], timeout=self._hedging.delay())
+        if done or not self._hedging.try_hedge():
+            return primary.result()
+
+        hedge_context = self._create_request_context()
+        hedge = self._hedge_executor.submit(self._invoke, self._hedge_pool, prompt, hedge_context)
+        attempts = {primary: primary_context, hedge: hedge_context}
+        error = None
+        for future in concurrent.futures.as_completed(attempts):
+            if future.exception() is None:
+                for loser, context in attempts.items():
+                    if loser is not future:
+                        context.cancel("Another request for the prompt completed first")
+                if future is hedge:
+                    metrics.increment("hedging.won")
+                return future.result()
+            error = error or future.exception()
+        raise error
+
+    def _observe_latency(self, prompt, seconds: float):
+        self._scheduler.observe(prompt, seconds)
+        if self._hedging is not None:
+            self._hedging.observe(seconds)
+
+    def _on_prompt_failed(self, prompt, error: Exception) -> Optional[float]:
+        """
+        Handles a failed attempt of a prompt: returns the backoff before the prompt is dispatched again, or records
+        the prompt as failed (with its outcome) and returns None once it is not retried.
+
+        :param prompt:
+        :param error:
+        :return:
+        """
+        attempt = self._attempts[prompt] = self._attempts.get(prompt, 0) + 1
+        outcome = classify_error(error)
+        delay = self._retry_policy.next_delay(attempt, error)
+        if delay is not None:
+            metrics.increment("runner.retries")
+            logger.info(f"Prompt attempt {attempt} {outcome.value} ({error!r}); retrying in {round(delay, 1)}s")
+            return delay
+
+        logger.warning(f"Prompt {outcome.value} after {attempt} attempts: {error!r}")
+        metrics.increment(f"runner.outcomes.{outcome.value}")
+        response = FailedResponse(outcome=outcome.value, error=str(error) or type(error).__name__)
+        for member in prompt.prompts if isinstance(prompt, BatchPrompt) else [prompt]:
+            self._admission.fail(member, response)
+        return None
+
+    def _create_request_context(self) -> RequestContext:
+        """
+        Creates the request context of a prompt being dispatched, with its deadline (the earliest of the prompt and
+        run deadlines).
+
+        :return:
+        """
+        deadlines = [deadline for deadline in (
+            time.monotonic() + self._prompt_timeout if self._prompt_timeout else None,
+            self._run_deadline,
+        ) if deadline is not None]
+        return RequestContext(
+            deadline=min(deadlines) if deadlines else None,
+            stall_timeout=self._stall_timeout,
+            stall_retries=self._stall_retries,
+        )
+
+    @contextmanager
+    def _prompt_context(self, context: Optional[RequestContext] = None):
+        """
+        Opens the request context of a prompt being dispatched (a new one unless CONTEXT is given), and tracks it so
+        that it can be cancelled.
+
+        :param context:
+        :return:
+        """
+        context = context or self._create_request_context()
+        with self._lock:
+            self._contexts.add(context)
+        try:
+            with request_context(context):
+                yield context
+        finally:
+            with self._lock:
+                self._contexts.discard(context)
+
+    def _cancel_in_flight(self, reason: str):
+        with self._lock:
+            contexts = list(self._contexts)
+        for context in contexts:
+            context.cancel(reason)
@@ -0,0 +1,155 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import heapq
+import re
+from typing import Optional
+
+from pydantic import BaseModel
+
+from bisheng.prompting.base_prompt import BasePrompt
+from bisheng.prompting.batch_prompt import BatchPrompt
+from bisheng.utils import defaults
+from bisheng.utils.tokens import estimate_tokens
+
+# A word count in an output format, e.g. "50 words" or the upper bound of "between 10 - 50 words"
+_WORD_LIMIT_PATTERN = re.compile(r"(\d+)\s+words?\b", re.IGNORECASE)
+
+
+def output_word_limit(output_format: str) -> Optional[int]:
+    """
+    Returns the largest word count stated in an output format, or None if it states none.
+
+    :param output_format:
+    :return:
+    """
+    limits = [int(limit) for limit in _WORD_LIMIT_PATTERN.findall(output_format or "")]
+    return max(limits) if limits else None
+
+
+def simulate_makespan(durations: list[float], workers: int) -> float:
+    """
+    Returns the wall time of running tasks of the given durations, in order, on WORKERS workers that each start the
+    next task as soon as they are free.
+
+    :param durations:
+    :param workers:
+    :return:
+    """
+    finish_times = [0.0] * max(min(workers, len(durations)), 1)
+    for duration in durations:
+        heapq.heapreplace(finish_times, finish_times[0] + duration)
+    return max(finish_times)
+
+
+class PromptEstimate(BaseModel):
+
+    input_tokens: int
+    output_tokens: int
+    seconds: float
+
+
+class RunEstimate(BaseModel):
+
+    requests: int
+    input_tokens: int
+    output_tokens: int
+    # tokens charged against the tokens-per-minute quota: the input tokens plus `max_tokens` per request
+    reserved_tokens: int
+    cost: Optional[float]
+    serial_seconds: float
+    wall_seconds: float
+    # which of `concurrency`, `requests_per_minute` or `tokens_per_minute` bounds the wall time
+    bound: str
+    requests_per_minute: float
+    tokens_per_minute: float
+
+
+class RunEstimator:
+    """Estimates the tokens, cost and duration of prompts without calling an engine.
+
+    Input tokens are approximated from the system prompt and instruction. Output tokens follow the word limit of each
+    shape's output format (plus an allowance for the rationale), capped at the engine's `max_tokens`. The duration of
+    a request is a fixed time to first token plus its output tokens at the model's output speed. All of these can be
+    tuned, and prices set, in the optional `runner.estimate` block.
+    """
+
+    def __init__(self, engine_config: dict, estimate_config: Optional[dict] = None):
+        estimate_config = estimate_config or {}
+        self._max_tokens = engine_config.get("hyperparameters", {}).get("max_tokens")
+        self._rate_limit = engine_config.get("rate_limit") or {}
+        self._first_token_seconds = estimate_config.get("first_token_seconds", defaults.ESTIMATED_FIRST_TOKEN_SECONDS)
+        self._output_tokens_per_second = estimate_config.get("output_tokens_per_second",
+                                                             defaults.ESTIMATED_OUTPUT_TOKENS_PER_SECOND)
+        self._input_price = estimate_config.get("input_price_per_1k_tokens")
+        self._output_price = estimate_config.get("output_price_per_1k_tokens")
+
+    @property
+    def max_tokens(self) -> Optional[int]:
+        return self._max_tokens
+
+    @staticmethod
+    def output_tokens(prompt: BasePrompt) -> int:
+        """
+        Estimates the output tokens of a prompt (or of every prompt of a batch) and its rationale, regardless of the
+        engine's `max_tokens`.
+
+        :param prompt:
+        :return:
+        """
+        output_tokens = defaults.ESTIMATED_RATIONALE_TOKENS
+        for member in prompt.prompts if isinstance(prompt, BatchPrompt) else [prompt]:
+            word_limit = output_word_limit(member.get_output_format())
+            output_tokens += (round(word_limit * defaults.ESTIMATED_TOKENS_PER_WORD) if word_limit is not None
+                              else defaults.ESTIMATED_OUTPUT_TOKENS)
+        return output_tokens
+
+    def estimate_prompt(self, prompt: BasePrompt) -> PromptEstimate:
+        input_tokens = estimate_tokens(prompt.get_system_prompt(), prompt.get_instruction_prompt())
+        output_tokens = self.output_tokens(prompt)
+        if self._max_tokens:
+            output_tokens = min(output_tokens, self._max_tokens)
+        return PromptEstimate(
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            seconds=self._first_token_seconds + output_tokens / self._output_tokens_per_second,
+        )
+
+    def estimate_run(self, prompts: list[BasePrompt], concurrency: int) -> RunEstimate:
+        """
+        Estimates a run dispatching the prompts in order with at most CONCURRENCY in flight, paced by the engine's
+        rate limits if it has any.
+
+        :param prompts:
+        :param concurrency:
+        :return:
+        """
+        estimates = [self.estimate_prompt(prompt) for prompt in prompts]
+        input_tokens = sum(estimate.input_tokens for estimate in estimates)
+        output_tokens = sum(estimate.output_tokens for estimate in estimates)
+        reserved_tokens = sum(estimate.input_tokens + (self._max_tokens or estimate.output_tokens)
+                              for estimate in estimates)
+
+        bounds = {"concurrency": simulate_makespan([estimate.seconds for estimate in estimates], concurrency)}
+        if self._rate_limit.get("requests_per_minute"):
+            bounds["requests_per_minute"] = 60 * len(estimates) / self._rate_limit["requests_per_minute"]
+        if self._rate_limit.get("tokens_per_minute"):
+            bounds["tokens_per_minute"] = 60 * reserved_tokens / self._rate_limit["tokens_per_minute"]
+        bound = max(bounds, key=bounds.get)
+        wall_seconds = bounds[bound]
+
+        cost = None
+        if self._input_price is not None or self._output_price is not None:
+            cost = (input_tokens * (self._input_price or 0) + output_tokens * (self._output_price or 0)) / 1000
+        minutes = wall_seconds / 60
+        return RunEstimate(
+            requests=len(estimates),
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            reserved_tokens=reserved_tokens,
+            cost=cost,
+            serial_seconds=sum(estimate.seconds for estimate in estimates),
+            wall_seconds=wall_seconds,
+            bound=bound,
+            requests_per_minute=len(estimates) / minutes if minutes else 0.0,
+            tokens_per_minute=reserved_tokens / minutes if minutes else 0.0,
+        )
@@ -0,0 +1,69 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import collections
+import math
+import threading
+from typing import Optional
+
+from bisheng.utils.metrics import metrics
+
+
+class HedgingPolicy:
+    """Decides when a slow prompt gets a duplicate (hedged) request, within a budget.
+
+    The latencies of the last `window` successful requests are kept. Once `min_samples` have been observed, a prompt
+    still outstanding after the `percentile` of those latencies (but at least `min_delay` seconds) is hedged. At most
+    a `budget` fraction of the dispatched prompts are hedged, which caps the extra cost of the duplicates.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95,
+        min_samples: int = 20,
+        min_delay: float = 1.0,
+        budget: float = 0.1,
+        window: int = 1000,
+    ):
+        self._percentile = percentile
+        self._min_samples = max(min_samples, 1)
+        self._min_delay = min_delay
+        self._budget = budget
+        self._latencies: collections.deque = collections.deque(maxlen=window)
+        self._dispatched = 0
+        self._hedged = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._latencies.append(seconds)
+
+    def on_dispatch(self):
+        with self._lock:
+            self._dispatched += 1
+
+    def delay(self) -> Optional[float]:
+        """
+        Returns how long a prompt may be outstanding before it is hedged, or None while too few latencies are known.
+
+        :return:
+        """
+        with self._lock:
+            if len(self._latencies) < self._min_samples:
+                return None
+            latencies = sorted(self._latencies)
+        index = min(len(latencies) - 1, max(0, math.ceil(self._percentile / 100 * len(latencies)) - 1))
+        return max(latencies[index], self._min_delay)
+
+    def try_hedge(self) -> bool:
+        """
+        Claims a hedge from the budget, or returns False if the budget is spent.
+
+        :return:
+        """
+        with self._lock:
+            if self._hedged + 1 > self._budget * self._dispatched:
+                metrics.increment("hedging.over_budget")
+                return False
+            self._hedged += 1
+        metrics.increment("hedging.sent")
+        return True
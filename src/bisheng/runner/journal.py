@@ -0,0 +1,124 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Optional
+
+from bisheng.prompting.base_prompt import BasePrompt
+from bisheng.prompting.base_response import BaseResponse, dump_response, load_response
+from bisheng.utils.hashing import generation_config
+
+logger = logging.getLogger(__name__)
+
+
+class RunJournal:
+    """An append-only JSONL journal of the prompts finished during a run, used to resume a run that did not complete.
+
+    Each finished prompt is appended as one line as soon as its response arrives. Appends only write to the file
+    buffer; a background thread flushes and fsyncs the journal once `batch_size` records are pending or every
+    `flush_interval` seconds, so the workers never wait on the disk. A crash can therefore lose at most the last
+    batch, and a line torn by the crash is ignored when the journal is read back.
+
+    Records are keyed by a hash of the prompt (its slide, shape, system prompt and instruction) and of the engine
+    settings, so a resumed run only reuses responses for prompts that are still identical.
+    """
+
+    def __init__(self, path: str, engine_config: dict, batch_size: int, flush_interval: float):
+        self.path = path
+        self._engine_config = generation_config(engine_config)
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._records: dict[str, tuple[str, str]] = {}
+        self._file = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._closed = False
+        self._flusher: Optional[threading.Thread] = None
+
+    def open(self, resume: bool):
+        """
+        Opens the journal for appending. With RESUME the records of the previous run are loaded and kept, otherwise
+        the journal is started afresh.
+
+        :param resume:
+        :return:
+        """
+        if resume:
+            self._load()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "a" if resume else "w")
+        self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+        self._flusher.start()
+
+    def get(self, prompt: BasePrompt) -> Optional[BaseResponse]:
+        """
+        Returns the journaled response for the prompt, or None if it did not finish in the previous run.
+
+        :param prompt:
+        :return:
+        """
+        record = self._records.get(self._key(prompt))
+        return load_response(*record) if record is not None else None
+
+    def append(self, prompt: BasePrompt, response: BaseResponse):
+        response_type, body = dump_response(response)
+        line = json.dumps({"key": self._key(prompt), "response_type": response_type, "response": body})
+        with self._lock:
+            self._file.write(line + "\n")
+            self._pending += 1
+            if self._pending >= self._batch_size:
+                self._wake.notify()
+
+    def close(self, delete: bool = False):
+        """
+        Flushes the pending records and closes the journal. With DELETE the journal is removed, once the run's
+        results are safely written by the encoders.
+
+        :param delete:
+        :return:
+        """
+        with self._lock:
+            self._closed = True
+            self._wake.notify()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if delete and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            logger.info(f"No journal found at {self.path}; starting from scratch")
+            return
+        with open(self.path) as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # the last line may be torn if the previous run was killed mid-write
+                    continue
+                self._records[record["key"]] = (record["response_type"], record["response"])
+        logger.info(f"Resuming from {self.path} with {len(self._records)} finished prompts")
+
+    def _flush_periodically(self):
+        closed = False
+        while not closed:
+            with self._lock:
+                self._wake.wait_for(lambda: self._closed or self._pending >= self._batch_size, self._flush_interval)
+                closed = self._closed
+                pending, self._pending = self._pending, 0
+                if pending:
+                    self._file.flush()
+            # fsync outside the lock, so that workers keep appending while the disk catches up
+            if pending:
+                os.fsync(self._file.fileno())
+
+    def _key(self, prompt: BasePrompt) -> str:
+        record = {"engine": self._engine_config, "prompt": prompt.to_json()}
+        return hashlib.sha256(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()
@@ -0,0 +1,129 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import json
+import logging
+import os
+from typing import Optional
+
+from bisheng.prompting.base_prompt import BasePrompt
+from bisheng.prompting.failed_response import FailedResponse
+from bisheng.prompting.prompt_graph import dependency_order
+from bisheng.utils.hashing import hash_file, hash_request
+
+logger = logging.getLogger(__name__)
+
+_MANIFEST_VERSION = 1
+
+
+class ShapeManifest:
+    """Records what was generated into each shape of the output deck, so that later runs only regenerate what changed.
+
+    The manifest is a JSON file next to the output deck. For every `(slide_id, shape_id)` it stores a hash of the
+    request that produced the shape's text: the system prompt, the instruction (generate prompt, shot text, output
+    format and context) and the engine settings that affect generation. It also stores a hash of the output deck as
+    it was saved; if the deck was replaced or edited since, the manifest no longer describes it and is ignored.
+
+    The text of the shapes a shape depends on is only known once they are generated, so the hash of a dependent shape
+    covers its unresolved instruction and the hashes of its dependencies. Hashes are computed once per prompt, before
+    the run resolves any instruction.
+    """
+
+    def __init__(self, output_path: str, engine_config: dict):
+        self.output_path = output_path
+        self.path = f"{os.path.splitext(output_path)[0]}.manifest.json"
+        self._engine_config = engine_config
+        self._shapes: dict[str, str] = {}
+        self._hashes: dict[BasePrompt, str] = {}
+
+    def load(self) -> bool:
+        """
+        Loads the manifest from disk if it describes the current output deck.
+
+        :return: Whether a usable manifest was loaded.
+        """
+        if not os.path.isfile(self.path) or not os.path.isfile(self.output_path):
+            return False
+        with open(self.path) as file:
+            manifest = json.load(file)
+
+        if manifest.get("version") != _MANIFEST_VERSION:
+            logger.info(f"Ignoring manifest {self.path} written by another version; regenerating every shape")
+            return False
+        if manifest.get("output_hash") != hash_file(self.output_path):
+            logger.info(f"{self.output_path} changed since the last run; regenerating every shape")
+            return False
+        self._shapes = manifest.get("shapes", {})
+        return True
+
+    def changed(self, prompts: list[BasePrompt]) -> list[BasePrompt]:
+        """
+        Returns the prompts whose shape has no entry or whose request changed since the shape was generated.
+
+        :param prompts:
+        :return:
+        """
+        return [prompt for prompt in prompts if self._shapes.get(self._shape_key(prompt)) != self._hash(prompt)]
+
+    def save(self, prompts: list[BasePrompt], results: dict):
+        """
+        Records the prompts generated in this run and writes the manifest for the output deck as it is now.
+
+        Shapes that are no longer prompts in the deck are dropped, and prompts without a result or whose prompt failed
+        keep no entry so that the next run generates them.
+
+        :param prompts: Every prompt decoded from the deck.
+        :param results: The responses generated in this run, keyed by prompt.
+        :return:
+        """
+        shape_keys = {self._shape_key(prompt) for prompt in prompts}
+        shapes = {key: value for key, value in self._shapes.items() if key in shape_keys}
+        for prompt, response in results.items():
+            if response is None or isinstance(response, FailedResponse):
+                shapes.pop(self._shape_key(prompt), None)
+            else:
+                shapes[self._shape_key(prompt)] = self._hash(prompt)
+        self._shapes = shapes
+
+        manifest = {
+            "version": _MANIFEST_VERSION,
+            "output_hash": hash_file(self.output_path),
+            "shapes": dict(sorted(shapes.items())),
+        }
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(temporary_path, self.path)
+
+    def _hash(self, prompt: BasePrompt) -> str:
+        if prompt not in self._hashes:
+            # hashed from the roots of the chains down rather than recursively, so that long chains of shapes do not
+            # hit the recursion limit
+            unhashed = {}
+            stack = [prompt]
+            while stack:
+                dependency = stack.pop()
+                if dependency not in unhashed and dependency not in self._hashes:
+                    unhashed[dependency] = None
+                    stack.extend(dependency.get_dependencies())
+            for hashed in dependency_order(list(unhashed)):
+                instruction = hashed.get_instruction_prompt() + "".join(
+                    self._hashes[dependency] for dependency in hashed.get_dependencies())
+                self._hashes[hashed] = hash_request(self._engine_config, hashed.get_system_prompt(), instruction)
+        return self._hashes[prompt]
+
+    @staticmethod
+    def _shape_key(prompt: BasePrompt) -> str:
+        return f"{prompt.get_slide_id()}:{prompt.get_shape().shape_id}"
+
+
+def find_output_deck(encoders_config: list[dict]) -> Optional[str]:
+    """
+    Returns the path of the deck written by the `pptx` encoder, if one is configured.
+
+    :param encoders_config:
+    :return:
+    """
+    for encoder_config in encoders_config:
+        if encoder_config["type"] == "pptx":
+            return encoder_config["path"]
+    return None
@@ -0,0 +1,99 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import heapq
+import itertools
+import random
+import time
+from enum import Enum
+from typing import Optional
+
+from bisheng.utils import is_throttling_error, is_timeout_error
+from bisheng.utils.exceptions import PromptCancelledError, PromptTimeoutError
+
+
+class Outcome(Enum):
+    SUCCESS = "success"
+    FAILED = "failed"
+    TIMED_OUT = "timed_out"
+    THROTTLED = "throttled"
+
+
+def classify_error(error: BaseException) -> Outcome:
+    """
+    Returns the outcome of a prompt whose invocation raised ERROR.
+
+    :param error:
+    :return:
+    """
+    if is_throttling_error(error):
+        return Outcome.THROTTLED
+    if isinstance(error, PromptTimeoutError) or is_timeout_error(error):
+        return Outcome.TIMED_OUT
+    return Outcome.FAILED
+
+
+class RetryPolicy:
+    """Decides whether a failed prompt is dispatched again, and after how long.
+
+    Throttled and timed out prompts, and prompts whose connection dropped, are retried up to `max_attempts` attempts
+    in total, after a jittered exponential backoff ("full jitter": a uniform delay between 0 and
+    `min(max_delay, base_delay * 2 ** attempt)`). Other errors, and prompts cancelled because the run was aborted,
+    are not retried.
+    """
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max(max_attempts, 1)
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+
+    @staticmethod
+    def is_retryable(error: BaseException) -> bool:
+        if isinstance(error, PromptCancelledError):
+            return False
+        return classify_error(error) is not Outcome.FAILED or isinstance(error, ConnectionError)
+
+    def next_delay(self, attempt: int, error: BaseException) -> Optional[float]:
+        """
+        Returns the seconds to wait before dispatching the prompt again, or None if it should not be retried.
+
+        :param attempt: The number of attempts made so far (1 after the first failure).
+        :param error: The error raised by the last attempt.
+        :return:
+        """
+        if attempt >= self.max_attempts or not self.is_retryable(error):
+            return None
+        return random.uniform(0, min(self._max_delay, self._base_delay * 2 ** (attempt - 1)))
+
+
+class RetryQueue:
+    """The prompts waiting for their backoff to elapse before they are dispatched again, earliest first."""
+
+    def __init__(self):
+        self._heap: list[tuple[float, int, object]] = []
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, prompt, delay: float):
+        heapq.heappush(self._heap, (time.monotonic() + delay, next(self._sequence), prompt))
+
+    def pop_due(self) -> list:
+        """
+        Removes and returns the prompts whose backoff has elapsed.
+
+        :return:
+        """
+        now = time.monotonic()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def next_due_in(self) -> Optional[float]:
+        """
+        Returns the seconds until the next prompt is due, or None if the queue is empty.
+
+        :return:
+        """
+        return max(0.0, self._heap[0][0] - time.monotonic()) if self._heap else None
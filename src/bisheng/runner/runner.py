@@ -1,8 +1,9 @@
-import concurrent.futures
+import asyncio
 import os
 import logging
 import threading
-from datetime import time
+import time
+from enum import Enum
 from typing import Optional
 import sys
 import yaml
@@ -14,15 +15,36 @@ from bisheng.decoders.decoder_factory import DecoderFactory
 from bisheng.utils.defaults import CONFIG_FILE_NAME
 from bisheng.encoders.encoder_factory import EncoderFactory
 from bisheng.engines import EngineFactory
-from bisheng.engines.websocket_engine import WebSocketEngine
+from bisheng.engines.response_cache import ResponseCache
+from bisheng.runner.admission import PromptAdmission, coalesce_prompts
+from bisheng.runner.concurrency import AimdConcurrencyController
+from bisheng.runner.dispatch import PromptDispatcher
+from bisheng.runner.estimator import RunEstimator
+from bisheng.runner.hedging import HedgingPolicy
+from bisheng.runner.journal import RunJournal
+from bisheng.runner.manifest import ShapeManifest, find_output_deck
+from bisheng.runner.retry import RetryPolicy
+from bisheng.runner.scheduler import PromptScheduler
+from bisheng.runner.streaming import PromptStream
 from bisheng.utils import log_run_start, defaults
-from bisheng.utils.logging import log_run_end
+from bisheng.utils.logging import log_run_end, log_concurrency_history, log_run_estimate, log_makespan
+from bisheng.prompting.batch_prompt import BatchPrompt
+from bisheng.prompting.prompt_graph import PromptGraph, with_dependencies
+from bisheng.utils.metrics import metrics
 from bisheng.utils.summary import create_markdown_summary
 
 
 sys.path.append(".")
 logger = logging.getLogger(__name__)
 
+# engines whose responses are only streamed by `invoke`, so that async mode would lose the early end of the prompt
+_THREAD_ONLY_ENGINE_TYPES = {"bedrock-streaming"}
+
+
+class RunMode(Enum):
+    THREAD = "thread"
+    ASYNC = "async"
+
 
 class Runner(BaseModel):
 
@@ -110,6 +132,8 @@ class Runner(BaseModel):
                 "endpoint_url": "https://bedrock.${AWS_REGION}.amazonaws.com",
                 "max_retry": 10,
                 "retry_mode": "adaptive",
+                "num_connections": defaults.GAAB_NUM_CONNECTIONS,
+                "max_in_flight_per_connection": defaults.GAAB_MAX_IN_FLIGHT_PER_CONNECTION,
             },
             "encoders": [{
                 "type": "transparency-report",
@@ -164,6 +188,24 @@ class Runner(BaseModel):
             else num_threads
         )
 
+    @staticmethod
+    def _resolve_concurrency(num_tests: int, concurrency: Optional[int]) -> int:
+        """
+        Resolves the number of prompts in flight at once in async mode.
+
+        If the concurrency is not specified, this resolves to the minimum of the number of tests and the default
+        maximum concurrency for the event loop.
+
+        :param num_tests:
+        :param concurrency:
+        :return:
+        """
+        return (
+            min(num_tests, defaults.MAX_ASYNC_CONCURRENCY)
+            if concurrency is None
+            else concurrency
+        )
+
     @staticmethod
     def _load_yaml(path: str) -> dict:
         """
@@ -233,26 +275,192 @@ class Runner(BaseModel):
 
         self._lock = threading.Lock()
 
-    def _run_decoder(self, num_threads):
+    def _run_decoder(self, num_threads, mode, concurrency, full, stream):
+        self._manifest = self._load_manifest(full)
+        if stream:
+            # the prompts are decoded as they are dispatched, so their number is not known yet
+            self._prompts = []
+            self._num_threads = (self._resolve_concurrency(defaults.MAX_ASYNC_CONCURRENCY, concurrency)
+                                 if mode == RunMode.ASYNC.value
+                                 else self._resolve_num_threads(defaults.MAX_NUM_THREADS, num_threads))
+            self._results = {}
+            return
+
         self._decoder.decode()
-        self._num_threads = self._resolve_num_threads(self._decoder.num_prompts, num_threads)
-        self._results = {prompt: None for prompt in self._decoder.prompts}
+        if self._manifest is None:
+            self._prompts = list(self._decoder.prompts)
+        else:
+            changed = self._manifest.changed(self._decoder.prompts)
+            metrics.increment("manifest.unchanged_shapes", self._decoder.num_prompts - len(changed))
+            self._prompts = with_dependencies(changed, self._decoder.prompts)
+
+        if mode == RunMode.ASYNC.value:
+            self._num_threads = self._resolve_concurrency(len(self._prompts), concurrency)
+        else:
+            self._num_threads = self._resolve_num_threads(len(self._prompts), num_threads)
+        self._results = {prompt: None for prompt in self._prompts}
+
+    def _load_manifest(self, full: bool) -> Optional[ShapeManifest]:
+        """
+        Loads the manifest of the output deck, unless there is no `pptx` encoder or FULL regeneration is requested.
+
+        :param full:
+        :return:
+        """
+        output_path = find_output_deck(self.config["encoders"])
+        if output_path is None:
+            return None
+        manifest = ShapeManifest(output_path, self.config["engine"])
+        if not full:
+            manifest.load()
+        return manifest
 
     def run(self,
             num_threads: int = 1,
             verbose: bool = False,
+            mode: str = "thread",
+            concurrency: Optional[int] = None,
+            no_cache: bool = False,
+            refresh: bool = False,
+            full: bool = False,
+            resume: bool = False,
+            retry_failed: bool = False,
+            dry_run: bool = False,
+            stream: bool = False,
             ):
+        """
+        Runs the print job.
+
+        Prompts are dispatched from NUM_THREADS worker threads in `thread` mode, or from an event loop with at most
+        CONCURRENCY in flight in `async` mode.
+
+        :param num_threads:
+        :param verbose:
+        :param mode:
+        :param concurrency:
+        :param no_cache:
+        :param refresh:
+        :param full:
+        :param resume:
+        :param retry_failed:
+        :param dry_run:
+        :param stream:
+        :return:
+        """
+        if mode not in [m.value for m in RunMode]:
+            raise ValueError(f"Invalid run mode: {mode}")
+        if mode == RunMode.ASYNC.value:
+            engine_config = self.config.get("engine", {})
+            engine_types = {config.get("type") for config in [engine_config, *engine_config.get("backends", [])]}
+            unsupported = sorted(engine_types & _THREAD_ONLY_ENGINE_TYPES)
+            if unsupported:
+                raise ValueError(f"The {', '.join(unsupported)} engine does not stream responses in async mode; run "
+                                 f"it in thread mode")
+
+        metrics.reset()
         self._pre_run()
-        self._run_decoder(num_threads)
+        stream = stream and not dry_run
+        self._run_decoder(num_threads, mode, concurrency, full, stream)
+        if dry_run:
+            self._estimate_run(no_cache)
+            return
+
+        log_run_start(verbose, self._num_threads)
+
+        start = time.time()
+        self._concurrency = self._create_concurrency_controller()
+        cache = None if no_cache else self._create_response_cache(refresh)
+        journal = self._open_journal(resume or retry_failed)
+        scheduler = self._create_scheduler()
+        graph = PromptGraph(self._prompts)
+
+        completed = False
+        try:
+            with Progress(transient=True) as progress:
+                # the progress bar is indeterminate until a streamed deck is decoded
+                tracker = progress.add_task("running...", total=None if stream else len(self._prompts))
+                admission = PromptAdmission(self._results, graph, journal, progress, tracker, cache=cache,
+                                            retry_failed=retry_failed, stream=stream)
+                hedging = self._create_hedging_policy()
+                dispatcher = PromptDispatcher(
+                    self._engine_factory, admission, self._concurrency, self._create_retry_policy(), scheduler,
+                    hedging=hedging, hedge_engine_factory=self._hedge_engine_factory,
+                    timeouts=self.config.get("runner", {}).get("timeouts"),
+                )
+                num_threads = self._num_threads
+                if stream:
+                    pending, predicted_makespan = PromptStream(self._decoder, admission, self._manifest), None
+                else:
+                    pending, predicted_makespan = scheduler.schedule(
+                        self._batch_prompts(admission.admit(
+                            [prompt for prompt in admission.duplicates if graph.is_ready(prompt)])),
+                        self._num_threads, graph)
+                    # the prompts waiting on their dependencies are dispatched as they become ready
+                    waiting = sum(not graph.is_ready(prompt) for prompt in admission.duplicates)
+                    num_threads = min(num_threads, len(pending) + waiting)
+                dispatch_start = time.monotonic()
+                if pending and mode == RunMode.ASYNC.value:
+                    asyncio.run(dispatcher.run_async(pending))
+                elif pending:
+                    dispatcher.run_threads(pending, num_threads)
+                if pending and predicted_makespan is not None:
+                    log_makespan(scheduler.order.value, predicted_makespan, time.monotonic() - dispatch_start)
+
+            self._write_results()
+            completed = True
+        finally:
+            if cache is not None:
+                cache.evict()
+                cache.close()
+            # the journal is only needed to resume a run that did not write its results or to retry its failures
+            journal.close(delete=completed and not admission.failed)
+            scheduler.save()
+
+        if admission.failed:
+            logger.warning(f"{len(admission.failed)} prompts did not complete; run again with --retry-failed to retry "
+                           f"only those prompts")
 
-        log_run_start(verbose, len(self._decoder.prompts))
+        log_run_end(
+            verbose,
+            self._decoder.num_prompts,
+            round(time.time() - start, 2),
+            metrics.snapshot(),
+        )
+        if self._is_adaptive_concurrency():
+            log_concurrency_history(self.config["engine"].get("model_id", self.config["engine"]["type"]),
+                                    self._concurrency.history)
 
-        start = time()
+        create_markdown_summary()
 
-        with Progress(transient=True) as self._progress:
-            self._tracker = self._progress.add_task("running...", total=self._decoder.num_prompts)
-            self._run_concurrent()
+    def _estimate_run(self, no_cache: bool):
+        """
+        Estimates and prints what the run would cost: the prompts are coalesced, looked up in the response cache and
+        batched as in a real run, and only the requests left are estimated.
 
+        :param no_cache:
+        :return:
+        """
+        distinct_prompts = list(coalesce_prompts(self._prompts))
+        prompts = distinct_prompts
+        cache = None if no_cache else self._create_response_cache(refresh=False)
+        if cache is not None:
+            try:
+                # the instructions of dependent prompts are only known once their dependencies are generated
+                prompts = [prompt for prompt in prompts if prompt.get_dependencies() or cache.get(prompt) is None]
+            finally:
+                cache.close()
+        # dependent prompts are dispatched one by one as they become ready
+        dependents = [prompt for prompt in prompts if prompt.get_dependencies()]
+        independent = [prompt for prompt in prompts if not prompt.get_dependencies()]
+        requests, _ = self._create_scheduler().schedule(
+            self._fit_output_budget(self._decoder.batch(independent)) + dependents,
+            self._num_threads, PromptGraph(self._prompts))
+
+        estimator = RunEstimator(self.config["engine"], self.config.get("runner", {}).get("estimate"))
+        log_run_estimate(len(self._prompts), len(distinct_prompts) - len(prompts), self._num_threads,
+                         estimator.estimate_run(requests, self._num_threads))
+
+    def _write_results(self):
         if len(self._results) > 0:
             encoder_data = {
                         "results": self._results,
@@ -262,43 +470,161 @@ class Runner(BaseModel):
             for encoder in self._encoders:
                 encoder.encode(**encoder_data)
 
-        log_run_end(
-            # verbose,
-            # self._results,
-            # self._num_tests,
-            # self._pass_count,
-            # fail_count,
-            # round(time.time() - start, 2),
-            # sum(self._evaluator_input_token_counts),
-            # sum(self._evaluator_output_token_counts),
+        if self._manifest is not None:
+            self._manifest.save(self._decoder.prompts, self._results)
+
+    def _open_journal(self, resume: bool) -> RunJournal:
+        """
+        Opens the journal of finished prompts configured in the optional `runner.journal` block.
+
+        By default the journal is written next to the output deck, or to the working directory if there is none.
+
+        :param resume:
+        :return:
+        """
+        journal_config = self.config.get("runner", {}).get("journal", {})
+        output_path = find_output_deck(self.config["encoders"])
+        default_path = (f"{os.path.splitext(output_path)[0]}.journal.jsonl" if output_path is not None
+                        else defaults.JOURNAL_FILE_NAME)
+        journal = RunJournal(
+            path=journal_config.get("path", default_path),
+            engine_config=self.config["engine"],
+            batch_size=journal_config.get("batch_size", defaults.JOURNAL_BATCH_SIZE),
+            flush_interval=journal_config.get("flush_interval_seconds", defaults.JOURNAL_FLUSH_INTERVAL_SECONDS),
         )
+        journal.open(resume)
+        return journal
 
-        create_markdown_summary()
+    def _create_retry_policy(self) -> RetryPolicy:
+        """
+        Creates the policy for retrying failed prompts configured in the optional `runner.retry` block.
+
+        :return:
+        """
+        retry_config = self.config.get("runner", {}).get("retry", {})
+        return RetryPolicy(
+            max_attempts=retry_config.get("max_attempts", defaults.RETRY_MAX_ATTEMPTS),
+            base_delay=retry_config.get("base_delay_seconds", defaults.RETRY_BASE_DELAY_SECONDS),
+            max_delay=retry_config.get("max_delay_seconds", defaults.RETRY_MAX_DELAY_SECONDS),
+        )
+
+    def _create_response_cache(self, refresh: bool) -> Optional[ResponseCache]:
+        """
+        Opens the response cache configured in the optional `runner.cache` block, unless it is disabled there.
+
+        :param refresh:
+        :return:
+        """
+        cache_config = self.config.get("runner", {}).get("cache", {})
+        if not cache_config.get("enabled", True):
+            return None
+        return ResponseCache(
+            path=cache_config.get("path", defaults.RESPONSE_CACHE_PATH),
+            engine_config=self.config["engine"],
+            max_size_bytes=int(cache_config.get("max_size_mb", defaults.RESPONSE_CACHE_MAX_SIZE_MB) * 1024 * 1024),
+            max_age_seconds=cache_config.get("max_age_days", defaults.RESPONSE_CACHE_MAX_AGE_DAYS) * 24 * 3600,
+            refresh=refresh,
+        )
+
+    def _batch_prompts(self, prompts: list) -> list:
+        """
+        Lets the decoder combine the prompts left to generate into batch prompts, and records the number of engine
+        calls saved as the `batching.calls_saved` metric.
 
-    def _run_concurrent(self):
-        with concurrent.futures.ThreadPoolExecutor(
-            max_workers=self._num_threads
-        ) as executor:
-            futures = [
-                executor.submit(self._run_test, prompt) for prompt in self._decoder.prompts
-            ]
-            for future in concurrent.futures.as_completed(futures):
-                future.result()
-
-    def _run_test(self, prompt):
-        engine = self._engine_factory.create()
-        if isinstance(engine, WebSocketEngine):
-            engine.connect()
-            engine.wait_for_connection(timeout=2)
-        results = engine.invoke(prompt)
-
-        with self._lock:
-
-            # if result.passed is True:
-            #     self._pass_count += 1
-            # self._results[prompt.name] = result
-            # self._evaluator_input_token_counts.append(evaluator.input_token_count)
-            # self._evaluator_output_token_counts.append(evaluator.output_token_count)
-            self._results[prompt] = results
-            self._progress.update(self._tracker, advance=1)
+        :param prompts:
+        :return:
+        """
+        batched = self._fit_output_budget(self._decoder.batch(prompts))
+        if len(batched) < len(prompts):
+            metrics.increment("batching.batches", sum(isinstance(prompt, BatchPrompt) for prompt in batched))
+            metrics.increment("batching.calls_saved", len(prompts) - len(batched))
+        return batched
 
+    def _fit_output_budget(self, batched: list) -> list:
+        """
+        Splits the batch prompts whose expected output exceeds the engine's `max_tokens` into batches that fit it. The
+        response to a larger batch would be cut off, could not be split, and would fall back to one request per
+        prompt on top of the batch request.
+
+        :param batched:
+        :return:
+        """
+        estimator = RunEstimator(self.config["engine"], self.config.get("runner", {}).get("estimate"))
+        if not estimator.max_tokens:
+            return batched
+        fitted = []
+        for prompt in batched:
+            if not isinstance(prompt, BatchPrompt) or estimator.output_tokens(prompt) <= estimator.max_tokens:
+                fitted.append(prompt)
+                continue
+            chunks = [[]]
+            for member in prompt.prompts:
+                if chunks[-1] and estimator.output_tokens(BatchPrompt(chunks[-1] + [member])) > estimator.max_tokens:
+                    chunks.append([])
+                chunks[-1].append(member)
+            fitted.extend(BatchPrompt(chunk) if len(chunk) > 1 else chunk[0] for chunk in chunks)
+        return fitted
+
+    def _is_adaptive_concurrency(self) -> bool:
+        return self.config.get("runner", {}).get("concurrency", {}).get("type", "fixed") == "adaptive"
+
+    def _create_concurrency_controller(self) -> AimdConcurrencyController:
+        """
+        Creates the controller limiting the number of prompts in flight.
+
+        With the default `fixed` concurrency the limit is pinned to the number of threads (or the async concurrency).
+        With `adaptive` concurrency it starts at `initial` and follows AIMD between `min` and `max`, never exceeding
+        the number of threads.
+
+        :return:
+        """
+        concurrency_config = self.config.get("runner", {}).get("concurrency", {})
+        if not self._is_adaptive_concurrency():
+            return AimdConcurrencyController(initial=self._num_threads, minimum=self._num_threads,
+                                             maximum=self._num_threads)
+
+        maximum = min(concurrency_config.get("max", self._num_threads), self._num_threads)
+        return AimdConcurrencyController(
+            initial=min(concurrency_config.get("initial", defaults.ADAPTIVE_CONCURRENCY_INITIAL), maximum),
+            minimum=concurrency_config.get("min", 1),
+            maximum=maximum,
+            increase=concurrency_config.get("increase", 1),
+            decrease_factor=concurrency_config.get("decrease_factor", 0.5),
+        )
+
+    def _create_hedging_policy(self) -> Optional[HedgingPolicy]:
+        """
+        Creates the hedging policy configured in the optional `runner.hedging` block, and the factory of the engine
+        serving the hedged requests if the block has its own `engine` (the run's engine serves them otherwise).
+
+        :return:
+        """
+        hedging_config = self.config.get("runner", {}).get("hedging")
+        self._hedge_engine_factory = None
+        if not hedging_config or not hedging_config.get("enabled", True):
+            return None
+        if "engine" in hedging_config:
+            self._hedge_engine_factory = EngineFactory(config=hedging_config["engine"])
+        return HedgingPolicy(
+            percentile=hedging_config.get("percentile", defaults.HEDGING_PERCENTILE),
+            min_samples=hedging_config.get("min_samples", defaults.HEDGING_MIN_SAMPLES),
+            min_delay=hedging_config.get("min_delay_seconds", defaults.HEDGING_MIN_DELAY_SECONDS),
+            budget=hedging_config.get("budget", defaults.HEDGING_BUDGET),
+        )
+
+    def _create_scheduler(self) -> PromptScheduler:
+        """
+        Creates the scheduler ordering the prompts configured in the optional `runner.scheduling` block, and loads the
+        latency history of previous runs.
+
+        :return:
+        """
+        scheduling_config = self.config.get("runner", {}).get("scheduling", {})
+        scheduler = PromptScheduler(
+            path=scheduling_config.get("history_path", defaults.SCHEDULING_HISTORY_PATH),
+            engine_config=self.config["engine"],
+            estimator=RunEstimator(self.config["engine"], self.config.get("runner", {}).get("estimate")),
+            order=scheduling_config.get("order", defaults.SCHEDULING_ORDER),
+        )
+        scheduler.load()
+        return scheduler
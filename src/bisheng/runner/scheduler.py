@@ -0,0 +1,175 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import hashlib
+import json
+import logging
+import os
+import threading
+from enum import Enum
+from typing import Optional
+
+from bisheng.prompting.base_prompt import BasePrompt
+from bisheng.prompting.batch_prompt import BatchPrompt
+from bisheng.prompting.prompt_graph import PromptGraph, dependency_order
+from bisheng.runner.estimator import RunEstimator, simulate_makespan
+from bisheng.utils.hashing import generation_config
+
+logger = logging.getLogger(__name__)
+
+# Weight of the latest run in the calibration of the estimates, and the most prompts kept in the history
+_CALIBRATION_ALPHA = 0.2
+_MAX_PROMPTS = 5000
+
+
+class ScheduleOrder(Enum):
+    LONGEST_FIRST = "longest_first"
+    SHORTEST_FIRST = "shortest_first"
+    DECK = "deck"
+
+
+class PromptScheduler:
+    """Orders the prompts of a run by their predicted duration, learning from the latencies of previous runs.
+
+    A prompt's duration is predicted from the latency it had in a previous run, if it was generated before with the
+    same engine settings. Otherwise it is the estimate of `RunEstimator` (from the instruction length and the word
+    limit of the output format), scaled by a calibration factor learned from the ratio of actual to estimated
+    latencies of the engine. Dispatching the longest prompts first keeps a long prompt from starting last and setting
+    the wall time of the run on its own. A prompt that other prompts depend on is ranked by the longest chain of
+    prompts it starts, so that the critical path of the run starts first.
+
+    The history is a JSON file shared by all decks, saved at the end of each run.
+    """
+
+    def __init__(self, path: str, engine_config: dict, estimator: RunEstimator, order: str):
+        self.path = os.path.expanduser(path)
+        self.order = ScheduleOrder(order)
+        self._engine_config = generation_config(engine_config)
+        self._engine_key = self._hash(self._engine_config)
+        self._estimator = estimator
+        self._prompts: dict[str, float] = {}
+        self._calibrations: dict[str, float] = {}
+        self._observed: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path) as file:
+                history = json.load(file)
+            self._prompts = {key: float(seconds) for key, seconds in history.get("prompts", {}).items()}
+            self._calibrations = {key: float(value) for key, value in history.get("calibrations", {}).items()}
+        except (ValueError, AttributeError) as e:
+            logger.warning(f"Ignoring corrupt latency history {self.path}: {e}")
+
+    def predict(self, prompt: BasePrompt) -> float:
+        """
+        Returns the predicted duration of the prompt in seconds.
+
+        :param prompt:
+        :return:
+        """
+        seconds = self._prompts.get(self._key(prompt))
+        if seconds is not None:
+            return seconds
+        return self._estimator.estimate_prompt(prompt).seconds * self._calibrations.get(self._engine_key, 1.0)
+
+    def schedule(self, prompts: list[BasePrompt], concurrency: int,
+                 graph: Optional[PromptGraph] = None) -> tuple[list[BasePrompt], float]:
+        """
+        Orders the prompts for dispatch and predicts the makespan of the run with CONCURRENCY prompts in flight.
+
+        With the GRAPH of the run, the prompts waiting for others are dispatched as they become ready, and the
+        predicted makespan is at least the longest chain of dependent prompts.
+
+        :param prompts: The prompts ready to dispatch.
+        :param concurrency:
+        :param graph:
+        :return: The prompts in dispatch order and the predicted makespan in seconds.
+        """
+        durations = {prompt: self.predict(prompt) for prompt in prompts}
+        ranks = {}
+        priorities = durations if graph is None else {prompt: self._rank(prompt, graph, durations, ranks)
+                                                      for prompt in prompts}
+        if self.order is ScheduleOrder.LONGEST_FIRST:
+            prompts = sorted(prompts, key=priorities.get, reverse=True)
+        elif self.order is ScheduleOrder.SHORTEST_FIRST:
+            prompts = sorted(prompts, key=priorities.get)
+        makespan = simulate_makespan([durations[prompt] for prompt in prompts], concurrency)
+        return prompts, max([makespan, *priorities.values()])
+
+    def _rank(self, prompt: BasePrompt, graph: PromptGraph, durations: dict, ranks: dict) -> float:
+        """
+        Returns the predicted duration of the longest chain of prompts starting with the prompt.
+
+        :param prompt:
+        :param graph:
+        :param durations: The predicted durations of the prompts ready to dispatch.
+        :param ranks: The ranks computed so far, keyed by prompt.
+        :return:
+        """
+        if prompt not in ranks:
+            # ranked from the ends of the chains back rather than recursively, so that long chains of shapes do not hit
+            # the recursion limit
+            members = prompt.prompts if isinstance(prompt, BatchPrompt) else [prompt]
+            descendants = {descendant: None for member in members for descendant in graph.descendants(member)
+                           if descendant not in ranks}
+            for ranked in [*reversed(dependency_order(list(descendants))), prompt]:
+                ranked_members = ranked.prompts if isinstance(ranked, BatchPrompt) else [ranked]
+                ranks[ranked] = (durations[ranked] if ranked in durations else self.predict(ranked)) + max(
+                    (ranks[dependent] for member in ranked_members for dependent in graph.dependents(member)),
+                    default=0.0)
+        return ranks[prompt]
+
+    def observe(self, prompt: BasePrompt, seconds: float):
+        """
+        Records the latency of a prompt that completed in this run.
+
+        :param prompt:
+        :param seconds:
+        :return:
+        """
+        estimate = self._estimator.estimate_prompt(prompt).seconds
+        with self._lock:
+            self._observed[self._key(prompt)] = (seconds, estimate)
+
+    def save(self):
+        """
+        Adds the latencies observed in this run to the history, updates the engine's calibration and writes the
+        history. A history that cannot be written is logged and skipped.
+
+        :return:
+        """
+        with self._lock:
+            observed = dict(self._observed)
+        if not observed:
+            return
+
+        for key, (seconds, _) in observed.items():
+            # re-inserted so that the oldest prompts are dropped first
+            self._prompts.pop(key, None)
+            self._prompts[key] = round(seconds, 3)
+        for key in list(self._prompts)[:max(len(self._prompts) - _MAX_PROMPTS, 0)]:
+            del self._prompts[key]
+
+        ratio = sum(seconds for seconds, _ in observed.values()) / sum(estimate for _, estimate in observed.values())
+        calibration = self._calibrations.get(self._engine_key)
+        self._calibrations[self._engine_key] = round(
+            ratio if calibration is None else calibration + _CALIBRATION_ALPHA * (ratio - calibration), 4)
+
+        # the history only speeds up later runs, so failing to write it must not fail this one
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temporary_path = f"{self.path}.tmp"
+            with open(temporary_path, "w") as file:
+                json.dump({"calibrations": self._calibrations, "prompts": self._prompts}, file)
+            os.replace(temporary_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write latency history {self.path}: {e}")
+
+    def _key(self, prompt: BasePrompt) -> str:
+        return self._hash({"engine": self._engine_config, "prompt": prompt.to_json()})
+
+    @staticmethod
+    def _hash(value) -> str:
+        return hashlib.sha256(json.dumps(value, sort_keys=True, default=str).encode()).hexdigest()
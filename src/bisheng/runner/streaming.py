@@ -0,0 +1,40 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+from typing import Iterator, Optional
+
+from bisheng.decoders.base_decoder import BaseDecoder
+from bisheng.prompting.prompt_graph import dependency_order, with_dependencies
+from bisheng.runner.admission import PromptAdmission, coalescing_key
+from bisheng.runner.manifest import ShapeManifest
+from bisheng.utils.metrics import metrics
+
+
+class PromptStream:
+    """Decodes the deck lazily and yields the prompts to dispatch as they are decoded, once the admission served the
+    ones found in the journal or the cache, then sets the total of the progress bar.
+
+    Unchanged shapes, according to the `manifest`, are only dispatched when a changed shape decoded after them depends
+    on them.
+    """
+
+    def __init__(self, decoder: BaseDecoder, admission: PromptAdmission, manifest: Optional[ShapeManifest] = None):
+        self._decoder = decoder
+        self._admission = admission
+        self._manifest = manifest
+
+    def __iter__(self) -> Iterator:
+        unchanged = set()
+        # the first prompt decoded with each request, keyed by its coalescing key
+        leaders = {}
+        for prompt in self._decoder.iter_prompts():
+            if self._manifest is not None and not self._manifest.changed([prompt]):
+                metrics.increment("manifest.unchanged_shapes")
+                unchanged.add(prompt)
+                continue
+            needed = ([prompt] if not prompt.get_dependencies() or not unchanged
+                      else dependency_order(with_dependencies([prompt], self._decoder.prompts)))
+            for added in needed:
+                if added is prompt or added in unchanged:
+                    unchanged.discard(added)
+                    yield from self._admission.add(added, leaders.setdefault(coalescing_key(added), added))
+        self._admission.update_total()
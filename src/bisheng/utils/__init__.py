@@ -1,5 +1,16 @@
-from .aws import create_boto3_client, generate_cognito_jwt_token
+from .aws import (
+    create_boto3_client,
+    generate_cognito_jwt_token,
+    sign_request,
+    is_throttling_error,
+    is_timeout_error,
+    is_connection_error,
+    register_throttling_listener,
+    CognitoTokenProvider
+)
 from .imports import import_class
 from .logging import log_run_start
 
-__all__ = ["create_boto3_client", "generate_cognito_jwt_token", "import_class", "log_run_start"]
+__all__ = ["create_boto3_client", "generate_cognito_jwt_token", "sign_request", "is_throttling_error",
+           "is_timeout_error", "is_connection_error", "register_throttling_listener", "CognitoTokenProvider", "import_class",
+           "log_run_start"]
@@ -1,8 +1,29 @@
-from typing import Optional
+import logging
+import threading
+import time
+from typing import Callable, Optional
 
+import aiohttp
 import boto3
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
 from botocore.client import BaseClient
 from botocore.config import Config
+from botocore.credentials import Credentials
+from botocore.exceptions import ClientError, ConnectionClosedError, ConnectTimeoutError, ReadTimeoutError
+from botocore.exceptions import ConnectionError as EndpointConnectionError
+
+from bisheng.utils import defaults
+from bisheng.utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+_THROTTLING_ERROR_CODES = {
+    "ThrottlingException",
+    "TooManyRequestsException",
+    "ServiceQuotaExceededException",
+    "RequestLimitExceeded",
+}
 
 
 def create_boto3_client(
@@ -20,6 +41,83 @@ def create_boto3_client(
     return session.client(boto3_service_name, config=config)
 
 
+def is_throttling_error(error: BaseException) -> bool:
+    """
+    Whether the error means the service is shedding load: a throttling error code or an HTTP 429.
+
+    :param error:
+    :return:
+    """
+    if isinstance(error, ClientError):
+        return _is_throttling_response(error.response)
+    return False
+
+
+def _is_throttling_response(parsed: dict) -> bool:
+    code = parsed.get("Error", {}).get("Code")
+    status = parsed.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return code in _THROTTLING_ERROR_CODES or status == 429
+
+
+def register_throttling_listener(client: BaseClient, listener: Callable[[], None]):
+    """
+    Calls LISTENER each time botocore is about to retry a throttled attempt made by CLIENT.
+
+    Adaptive and standard retries absorb throttling inside the client, so callers otherwise only see it as latency.
+
+    :param client:
+    :param listener:
+    :return:
+    """
+    def on_needs_retry(response=None, **kwargs):
+        if response is not None and _is_throttling_response(response[1]):
+            listener()
+
+    client.meta.events.register("needs-retry", on_needs_retry)
+
+
+def is_timeout_error(error: BaseException) -> bool:
+    return isinstance(error, (TimeoutError, ReadTimeoutError, ConnectTimeoutError))
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """
+    Returns whether ERROR means the engine's connection is unusable: a websocket or HTTP connection that closed, or an
+    endpoint that could not be reached.
+
+    :param error:
+    :return:
+    """
+    return isinstance(error, (ConnectionError, EndpointConnectionError, ConnectionClosedError,
+                              aiohttp.ClientConnectionError))
+
+
+def sign_request(
+        credentials: Credentials,
+        service_name: str,
+        aws_region: str,
+        method: str,
+        url: str,
+        headers: dict,
+        body: bytes
+) -> dict:
+    """
+    Signs an HTTP request with SigV4 and returns the headers to send, including the authorization headers.
+
+    :param credentials:
+    :param service_name:
+    :param aws_region:
+    :param method:
+    :param url:
+    :param headers:
+    :param body:
+    :return:
+    """
+    request = AWSRequest(method=method, url=url, data=body, headers=headers)
+    SigV4Auth(credentials.get_frozen_credentials(), service_name, aws_region).add_auth(request)
+    return dict(request.headers.items())
+
+
 def generate_cognito_jwt_token(
         client: BaseClient,
         app_client_id: str,
@@ -33,3 +131,125 @@ def generate_cognito_jwt_token(
     )
     token = response["AuthenticationResult"]["AccessToken"]
     return token
+
+
+class CognitoTokenProvider:
+    """A process-wide, auto-refreshing cache of Cognito access tokens.
+
+    One provider exists per app client and user. The first call to `get_token` authenticates with
+    `USER_PASSWORD_AUTH`; later calls return the cached access token until it is within `refresh_margin` seconds of
+    expiring, at which point it is renewed with `REFRESH_TOKEN_AUTH`. Concurrent callers that find the token stale
+    wait on a single refresh instead of each authenticating.
+    """
+
+    _instances: dict[tuple, "CognitoTokenProvider"] = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(
+        self,
+        client: BaseClient,
+        app_client_id: str,
+        user_name: str,
+        password: str,
+        refresh_margin: float = defaults.COGNITO_REFRESH_MARGIN_SECONDS,
+    ):
+        self._client = client
+        self._app_client_id = app_client_id
+        self._user_name = user_name
+        self._password = password
+        self._refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._access_token: Optional[str] = None
+        self._refresh_token: Optional[str] = None
+        self._expires_at = 0.0
+
+    @classmethod
+    def get_instance(
+        cls,
+        app_client_id: str,
+        user_name: str,
+        password: str,
+        aws_profile: Optional[str],
+        aws_region: Optional[str],
+        endpoint_url: Optional[str],
+        max_retry: int = 10,
+        retry_mode: str = "adaptive",
+    ) -> "CognitoTokenProvider":
+        """
+        Returns the shared provider for the given app client and user, creating it on first use.
+
+        :param app_client_id:
+        :param user_name:
+        :param password:
+        :param aws_profile:
+        :param aws_region:
+        :param endpoint_url:
+        :param max_retry:
+        :param retry_mode:
+        :return:
+        """
+        key = (app_client_id, user_name, aws_profile, aws_region)
+        with cls._instances_lock:
+            if key not in cls._instances:
+                client = create_boto3_client(
+                    boto3_service_name="cognito-idp",
+                    aws_profile=aws_profile,
+                    aws_region=aws_region,
+                    endpoint_url=endpoint_url,
+                    max_retry=max_retry,
+                    retry_mode=retry_mode
+                )
+                cls._instances[key] = cls(client, app_client_id, user_name, password)
+            return cls._instances[key]
+
+    def get_token(self) -> str:
+        if self._is_fresh():
+            metrics.increment("cognito.cache_hits")
+            return self._access_token
+
+        with self._lock:
+            # another thread may have refreshed the token while this one waited for the lock
+            if not self._is_fresh():
+                self._authenticate()
+            else:
+                metrics.increment("cognito.cache_hits")
+            return self._access_token
+
+    def invalidate(self):
+        """
+        Forces the next `get_token` call to renew the access token, e.g. after the service rejected it.
+
+        :return:
+        """
+        with self._lock:
+            self._expires_at = 0.0
+
+    def _is_fresh(self) -> bool:
+        return self._access_token is not None and time.monotonic() < self._expires_at - self._refresh_margin
+
+    def _authenticate(self):
+        result = None
+        if self._refresh_token:
+            try:
+                result = self._initiate_auth("REFRESH_TOKEN_AUTH", {"REFRESH_TOKEN": self._refresh_token})
+            except ClientError as e:
+                logger.debug(f"Refreshing the Cognito token failed, signing in again: {e}")
+                self._refresh_token = None
+        if result is None:
+            result = self._initiate_auth("USER_PASSWORD_AUTH", {"USERNAME": self._user_name,
+                                                                "PASSWORD": self._password})
+
+        self._access_token = result["AccessToken"]
+        # the refresh flow does not return a new refresh token, keep the one from the initial sign-in
+        self._refresh_token = result.get("RefreshToken", self._refresh_token)
+        self._expires_at = time.monotonic() + result.get("ExpiresIn", defaults.COGNITO_DEFAULT_TOKEN_TTL_SECONDS)
+
+    def _initiate_auth(self, auth_flow: str, auth_parameters: dict) -> dict:
+        with metrics.timer("cognito.auth_seconds"):
+            response = self._client.initiate_auth(
+                ClientId=self._app_client_id,
+                AuthFlow=auth_flow,
+                AuthParameters=auth_parameters,
+            )
+        metrics.increment("cognito.auth_calls")
+        return response["AuthenticationResult"]
@@ -0,0 +1,61 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+from pptx.shapes.base import BaseShape
+from pptx.slide import Slide, Slides
+
+
+class DeckIndex:
+    """The slides and shapes of a deck, with the position of each keyed by `(slide_id, shape_id)`.
+
+    python-pptx rebuilds the sequences of slides and shapes from the XML on every access, so `slides.index(slide)` and
+    `slide.shapes.index(shape)` are linear and looking up every shape of a deck is quadratic. The index reads the deck
+    once, through the public API. The prompts, shots and output decks are structurally identical, so a shape's
+    position in the prompts deck locates it in the others.
+    """
+
+    def __init__(self, slides: Slides):
+        self._slides: list[Slide] = []
+        self._shapes: list[list[BaseShape]] = []
+        self._slide_ids = {}
+        self._slide_positions: dict[int, int] = {}
+        self._shape_positions: dict[tuple[int, int], int] = {}
+        for slide_position, slide in enumerate(slides):
+            slide_id = slide.slide_id
+            self._slides.append(slide)
+            self._shapes.append(list(slide.shapes))
+            self._slide_ids[slide.part] = slide_id
+            self._slide_positions[slide_id] = slide_position
+            for shape_position, shape in enumerate(self._shapes[slide_position]):
+                self._shape_positions[(slide_id, shape.shape_id)] = shape_position
+
+    def slide_id(self, slide: Slide) -> int:
+        return self._slide_ids[slide.part]
+
+    def slide_position(self, slide_id: int) -> int:
+        return self._slide_positions[slide_id]
+
+    def position(self, slide_id: int, shape_id: int) -> tuple[int, int]:
+        """
+        Returns the position of the slide in the deck and of the shape on the slide.
+
+        :param slide_id:
+        :param shape_id:
+        :return:
+        """
+        return self._slide_positions[slide_id], self._shape_positions[(slide_id, shape_id)]
+
+    def locate(self, slide: Slide, shape: BaseShape) -> tuple[int, int]:
+        """
+        Returns the position of a slide of the deck and of one of its shapes.
+
+        :param slide:
+        :param shape:
+        :return:
+        """
+        return self.position(self.slide_id(slide), shape.shape_id)
+
+    def get_slide(self, slide_position: int) -> Slide:
+        return self._slides[slide_position]
+
+    def get_shape(self, slide_position: int, shape_position: int) -> BaseShape:
+        return self._shapes[slide_position][shape_position]
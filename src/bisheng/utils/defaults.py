@@ -24,7 +24,68 @@ SYSTEM_PROMPT_PATTERN = r"<SYSTEM>(.*)</SYSTEM>"
 GENERATE_PROMPT_PATTERN = r"<GENERATE>(.*)</GENERATE>"
 GENERATE_CHART_PROMPT_PATTERN = r"<GENERATE_CHART>(.*)</GENERATE_CHART>"
 OUTPUT_PROMPT_PATTERN = r"<FORMAT>(.*)</FORMAT>"
+# A shape whose generated text a shape needs, referenced inline (shapes listed in a <DEPENDS> tag become references)
+REFERENCE_PATTERN = r"\{\{ref:(.*?)\}\}"
 # Default max number of threads not exceeding Bedrock service quota:
 # https://docs.aws.amazon.com/bedrock/latest/userguide/quotas.html
 MAX_NUM_THREADS = 45
+# Default max number of prompts in flight on the event loop in async mode
+MAX_ASYNC_CONCURRENCY = 256
+# Number of prompts in flight when adaptive concurrency starts, before it grows with successful calls
+ADAPTIVE_CONCURRENCY_INITIAL = 2
 CONFIG_FILE_NAME = "bisheng.yaml"
+# Renew Cognito access tokens this many seconds before they expire
+COGNITO_REFRESH_MARGIN_SECONDS = 300
+COGNITO_DEFAULT_TOKEN_TTL_SECONDS = 3600
+# GAAB websocket connections shared by all engines, and prompts multiplexed on each connection; together enough for
+# each of the MAX_NUM_THREADS worker threads to have a prompt in flight
+GAAB_NUM_CONNECTIONS = 6
+GAAB_MAX_IN_FLIGHT_PER_CONNECTION = 8
+# Characters per token used to estimate request sizes for client-side rate limiting
+ESTIMATED_CHARS_PER_TOKEN = 3.5
+# Local response cache, so that reruns only invoke the engine for prompts that changed
+RESPONSE_CACHE_PATH = "~/.cache/bisheng/responses.sqlite3"
+RESPONSE_CACHE_MAX_SIZE_MB = 512
+RESPONSE_CACHE_MAX_AGE_DAYS = 30
+# Journal of finished prompts used by `bisheng run --resume`, fsynced in batches
+JOURNAL_FILE_NAME = "bisheng.journal.jsonl"
+JOURNAL_BATCH_SIZE = 32
+JOURNAL_FLUSH_INTERVAL_SECONDS = 1.0
+# Deadlines: a prompt fails as timed out after PROMPT_TIMEOUT_SECONDS, and a stream without tokens for
+# STALL_TIMEOUT_SECONDS is resent up to STALL_RETRIES times
+PROMPT_TIMEOUT_SECONDS = 600
+STALL_TIMEOUT_SECONDS = 120
+STALL_RETRIES = 1
+# Failed prompts: throttled, timed out and disconnected prompts are dispatched up to RETRY_MAX_ATTEMPTS times, with
+# a random backoff of up to RETRY_BASE_DELAY_SECONDS * 2 ** attempt, capped at RETRY_MAX_DELAY_SECONDS
+RETRY_MAX_ATTEMPTS = 3
+RETRY_BASE_DELAY_SECONDS = 1.0
+RETRY_MAX_DELAY_SECONDS = 20.0
+# Hedging: a prompt outstanding longer than the HEDGING_PERCENTILE of the observed latencies (once HEDGING_MIN_SAMPLES
+# are known, and at least HEDGING_MIN_DELAY_SECONDS) is sent again, for at most a HEDGING_BUDGET fraction of prompts
+HEDGING_PERCENTILE = 95
+HEDGING_MIN_SAMPLES = 20
+HEDGING_MIN_DELAY_SECONDS = 1.0
+HEDGING_BUDGET = 0.1
+# Engine router: a backend's circuit opens after ROUTER_FAILURE_THRESHOLD consecutive failures, and a trial request is
+# let through after ROUTER_RECOVERY_SECONDS
+ROUTER_FAILURE_THRESHOLD = 5
+ROUTER_RECOVERY_SECONDS = 30.0
+# Context retrieval: the context is split in chunks of RETRIEVAL_CHUNK_SIZE words overlapping by
+# RETRIEVAL_CHUNK_OVERLAP words, and each prompt receives its RETRIEVAL_TOP_K most relevant chunks
+RETRIEVAL_CHUNK_SIZE = 200
+RETRIEVAL_CHUNK_OVERLAP = 40
+RETRIEVAL_TOP_K = 4
+RETRIEVAL_CACHE_DIR = "~/.cache/bisheng/context_index"
+# Dry-run estimates: a request takes ESTIMATED_FIRST_TOKEN_SECONDS plus its output tokens at
+# ESTIMATED_OUTPUT_TOKENS_PER_SECOND. Output is the rationale plus the word limit of the output format (or
+# ESTIMATED_OUTPUT_TOKENS without one)
+ESTIMATED_FIRST_TOKEN_SECONDS = 1.5
+ESTIMATED_OUTPUT_TOKENS_PER_SECOND = 40
+ESTIMATED_RATIONALE_TOKENS = 120
+ESTIMATED_TOKENS_PER_WORD = 1.35
+ESTIMATED_OUTPUT_TOKENS = 250
+# Prompt scheduling: prompts are dispatched in SCHEDULING_ORDER of their expected duration, predicted from the
+# latencies of previous runs kept in SCHEDULING_HISTORY_PATH
+SCHEDULING_ORDER = "longest_first"
+SCHEDULING_HISTORY_PATH = "~/.cache/bisheng/latency_history.json"
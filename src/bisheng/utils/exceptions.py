@@ -8,3 +8,19 @@ class PrintFailureError(Exception):
         self.message = message
         super().__init__(self.message)
 
+
+
+class PromptTimeoutError(TimeoutError):
+    """Raised when a prompt misses its deadline."""
+
+
+class StreamStalledError(PromptTimeoutError):
+    """Raised when a streamed response received no tokens for longer than the stall timeout."""
+
+
+class PromptCancelledError(Exception):
+    """Raised in a prompt cancelled by the runner while it was in flight."""
+
+
+class DependencyCycleError(ValueError):
+    """Raised when shapes depend on each other's generated text in a cycle."""
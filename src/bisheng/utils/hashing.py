@@ -0,0 +1,56 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import hashlib
+import json
+
+# Engine settings that change how a request is sent, not what the model generates
+_TRANSPORT_KEYS = {
+    "aws_profile", "max_retry", "retry_mode", "rate_limit", "num_connections", "max_in_flight_per_connection",
+    "password", "weight", "max_in_flight", "failure_threshold", "recovery_seconds",
+}
+
+
+def generation_config(engine_config: dict) -> dict:
+    """
+    Returns the engine settings that affect what the model generates, without transport settings and secrets.
+
+    :param engine_config:
+    :return:
+    """
+    config = {k: v for k, v in engine_config.items() if k not in _TRANSPORT_KEYS}
+    if "backends" in config:
+        # the backends of an engine router
+        config["backends"] = [generation_config(backend) for backend in config["backends"]]
+    return config
+
+
+def hash_request(engine_config: dict, system_prompt: str, instruction: str) -> str:
+    """
+    Returns a hash identifying the generation a request asks for: the engine settings that affect the output (engine
+    type, model, hyperparameters, ...), the system prompt and the instruction.
+
+    :param engine_config:
+    :param system_prompt:
+    :param instruction:
+    :return:
+    """
+    request = {
+        "engine": generation_config(engine_config),
+        "system_prompt": system_prompt,
+        "instruction": instruction,
+    }
+    return hashlib.sha256(json.dumps(request, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def hash_file(path: str) -> str:
+    """
+    Returns the SHA-256 of a file's content.
+
+    :param path:
+    :return:
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
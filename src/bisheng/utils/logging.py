@@ -9,5 +9,35 @@ def log_run_start(verbose: bool, num_threads: int):
         logger.info(f"Number of threads: {num_threads}")
 
 
-def log_run_end():
-    pass
+def log_run_end(verbose: bool, num_prompts: int, duration: float, stats: dict):
+    logger.info(f"Generated {num_prompts} prompts in {duration}s")
+    for name, value in stats.items():
+        if isinstance(value, dict):
+            if not verbose:
+                value = {k: v for k, v in value.items() if k in ("count", "total")}
+            value = ", ".join(f"{k}={v}" for k, v in value.items())
+        logger.info(f"{name}: {value}")
+
+
+def log_run_estimate(num_shapes: int, num_cached: int, concurrency: int, estimate):
+    logger.info(f"Dry run: {num_shapes} shapes to generate, {num_cached} served from the response cache, "
+                f"{estimate.requests} requests to send")
+    logger.info(f"Estimated tokens: {estimate.input_tokens} input, {estimate.output_tokens} output "
+                f"({estimate.reserved_tokens} reserved against the tokens-per-minute quota)")
+    if estimate.cost is not None:
+        logger.info(f"Estimated cost: ${estimate.cost:.2f}")
+    logger.info(f"Estimated duration: {round(estimate.wall_seconds, 1)}s at concurrency {concurrency}, bound by "
+                f"{estimate.bound.replace('_', ' ')} ({round(estimate.serial_seconds, 1)}s one at a time)")
+    logger.info(f"Projected throughput: {round(estimate.requests_per_minute, 1)} requests/min, "
+                f"{round(estimate.tokens_per_minute)} tokens/min")
+
+
+def log_concurrency_history(model_id: str, history: list[tuple[float, int]]):
+    limits = [limit for _, limit in history]
+    logger.info(f"Adaptive concurrency for {model_id}: started at {limits[0]}, ranged {min(limits)}-{max(limits)}, "
+                f"ended at {limits[-1]}")
+    logger.info("Concurrency over time: " + ", ".join(f"{elapsed}s={limit}" for elapsed, limit in history))
+
+
+def log_makespan(order: str, predicted: float, actual: float):
+    logger.info(f"Makespan ({order.replace('_', ' ')}): predicted {round(predicted, 1)}s, actual {round(actual, 1)}s")
@@ -0,0 +1,64 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import threading
+import time
+from contextlib import contextmanager
+
+
+class MetricsRegistry:
+    """Thread-safe counters and timings collected while a print job runs.
+
+    Counters are plain integers (e.g. number of engines created). Observations are samples such as latencies in
+    seconds, summarised as count, total, mean and max.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[str, int] = {}
+        self._observations: dict[str, list[float]] = {}
+
+    def increment(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            self._observations.setdefault(name, []).append(value)
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def get(self, name: str, default: int = 0) -> int:
+        with self._lock:
+            return self._counters.get(name, default)
+
+    def snapshot(self) -> dict:
+        """
+        Returns a copy of all counters and summarised observations, sorted by name.
+
+        :return:
+        """
+        with self._lock:
+            snapshot = dict(self._counters)
+            for name, values in self._observations.items():
+                snapshot[name] = {
+                    "count": len(values),
+                    "total": round(sum(values), 3),
+                    "mean": round(sum(values) / len(values), 3),
+                    "max": round(max(values), 3),
+                }
+        return dict(sorted(snapshot.items()))
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._observations.clear()
+
+
+# process-wide registry shared by engines and the runner
+metrics = MetricsRegistry()
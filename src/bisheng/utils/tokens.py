@@ -0,0 +1,18 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import math
+
+from bisheng.utils import defaults
+
+
+def estimate_tokens(*texts: str) -> int:
+    """
+    Estimates the number of tokens in the given texts without calling a tokenizer.
+
+    The estimate errs on the high side (about 3.5 characters per token for English prose), since it is used to
+    reserve quota before a request is sent and is reconciled with the actual usage afterwards.
+
+    :param texts:
+    :return:
+    """
+    return sum(math.ceil(len(text) / defaults.ESTIMATED_CHARS_PER_TOKEN) for text in texts if text)
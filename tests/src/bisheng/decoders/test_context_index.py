@@ -0,0 +1,42 @@
+from bisheng.decoders.context_index import ContextIndex
+
+_CONTEXT = " ".join([
+    "The customer operates retail stores across Europe and sells outdoor equipment.",
+    "Revenue grew twelve percent last year driven by online sales of tents.",
+    "The security team requires encryption at rest for every customer record.",
+    "Headquarters moved to Berlin and the board approved a new sustainability strategy.",
+])
+
+
+def test_build_chunks_with_overlap():
+    index = ContextIndex.build("one two three four five six seven", chunk_size=4, chunk_overlap=1)
+
+    assert index.chunks == ["one two three four", "four five six seven"]
+
+
+def test_search_returns_most_relevant_chunks_in_context_order():
+    index = ContextIndex.build(_CONTEXT, chunk_size=12, chunk_overlap=0)
+
+    [result] = index.search("Summarize encryption requirements", top_k=1)
+    assert "encryption at rest" in result
+    results = index.search("online revenue growth and sustainability strategy", top_k=2)
+    assert len(results) == 2
+    assert _CONTEXT.index(results[0]) < _CONTEXT.index(results[1])
+
+
+def test_search_without_matching_terms_returns_nothing():
+    index = ContextIndex.build(_CONTEXT, chunk_size=12, chunk_overlap=0)
+
+    assert index.search("quantum chromodynamics", top_k=3) == []
+
+
+def test_index_is_cached_by_context(tmp_path):
+    first = ContextIndex.load_or_build(_CONTEXT, chunk_size=12, chunk_overlap=2, cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 1
+
+    cached = ContextIndex.load_or_build(_CONTEXT, chunk_size=12, chunk_overlap=2, cache_dir=str(tmp_path))
+
+    assert cached.chunks == first.chunks
+    assert cached.search("encryption", top_k=1) == first.search("encryption", top_k=1)
+    ContextIndex.load_or_build(_CONTEXT + " More.", chunk_size=12, chunk_overlap=2, cache_dir=str(tmp_path))
+    assert len(list(tmp_path.iterdir())) == 2
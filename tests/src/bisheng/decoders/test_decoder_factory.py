@@ -1,5 +1,5 @@
 # from bisheng.decoders.pptx_decoder import PptxDecoder
-# from src.bisheng.decoders import decoder_factory
+# from bisheng.decoders import decoder_factory
 # import pytest
 #
 #
@@ -14,7 +14,7 @@
 
 import pytest
 from unittest.mock import patch, MagicMock
-from src.bisheng.decoders.decoder_factory import DecoderFactory, PptxDecoder, BaseDecoder
+from bisheng.decoders.decoder_factory import DecoderFactory, PptxDecoder, BaseDecoder
 
 
 # Test case for creating a known decoder type
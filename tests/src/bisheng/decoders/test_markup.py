@@ -0,0 +1,67 @@
+import re
+from unittest.mock import MagicMock, PropertyMock
+
+import pytest
+
+from bisheng.decoders.markup import MarkupScanner, scan_markup
+from bisheng.utils.defaults import (
+    SYSTEM_PROMPT_PATTERN,
+    GENERATE_PROMPT_PATTERN,
+    GENERATE_CHART_PROMPT_PATTERN,
+    OUTPUT_PROMPT_PATTERN
+)
+
+_PATTERNS = {
+    "SYSTEM": SYSTEM_PROMPT_PATTERN,
+    "GENERATE": GENERATE_PROMPT_PATTERN,
+    "GENERATE_CHART": GENERATE_CHART_PROMPT_PATTERN,
+    "FORMAT": OUTPUT_PROMPT_PATTERN,
+}
+
+
+def _findall(text: str) -> dict[str, str]:
+    """The tags as the decoder extracted them with one `re.findall` per tag."""
+    markup = {}
+    for name, pattern in _PATTERNS.items():
+        matches = re.findall(pattern, text.strip(), re.DOTALL)
+        if matches:
+            markup[name] = matches[0]
+    return markup
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "Plain text without tags",
+    "<GENERATE>Tell about the climate.</GENERATE>\n<FORMAT>At most 50 words.</FORMAT>",
+    "  <GENERATE>\n multi\n line \n</GENERATE>  ",
+    "<GENERATE></GENERATE>",
+    "<GENERATE>first</GENERATE> and <GENERATE>second</GENERATE>",
+    "<GENERATE>unclosed",
+    "</GENERATE> closed before <GENERATE>opened",
+    "</GENERATE><GENERATE>x</GENERATE>",
+    "<GENERATE_CHART>chart</GENERATE_CHART><GENERATE>text</GENERATE>",
+    "<GENERATE>a <FORMAT>nested</FORMAT> b</GENERATE>",
+    "<SYSTEM>You are an architect.</SYSTEM> notes",
+    "<generate>lower case</generate> <GENERATE >spaced</GENERATE>",
+    "<FORMAT>one</FORMAT><FORMAT>two",
+])
+def test_scan_matches_greedy_patterns(text):
+    markup = scan_markup(text)
+
+    assert {name: value for name, value in markup.items() if name in _PATTERNS} == _findall(text)
+
+
+def test_scan_extracts_depends():
+    assert scan_markup("<GENERATE>Agenda</GENERATE><DEPENDS>Title 1, 2/Body</DEPENDS>")["DEPENDS"] == "Title 1, 2/Body"
+
+
+def test_scanner_reads_each_text_frame_once():
+    shape = MagicMock(shape_id=4, has_text_frame=True)
+    text = PropertyMock(return_value="<GENERATE>x</GENERATE><FORMAT>y</FORMAT>")
+    type(shape.text_frame).text = text
+    scanner = MarkupScanner()
+
+    assert scanner.scan_shape(256, shape) == {"GENERATE": "x", "FORMAT": "y"}
+    assert scanner.scan_shape(256, shape)["GENERATE"] == "x"
+    assert text.call_count == 1
+    assert scanner.scan_shape(256, MagicMock(shape_id=5, has_text_frame=False)) == {}
@@ -1,6 +1,6 @@
 from bisheng.encoders.pptx_encoder import PptxEncoder
 from bisheng.encoders.transparency_report_encoder import TransparencyReportEncoder
-from src.bisheng.encoders import encoder_factory
+from bisheng.encoders import encoder_factory
 import pytest
 
 
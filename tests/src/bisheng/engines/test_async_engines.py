@@ -0,0 +1,199 @@
+import asyncio
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+import websockets
+
+from bisheng.engines.bedrock.driver import BedrockEngine
+from bisheng.engines.gaab.driver import GaabStreamingEngine
+from bisheng.engines.request_context import RequestContext, request_context
+from bisheng.utils.exceptions import PromptTimeoutError
+
+
+def _prompt(text):
+    prompt = MagicMock()
+    prompt.get_system_prompt.return_value = "system"
+    prompt.get_instruction_prompt.return_value = text
+    return prompt
+
+
+class FakeBedrockServer:
+    """A local HTTP endpoint answering InvokeModel requests with the instruction it received."""
+
+    def __init__(self, throttle_first=0):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = []
+        self.throttle_first = throttle_first
+
+    async def handle(self, reader, writer):
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            headers = {}
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode().partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = json.loads(await reader.readexactly(int(headers["content-length"])))
+            self.requests.append((request_line.decode(), headers, body))
+
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.05)
+            self.in_flight -= 1
+
+            if self.throttle_first > 0:
+                self.throttle_first -= 1
+                status, extra, payload = "429 Too Many Requests", "x-amzn-ErrorType: ThrottlingException\r\n", \
+                    {"message": "Too many requests"}
+            else:
+                text = body["messages"][0]["content"][0]["text"]
+                status, extra, payload = "200 OK", "", {
+                    "content": [{"type": "text", "text": f"<rationale>r</rationale><response>{text}</response>"}]}
+            data = json.dumps(payload).encode()
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n{extra}"
+                         f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+            await writer.drain()
+        writer.close()
+
+
+@pytest.fixture
+def aws_credentials(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.delenv("AWS_PROFILE", raising=False)
+
+
+def _bedrock_engine(port, max_retry=3):
+    client = MagicMock()
+    client.meta.endpoint_url = f"http://127.0.0.1:{port}"
+    client.meta.region_name = "us-east-1"
+    client.meta.service_model.signing_name = "bedrock"
+    with patch("bisheng.engines.boto3_engine.create_boto3_client", return_value=client):
+        return BedrockEngine(
+            model_id="anthropic.claude-3-sonnet-20240229-v1:0",
+            version="bedrock-2023-05-31",
+            trace="ENABLED",
+            guardrail_id=None,
+            guardrail_version=None,
+            hyperparameters={"max_tokens": 100, "temperature": 0, "top_p": 1, "top_k": 250, "role": "user"},
+            aws_profile=None,
+            aws_region="us-east-1",
+            endpoint_url=None,
+            max_retry=max_retry,
+        )
+
+
+def test_bedrock_ainvoke_runs_many_requests_on_one_loop(aws_credentials):
+    server = FakeBedrockServer()
+
+    async def run():
+        fake = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        engine = _bedrock_engine(fake.sockets[0].getsockname()[1])
+        try:
+            return await asyncio.gather(*(engine.ainvoke(_prompt(f"prompt {i}")) for i in range(100)))
+        finally:
+            await engine.aclose()
+            fake.close()
+
+    responses = asyncio.run(run())
+
+    assert [response.response for response in responses] == [f"prompt {i}" for i in range(100)]
+    assert responses[0].rationale == "r"
+    assert server.max_in_flight > 1
+    request_line, headers, _ = server.requests[0]
+    assert request_line.startswith("POST /model/anthropic.claude-3-sonnet-20240229-v1%3A0/invoke ")
+    assert headers["authorization"].startswith("AWS4-HMAC-SHA256")
+    assert headers["x-amzn-bedrock-trace"] == "ENABLED"
+
+
+def test_bedrock_ainvoke_retries_throttling(aws_credentials):
+    server = FakeBedrockServer(throttle_first=1)
+
+    async def run():
+        fake = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        engine = _bedrock_engine(fake.sockets[0].getsockname()[1])
+        try:
+            with patch("bisheng.engines.boto3_engine.random.uniform", return_value=0):
+                return await engine.ainvoke(_prompt("hello"))
+        finally:
+            await engine.aclose()
+            fake.close()
+
+    assert asyncio.run(run()).response == "hello"
+    assert len(server.requests) == 2
+
+
+def test_bedrock_ainvoke_backoff_stops_at_the_prompt_deadline(aws_credentials):
+    server = FakeBedrockServer(throttle_first=10)
+
+    async def run():
+        fake = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        engine = _bedrock_engine(fake.sockets[0].getsockname()[1], max_retry=10)
+        try:
+            with patch("bisheng.engines.boto3_engine.random.uniform", return_value=20.0), \
+                    request_context(RequestContext(deadline=time.monotonic() + 0.5)):
+                return await engine.ainvoke(_prompt("hello"))
+        finally:
+            await engine.aclose()
+            fake.close()
+
+    start = time.monotonic()
+    with pytest.raises(PromptTimeoutError):
+        asyncio.run(run())
+    assert time.monotonic() - start < 5
+    assert len(server.requests) == 1
+
+
+async def _fake_gaab(websocket):
+    async def answer(request):
+        conversation_id = request["conversationId"]
+        for data in ["<rationale>r</rationale>", f" <response>{request['question']}</response>",
+                     "##END_CONVERSATION##"]:
+            await asyncio.sleep(0.01)
+            await websocket.send(json.dumps({"data": data, "conversationId": conversation_id}))
+
+    tasks = []
+    async for message in websocket:
+        tasks.append(asyncio.create_task(answer(json.loads(message))))
+    await asyncio.gather(*tasks)
+
+
+def test_gaab_ainvoke_multiplexes_requests_over_few_connections():
+    connections = []
+
+    async def handler(websocket, *args):
+        connections.append(websocket)
+        await _fake_gaab(websocket)
+
+    async def run():
+        async with websockets.serve(handler, "127.0.0.1", 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            token_provider = MagicMock()
+            token_provider.get_token.return_value = "token"
+            with patch("bisheng.engines.websocket_engine.CognitoTokenProvider.get_instance",
+                       return_value=token_provider):
+                engine = GaabStreamingEngine(
+                    ws_url=f"ws://127.0.0.1:{port}",
+                    num_connections=2,
+                    max_in_flight_per_connection=10,
+                    app_client_id="client",
+                    user_name="user",
+                    password="password",
+                    aws_profile=None,
+                    aws_region="us-east-1",
+                    endpoint_url=None,
+                )
+            try:
+                return await asyncio.gather(*(engine.ainvoke(_prompt(f"question-{i}")) for i in range(50)))
+            finally:
+                await engine.aclose()
+                engine.close()
+
+    responses = asyncio.run(run())
+
+    assert [response.response for response in responses] == [f"question-{i}" for i in range(50)]
+    assert len(connections) == 2
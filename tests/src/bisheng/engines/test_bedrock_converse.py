@@ -0,0 +1,73 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from bisheng.engines.bedrock.converse_driver import BedrockConverseEngine
+from bisheng.prompting.templates.prompt_templates import OneShotWithContextPromptTemplate
+
+_CONVERSE_RESPONSE = {
+    "output": {"message": {"role": "assistant", "content": [
+        {"text": "<rationale>Because</rationale><response>Hello</response>"}
+    ]}},
+    "usage": {"inputTokens": 20, "outputTokens": 8, "cacheReadInputTokens": 1500, "cacheWriteInputTokens": 0},
+}
+
+
+@pytest.fixture
+def engine():
+    with patch("bisheng.engines.boto3_engine.create_boto3_client") as mock_create_client:
+        mock_create_client.return_value = MagicMock()
+        yield BedrockConverseEngine(
+            model_id="anthropic.claude-3-5-sonnet-20241022-v2:0",
+            version="bedrock-2023-05-31",
+            trace="ENABLED",
+            guardrail_id=None,
+            guardrail_version=None,
+            hyperparameters={"max_tokens": 100, "temperature": 0, "top_p": 1, "top_k": 250, "role": "user"},
+            aws_profile=None,
+            aws_region="us-east-1",
+            endpoint_url=None,
+        )
+
+
+def _prompt(prefix, suffix):
+    prompt = MagicMock()
+    prompt.get_system_prompt.return_value = "system"
+    prompt.get_instruction_prompt.return_value = prefix + suffix
+    prompt.get_instruction_prefix.return_value = prefix
+    prompt.get_instruction_suffix.return_value = suffix
+    return prompt
+
+
+def test_invoke_places_cache_point_after_context_and_reports_cache_usage(engine):
+    engine.boto3_client.converse.return_value = _CONVERSE_RESPONSE
+
+    response = engine.invoke(_prompt("CONTEXT:shared\n", "INPUT DATA:slide"))
+
+    kwargs = engine.boto3_client.converse.call_args.kwargs
+    assert kwargs["system"] == [{"text": "system"}]
+    assert kwargs["messages"][0]["content"] == [
+        {"text": "CONTEXT:shared\n"}, {"cachePoint": {"type": "default"}}, {"text": "INPUT DATA:slide"}
+    ]
+    assert response.rationale == "Because"
+    assert response.response == "Hello"
+    assert response.to_json()["usage"] == {"input_tokens": 20, "output_tokens": 8, "cache_read_input_tokens": 1500,
+                                           "cache_write_input_tokens": 0}
+
+
+def test_invoke_caches_system_prompt_without_instruction_prefix(engine):
+    engine.boto3_client.converse.return_value = _CONVERSE_RESPONSE
+
+    engine.invoke(_prompt("", "INPUT DATA:slide"))
+
+    kwargs = engine.boto3_client.converse.call_args.kwargs
+    assert kwargs["system"] == [{"text": "system"}, {"cachePoint": {"type": "default"}}]
+    assert kwargs["messages"][0]["content"] == [{"text": "INPUT DATA:slide"}]
+
+
+def test_one_shot_template_splits_context_into_prefix():
+    params = {"generate_prompt": "g", "shot_text": "s", "context": "c", "output_filter": "o"}
+
+    assert OneShotWithContextPromptTemplate.create_instruction_prefix(**params) == "CONTEXT:c\n"
+    assert OneShotWithContextPromptTemplate.create_instruction_suffix(**params) == ("INPUT DATA:g\nEXAMPLES:s\n"
+                                                                                   "OUTPUT FORMAT:o")
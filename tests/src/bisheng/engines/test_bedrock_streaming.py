@@ -0,0 +1,89 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from bisheng.engines.bedrock.streaming_driver import BedrockStreamingEngine
+
+
+def _event(payload):
+    return {"chunk": {"bytes": json.dumps(payload).encode()}}
+
+
+def _delta(text):
+    return _event({"type": "content_block_delta", "index": 0, "delta": {"type": "text_delta", "text": text}})
+
+
+class _Stream:
+
+    def __init__(self, events):
+        self.events = events
+        self.consumed = 0
+        self.closed = False
+
+    def __iter__(self):
+        for event in self.events:
+            self.consumed += 1
+            yield event
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def engine():
+    with patch("bisheng.engines.boto3_engine.create_boto3_client") as mock_create_client:
+        mock_create_client.return_value = MagicMock()
+        yield BedrockStreamingEngine(
+            model_id="anthropic.claude-3-sonnet-20240229-v1:0",
+            version="bedrock-2023-05-31",
+            trace="ENABLED",
+            guardrail_id=None,
+            guardrail_version=None,
+            hyperparameters={"max_tokens": 100, "temperature": 0, "top_p": 1, "top_k": 250, "role": "user"},
+            aws_profile=None,
+            aws_region="us-east-1",
+            endpoint_url=None,
+        )
+
+
+def test_invoke_parses_deltas_and_stops_at_closing_response(engine):
+    stream = _Stream([
+        _event({"type": "message_start", "message": {"usage": {"input_tokens": 10}}}),
+        _delta("<rationale>Because"),
+        _delta(" reasons</rationale><resp"),
+        _delta("onse>Hello"),
+        _delta(" world</response>"),
+        _delta(" never read"),
+    ])
+    engine.boto3_client.invoke_model_with_response_stream.return_value = {"body": stream}
+    prompt = MagicMock()
+    prompt.get_system_prompt.return_value = "system"
+    prompt.get_instruction_prompt.return_value = "instruction"
+
+    response = engine.invoke(prompt)
+
+    assert response.rationale == "Because reasons"
+    assert response.response == "Hello world"
+    assert stream.consumed == 5
+    assert stream.closed
+    body = json.loads(engine.boto3_client.invoke_model_with_response_stream.call_args.kwargs["body"])
+    assert body["system"] == "system"
+    assert body["messages"][0]["content"][0]["text"] == "instruction"
+    assert response.usage == {"input_tokens": 10, "output_tokens": 20}
+
+
+def test_invoke_reconciles_rate_limiter_reservation_with_usage(engine):
+    engine._rate_limiter = MagicMock()
+    engine.boto3_client.invoke_model_with_response_stream.return_value = {"body": _Stream([
+        _event({"type": "message_start", "message": {"usage": {"input_tokens": 10}}}),
+        _delta("<response>Hi</response>"),
+    ])}
+    prompt = MagicMock()
+    prompt.get_system_prompt.return_value = "s" * 7
+    prompt.get_instruction_prompt.return_value = "i" * 7
+
+    engine.invoke(prompt)
+
+    engine._rate_limiter.reserve.assert_called_once_with(104)
+    engine._rate_limiter.reconcile.assert_called_once_with(engine._rate_limiter.reserve.return_value, 17)
@@ -0,0 +1,108 @@
+import threading
+from unittest.mock import MagicMock
+
+import pytest
+
+from bisheng.engines.engine_pool import EnginePool
+from bisheng.utils.exceptions import PromptTimeoutError
+from bisheng.utils.metrics import MetricsRegistry
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+@pytest.fixture
+def engine_factory():
+    factory = MagicMock()
+    factory.create.side_effect = lambda: MagicMock()
+    return factory
+
+
+def test_warm_creates_and_warms_every_engine(engine_factory, registry):
+    with EnginePool(engine_factory, size=3, metrics=registry) as pool:
+        pool.warm()
+
+        assert engine_factory.create.call_count == 3
+        for engine in pool._engines:
+            engine.warm.assert_called_once()
+        assert registry.get("engine_pool.created") == 3
+        assert registry.snapshot()["engine_pool.setup_seconds"]["count"] == 3
+
+
+def test_checkout_reuses_engines(engine_factory, registry):
+    with EnginePool(engine_factory, size=1, metrics=registry) as pool:
+        for _ in range(5):
+            with pool.checkout() as engine:
+                engine.invoke("prompt")
+
+    assert engine_factory.create.call_count == 1
+    assert registry.get("engine_pool.created") == 1
+    assert registry.get("engine_pool.reused") == 4
+
+
+def test_checkout_discards_engine_whose_connection_failed(engine_factory, registry):
+    with EnginePool(engine_factory, size=1, metrics=registry) as pool:
+        with pytest.raises(ConnectionError):
+            with pool.checkout() as engine:
+                failed = engine
+                raise ConnectionError("GAAB websocket connection closed")
+
+        failed.close.assert_called_once()
+
+        with pool.checkout() as engine:
+            assert engine is not failed
+
+    assert engine_factory.create.call_count == 2
+
+
+@pytest.mark.parametrize("error", [RuntimeError("unparsable response"), PromptTimeoutError("missed its deadline"),
+                                   KeyboardInterrupt()])
+def test_checkout_keeps_engine_after_other_errors(engine_factory, registry, error):
+    with EnginePool(engine_factory, size=1, metrics=registry) as pool:
+        with pytest.raises(type(error)):
+            with pool.checkout() as engine:
+                used = engine
+                raise error
+
+        used.close.assert_not_called()
+        with pool.checkout() as engine:
+            assert engine is used
+
+    assert engine_factory.create.call_count == 1
+
+
+def test_pool_is_bounded(engine_factory, registry):
+    pool = EnginePool(engine_factory, size=2, metrics=registry)
+    in_use = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with pool.checkout() as engine:
+            with lock:
+                in_use.append(engine)
+                peak.append(len(in_use))
+            with lock:
+                in_use.remove(engine)
+
+    threads = [threading.Thread(target=work) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) <= 2
+    assert engine_factory.create.call_count <= 2
+
+
+def test_close_closes_all_engines(engine_factory, registry):
+    pool = EnginePool(engine_factory, size=2, metrics=registry)
+    pool.warm()
+    engines = list(pool._engines)
+
+    pool.close()
+
+    for engine in engines:
+        engine.close.assert_called_once()
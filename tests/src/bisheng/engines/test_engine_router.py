@@ -0,0 +1,117 @@
+import asyncio
+import time
+import uuid
+from unittest.mock import patch
+
+import pytest
+
+from bisheng.engines import engine_factory
+from bisheng.engines.base_engine import BaseEngine
+from bisheng.engines.router import EngineRouter
+from bisheng.engines.router.backend import CircuitBreaker
+from bisheng.utils.exceptions import PromptTimeoutError
+
+
+class _FakeEngine(BaseEngine):
+    calls: dict = {}
+
+    def __init__(self, label, fail=False, delay=0.0):
+        self.name = label
+        self.fail = fail
+        self.delay = delay
+
+    def invoke(self, prompt):
+        _FakeEngine.calls[self.name] = _FakeEngine.calls.get(self.name, 0) + 1
+        time.sleep(self.delay)
+        if isinstance(self.fail, Exception):
+            raise self.fail
+        if self.fail:
+            raise ConnectionResetError(self.name)
+        return self.name
+
+
+@pytest.fixture(autouse=True)
+def fake_engine_type():
+    _FakeEngine.calls = {}
+    with patch.dict(engine_factory._DRIVER_MAP, {"fake": _FakeEngine}):
+        yield
+
+
+def _backend(**kwargs):
+    # unique names, since the state of a backend is shared by name
+    name = f"backend-{uuid.uuid4()}"
+    return {"type": "fake", "name": name, "label": name, **kwargs}
+
+
+def test_router_fails_over_to_next_backend():
+    failing, healthy = _backend(fail=True, weight=10), _backend()
+    router = EngineRouter(backends=[failing, healthy])
+
+    assert router.invoke("prompt") == healthy["name"]
+    assert _FakeEngine.calls == {failing["name"]: 1, healthy["name"]: 1}
+
+
+def test_router_raises_when_every_backend_fails():
+    router = EngineRouter(backends=[_backend(fail=True), _backend(fail=True)])
+
+    with pytest.raises(ConnectionResetError):
+        router.invoke("prompt")
+
+
+def test_router_opens_circuit_on_failing_backend():
+    failing, healthy = _backend(fail=True, weight=10), _backend()
+    router = EngineRouter(backends=[failing, healthy], failure_threshold=2, recovery_seconds=60)
+
+    for _ in range(5):
+        assert router.invoke("prompt") == healthy["name"]
+
+    assert _FakeEngine.calls[failing["name"]] == 2
+    assert not router.backends[0].available
+
+
+def test_router_does_not_blame_backend_for_missed_deadline():
+    timed_out, healthy = _backend(fail=PromptTimeoutError("deadline"), weight=10), _backend()
+    router = EngineRouter(backends=[timed_out, healthy], failure_threshold=1, recovery_seconds=60)
+
+    with pytest.raises(PromptTimeoutError):
+        router.invoke("prompt")
+
+    assert _FakeEngine.calls == {timed_out["name"]: 1}
+    assert router.backends[0].available
+
+
+def test_router_prefers_faster_backend():
+    slow, fast = _backend(delay=0.05), _backend()
+    router = EngineRouter(backends=[slow, fast])
+    router.backends[0].latency, router.backends[1].latency = 0.05, 0.001
+
+    for _ in range(5):
+        router.invoke("prompt")
+
+    assert _FakeEngine.calls == {fast["name"]: 5}
+
+
+def test_router_respects_max_in_flight():
+    limited, other = _backend(max_in_flight=1, weight=100), _backend()
+    router = EngineRouter(backends=[limited, other])
+    assert router.backends[0].try_acquire()
+
+    assert router.invoke("prompt") == other["name"]
+
+
+def test_router_ainvoke_fails_over():
+    failing, healthy = _backend(fail=True, weight=10), _backend()
+    router = EngineRouter(backends=[failing, healthy])
+
+    assert asyncio.run(router.ainvoke("prompt")) == healthy["name"]
+
+
+def test_circuit_breaker_lets_one_trial_through_after_recovery():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_seconds=0)
+    assert breaker.on_failure()
+
+    assert breaker.allows()
+    breaker.on_dispatch()
+    assert not breaker.allows()
+    breaker.on_success()
+    assert not breaker.is_open
@@ -0,0 +1,157 @@
+import asyncio
+import json
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from bisheng.engines.gaab import client as gaab_client
+from bisheng.engines.gaab.client import AsyncGaabClient, GaabClient, GaabConnection
+from bisheng.engines.request_context import RequestContext, request_context
+from bisheng.utils.exceptions import PromptTimeoutError
+
+
+@pytest.fixture
+def mock_websocket_app():
+    with patch.object(gaab_client.websocket, "WebSocketApp") as mock_app, \
+            patch.object(gaab_client.threading, "Thread"):
+        yield mock_app
+
+
+def _open(connection):
+    connection._on_open(connection._ws)
+
+
+def _frame(conversation_id, **payload):
+    return json.dumps({"conversationId": conversation_id, **payload})
+
+
+def test_connection_routes_frames_by_conversation_id(mock_websocket_app):
+    connection = GaabConnection(lambda: "wss://example", connect_timeout=1)
+    connection.connect()
+    _open(connection)
+
+    first = connection.send({"question": "first"})
+    second = connection.send({"question": "second"})
+
+    sent = [json.loads(call.args[0]) for call in connection._ws.send.call_args_list]
+    assert [body["conversationId"] for body in sent] == [first.conversation_id, second.conversation_id]
+
+    connection._on_message(None, _frame(second.conversation_id, data="<response>b1</response>"))
+    connection._on_message(None, _frame(first.conversation_id, data="<response>a1"))
+    connection._on_message(None, _frame(second.conversation_id, data="##END_CONVERSATION##"))
+    connection._on_message(None, _frame(first.conversation_id, data=" a2</response>"))
+    connection._on_message(None, _frame(first.conversation_id, data="##END_CONVERSATION##"))
+
+    assert second.wait(timeout=1).parser.response == "b1"
+    assert first.wait(timeout=1).parser.response == "a1 a2"
+
+
+def test_connection_fails_pending_requests_on_close(mock_websocket_app):
+    connection = GaabConnection(lambda: "wss://example", connect_timeout=1)
+    connection.connect()
+    _open(connection)
+    request = connection.send({"question": "first"})
+
+    connection._on_close(connection._ws, 1006, "gone")
+
+    with pytest.raises(ConnectionError):
+        request.wait(timeout=1)
+
+
+def test_connection_routes_untagged_frames_to_single_request(mock_websocket_app):
+    connection = GaabConnection(lambda: "wss://example", connect_timeout=1)
+    connection.connect()
+    _open(connection)
+    request = connection.send({"question": "first"})
+
+    connection._on_message(None, json.dumps({"data": "<response>token</response>"}))
+    connection._on_message(None, json.dumps({"data": "##END_CONVERSATION##"}))
+
+    assert request.wait(timeout=1).parser.response == "token"
+
+
+def test_connection_drops_frames_of_abandoned_requests(mock_websocket_app):
+    connection = GaabConnection(lambda: "wss://example", connect_timeout=1)
+    connection.connect()
+    _open(connection)
+    abandoned = connection.send({"question": "first"})
+    request = connection.send({"question": "second"})
+    abandoned.cancel(TimeoutError("stalled"))
+
+    connection._on_message(None, _frame(abandoned.conversation_id, data="<response>late</response>"))
+    connection._on_message(None, _frame(request.conversation_id, data="<response>token</response>"))
+    connection._on_message(None, _frame(request.conversation_id, data="##END_CONVERSATION##"))
+
+    assert request.wait(timeout=1).parser.response == "token"
+
+
+def test_connection_fails_requests_on_untagged_frame_with_several_in_flight(mock_websocket_app):
+    connection = GaabConnection(lambda: "wss://example", connect_timeout=1)
+    connection.connect()
+    _open(connection)
+    first, second = connection.send({"question": "first"}), connection.send({"question": "second"})
+
+    connection._on_message(None, json.dumps({"data": "<response>token</response>"}))
+
+    for request in (first, second):
+        with pytest.raises(ConnectionError):
+            request.wait(timeout=1)
+
+
+def test_client_spreads_requests_over_connections(mock_websocket_app):
+    token_provider = MagicMock()
+    token_provider.get_token.return_value = "token"
+    client = GaabClient("wss://example", token_provider, num_connections=2, max_in_flight_per_connection=2,
+                        connect_timeout=1)
+    client.connect()
+    for connection in client._connections:
+        _open(connection)
+
+    requests = [client.send({"question": str(i)}) for i in range(4)]
+
+    assert sorted(client._load.values()) == [2, 2]
+    for request in requests:
+        request.on_frame({"data": "##END_CONVERSATION##"})
+    assert sorted(client._load.values()) == [0, 0]
+    assert mock_websocket_app.call_args.args[0] == "wss://example?Authorization=token"
+
+
+def test_client_stops_waiting_for_a_slot_at_the_prompt_deadline(mock_websocket_app):
+    client = GaabClient("wss://example", MagicMock(), num_connections=1, max_in_flight_per_connection=1,
+                        connect_timeout=1)
+    client.connect()
+    _open(client._connections[0])
+    client.send({"question": "hung"})
+
+    with pytest.raises(PromptTimeoutError), request_context(RequestContext(deadline=time.monotonic() + 0.2)):
+        client.send({"question": "waiting"})
+    assert client._load == {client._connections[0]: 1}
+
+
+def test_async_client_stops_waiting_for_a_slot_at_the_prompt_deadline():
+    client = AsyncGaabClient("wss://example", MagicMock(), num_connections=1, max_in_flight_per_connection=1,
+                             connect_timeout=1)
+
+    async def wait_for_slot():
+        await client._slots.acquire()
+        with request_context(RequestContext(deadline=time.monotonic() + 0.2)):
+            await client.send({"question": "waiting"})
+
+    with pytest.raises(PromptTimeoutError):
+        asyncio.run(wait_for_slot())
+
+
+def test_get_instance_shares_client_until_released(mock_websocket_app):
+    token_provider = MagicMock()
+    first = GaabClient.get_instance("wss://shared", token_provider, 1, 1, 1)
+    second = GaabClient.get_instance("wss://shared", token_provider, 1, 1, 1)
+
+    assert first is second
+
+    first.release()
+    assert GaabClient.get_instance("wss://shared", token_provider, 1, 1, 1) is first
+
+    first.release()
+    first.release()
+    assert GaabClient.get_instance("wss://shared", token_provider, 1, 1, 1) is not first
@@ -0,0 +1,90 @@
+import asyncio
+from unittest.mock import patch
+
+import pytest
+
+from bisheng.engines.rate_limiter import RateLimiter, TokenBucket
+from bisheng.engines.request_context import RequestContext, request_context
+from bisheng.utils.exceptions import PromptTimeoutError
+from bisheng.utils.tokens import estimate_tokens
+
+
+@pytest.fixture
+def clock():
+    with patch("bisheng.engines.rate_limiter.time") as mock_time:
+        mock_time.monotonic.return_value = 1000.0
+        yield mock_time
+
+
+def test_bucket_waits_once_in_debt_and_refills_over_time(clock):
+    bucket = TokenBucket(rate_per_minute=60)
+
+    assert bucket.take(60) == 0
+    assert bucket.take(2) == pytest.approx(2.0)
+
+    clock.monotonic.return_value += 30
+    assert bucket.take(1) == 0
+
+
+def test_reserve_sleeps_when_requests_per_minute_is_exhausted(clock):
+    limiter = RateLimiter(requests_per_minute=2)
+
+    limiter.reserve(10)
+    limiter.reserve(10)
+    clock.sleep.assert_not_called()
+
+    limiter.reserve(10)
+    clock.sleep.assert_called_once_with(pytest.approx(30.0))
+
+
+def test_reserve_stops_waiting_at_the_prompt_deadline_and_gives_back_the_budget(clock):
+    clock.sleep.side_effect = lambda seconds: setattr(clock.monotonic, "return_value",
+                                                      clock.monotonic.return_value + seconds)
+    limiter = RateLimiter(requests_per_minute=2)
+    limiter.reserve(10)
+    limiter.reserve(10)
+
+    with patch("bisheng.engines.request_context.time", clock), \
+            request_context(RequestContext(deadline=clock.monotonic.return_value + 2)):
+        with pytest.raises(PromptTimeoutError):
+            limiter.reserve(10)
+
+    assert max(call.args[0] for call in clock.sleep.call_args_list) <= 0.5
+    clock.sleep.reset_mock()
+    limiter.reserve(10)
+    # the request that gave up no longer holds its place: the wait is 30s less the 2s already refilled
+    clock.sleep.assert_called_once_with(pytest.approx(28.0))
+
+
+def test_reconcile_returns_unused_tokens(clock):
+    limiter = RateLimiter(tokens_per_minute=1000)
+
+    reservation = limiter.reserve(900)
+    limiter.reconcile(reservation, used_tokens=100)
+    limiter.reserve(800)
+
+    clock.sleep.assert_not_called()
+
+
+def test_areserve_waits_on_the_event_loop(clock):
+    limiter = RateLimiter(tokens_per_minute=600)
+    limiter.reserve(600)
+
+    with patch("bisheng.engines.rate_limiter.asyncio.sleep") as mock_sleep:
+        async def sleep(_):
+            pass
+        mock_sleep.side_effect = sleep
+        asyncio.run(limiter.areserve(100))
+
+    mock_sleep.assert_called_once_with(pytest.approx(10.0))
+
+
+def test_get_instance_shares_limiter_per_model():
+    first = RateLimiter.get_instance("test-model-a", requests_per_minute=10)
+
+    assert RateLimiter.get_instance("test-model-a", requests_per_minute=20) is first
+    assert RateLimiter.get_instance("test-model-b", requests_per_minute=10) is not first
+
+
+def test_estimate_tokens_rounds_up():
+    assert estimate_tokens("a" * 7, "", "b") == 3
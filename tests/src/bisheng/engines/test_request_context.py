@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+from bisheng.engines.gaab.client import GaabRequest
+from bisheng.engines.gaab.driver import GaabStreamingEngine
+from bisheng.engines.request_context import RequestContext, current_request_context, request_context
+from bisheng.utils.exceptions import PromptCancelledError, PromptTimeoutError, StreamStalledError
+
+
+def test_request_context_is_current_inside_block():
+    context = RequestContext(deadline=time.monotonic() + 60)
+    with request_context(context) as current:
+        assert current is context
+        assert current_request_context() is context
+    assert current_request_context() is None
+
+
+def test_check_raises_after_deadline():
+    context = RequestContext(deadline=time.monotonic() - 1)
+
+    assert context.remaining() == 0.0
+    with pytest.raises(PromptTimeoutError):
+        context.check()
+
+
+def test_check_raises_after_cancel():
+    context = RequestContext()
+    context.check()
+
+    context.cancel("The run was aborted")
+
+    with pytest.raises(PromptCancelledError, match="aborted"):
+        context.check()
+
+
+def test_gaab_check_request_cancels_stalled_stream():
+    request = GaabRequest("conversation")
+    request.last_activity = time.monotonic() - 10
+
+    with pytest.raises(StreamStalledError):
+        GaabStreamingEngine._check_request(request, RequestContext(stall_timeout=5))
+    with pytest.raises(StreamStalledError):
+        request.wait(timeout=0)
+
+
+def test_gaab_check_request_keeps_active_stream():
+    request = GaabRequest("conversation")
+    request.on_frame({"data": "<response>"})
+
+    GaabStreamingEngine._check_request(request, RequestContext(stall_timeout=5))
+
+    assert not request.future.done()
+
+
+def test_gaab_stalled_stream_is_resent_up_to_retries():
+    context = RequestContext(stall_retries=1)
+    error = StreamStalledError("stalled")
+
+    assert GaabStreamingEngine._on_stalled(0, context, error) == 1
+    with pytest.raises(StreamStalledError):
+        GaabStreamingEngine._on_stalled(1, context, error)
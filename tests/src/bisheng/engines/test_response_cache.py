@@ -0,0 +1,103 @@
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from bisheng.engines.bedrock.response import BedrockResponse
+from bisheng.engines.gaab.response import GaabResponse
+from bisheng.engines.response_cache import ResponseCache
+from bisheng.prompting.base_response import dump_response, load_response
+from bisheng.prompting.failed_response import FailedResponse
+
+_ENGINE_CONFIG = {"type": "bedrock", "model_id": "model", "hyperparameters": {"temperature": 0}, "max_retry": 10}
+
+
+def _prompt(instruction, system_prompt="system"):
+    prompt = MagicMock()
+    prompt.get_system_prompt.return_value = system_prompt
+    prompt.get_instruction_prompt.return_value = instruction
+    return prompt
+
+
+def _response(text):
+    return BedrockResponse(rationale="because", response=text, sources="")
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with ResponseCache(str(tmp_path / "cache" / "responses.sqlite3"), _ENGINE_CONFIG, max_size_bytes=10_000,
+                       max_age_seconds=3600) as cache:
+        yield cache
+
+
+def test_returns_cached_response_for_identical_request(cache):
+    cache.put(_prompt("instruction"), _response("hello"))
+
+    response = cache.get(_prompt("instruction"))
+
+    assert isinstance(response, BedrockResponse)
+    assert response.response == "hello"
+    assert cache.get(_prompt("other instruction")) is None
+    assert cache.get(_prompt("instruction", system_prompt="other system")) is None
+
+
+def test_key_ignores_transport_settings_but_not_hyperparameters(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    retries = ResponseCache(path, {**_ENGINE_CONFIG, "max_retry": 3}, 10_000, 3600)
+    temperature = ResponseCache(path, {**_ENGINE_CONFIG, "hyperparameters": {"temperature": 1}}, 10_000, 3600)
+    cache = ResponseCache(path, _ENGINE_CONFIG, 10_000, 3600)
+
+    assert retries.key(_prompt("instruction")) == cache.key(_prompt("instruction"))
+    assert temperature.key(_prompt("instruction")) != cache.key(_prompt("instruction"))
+
+
+def test_refresh_misses_but_still_stores(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    with ResponseCache(path, _ENGINE_CONFIG, 10_000, 3600, refresh=True) as cache:
+        cache.put(_prompt("instruction"), _response("hello"))
+        assert cache.get(_prompt("instruction")) is None
+
+    with ResponseCache(path, _ENGINE_CONFIG, 10_000, 3600) as cache:
+        assert cache.get(_prompt("instruction")).response == "hello"
+
+
+def test_evict_drops_least_recently_used_entries_over_size(cache):
+    with patch("bisheng.engines.response_cache.time") as mock_time:
+        for index in range(3):
+            mock_time.time.return_value = 1000.0 + index
+            cache.put(_prompt(f"instruction {index}"), _response("x" * 4000))
+        mock_time.time.return_value = 1010.0
+        cache.get(_prompt("instruction 0"))
+
+        cache.evict()
+
+        assert cache.get(_prompt("instruction 0")) is not None
+        assert cache.get(_prompt("instruction 1")) is None
+        assert cache.get(_prompt("instruction 2")) is not None
+
+
+def test_expired_entries_miss_and_are_evicted(cache):
+    with patch("bisheng.engines.response_cache.time") as mock_time:
+        mock_time.time.return_value = 1000.0
+        cache.put(_prompt("instruction"), _response("hello"))
+        mock_time.time.return_value = 1000.0 + 3601
+
+        assert cache.get(_prompt("instruction")) is None
+        cache.evict()
+
+        mock_time.time.return_value = 1000.0
+        assert cache.get(_prompt("instruction")) is None
+
+
+@pytest.mark.parametrize("response", [BedrockResponse(rationale="r", response="text", sources="", usage={"x": 1}),
+                                      GaabResponse(rationale="r", response="text", sources="doc"),
+                                      FailedResponse(outcome="timed_out", error="late")])
+def test_known_response_types_round_trip(response):
+    assert load_response(*dump_response(response)) == response
+
+
+def test_unknown_response_types_are_rejected_without_importing_them():
+    sys.modules.pop("this", None)
+
+    assert load_response("this:s", "{}") is None
+    assert "this" not in sys.modules
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from bisheng.engines.gaab.response import GaabResponse
+from bisheng.engines.gaab.stream_parser import GaabStreamParser
+from bisheng.engines.stream_parser import TagStreamParser
+
+_TEXT = ("Here is my answer. <rationale>The context <b>says</b> so.</rationale>\n"
+         "<response>Revenue grew < 5% > last year.</response> Anything after is ignored.")
+
+
+def _feed_in_chunks(parser, text, size):
+    for i in range(0, len(text), size):
+        if parser.feed(text[i:i + size]):
+            return i + size
+    return len(text)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 8, 13, len(_TEXT)])
+def test_extracts_spans_regardless_of_chunking(size):
+    parser = TagStreamParser()
+    _feed_in_chunks(parser, _TEXT, size)
+
+    assert parser.get("rationale") == "The context <b>says</b> so."
+    assert parser.get("response") == "Revenue grew < 5% > last year."
+    assert parser.complete
+
+
+def test_completes_as_soon_as_response_closes():
+    parser = TagStreamParser()
+    consumed = _feed_in_chunks(parser, _TEXT, 4)
+
+    assert consumed < len(_TEXT)
+    assert parser.feed(" more text") is True
+
+
+def test_missing_tags_yield_empty_strings():
+    parser = TagStreamParser()
+    parser.feed("no tags at all <")
+    parser.feed("/nothing>")
+
+    assert parser.get("rationale") == ""
+    assert parser.get("response") == ""
+    assert not parser.complete
+
+
+def test_unclosed_response_yields_empty_string():
+    parser = TagStreamParser()
+    parser.feed("<rationale>why</rationale><response>partial answ")
+    parser.feed("er</resp")
+
+    assert parser.get("rationale") == "why"
+    assert parser.get("response") == ""
+    assert not parser.complete
+
+
+def test_gaab_parser_joins_words_and_keeps_sources_structured():
+    parser = GaabStreamParser()
+    frames = [
+        {"sourceDocument": {"excerpt": "Q3 revenue", "location": "s3://bucket/report.pdf"}},
+        {"generated_question": "INPUT DATA: summarize"},
+        {"data": "<rationale>"},
+        {"data": "Because"},
+        {"data": " "},
+        {"data": " it</rationale>"},
+        {"data": "<response>Hel"},
+        {"data": "lo"},
+        {"data": " world</response> "},
+    ]
+    for frame in frames:
+        parser.feed(frame)
+
+    assert parser.rationale == "Because it"
+    assert parser.response == "Hello world"
+    assert parser.source_documents == [{"excerpt": "Q3 revenue", "location": "s3://bucket/report.pdf"}]
+    assert parser.num_tokens == 7
+
+
+def test_gaab_response_reports_sources_as_text_and_documents():
+    documents = [{"excerpt": "Q3 revenue", "location": "s3://bucket/report.pdf"}]
+    response = GaabResponse(rationale="", response="text", sources=json.dumps(documents), source_documents=documents)
+
+    assert response.to_json()["sources"] == json.dumps(documents)
+    assert response.to_json()["source_documents"] == documents
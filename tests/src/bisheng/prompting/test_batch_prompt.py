@@ -0,0 +1,64 @@
+from unittest.mock import MagicMock
+
+from bisheng.decoders.pptx_decoder import PptxDecoder
+from bisheng.engines.bedrock.response import BedrockResponse
+from bisheng.prompting.batch_prompt import BatchPrompt
+
+
+def _prompt(suffix, slide_id=1, prefix="CONTEXT:deck\n"):
+    slide = MagicMock(slide_id=slide_id)
+    return PptxDecoder.PptxPromptBehavior(slide, MagicMock(), "system", prefix + suffix, prefix, suffix)
+
+
+def test_batch_instruction_contains_prefix_once_and_every_task():
+    batch = BatchPrompt([_prompt("first"), _prompt("second")])
+
+    instruction = batch.get_instruction_prompt()
+
+    assert instruction.count("CONTEXT:deck") == 1
+    assert "<task id=\"1\">\nfirst\n</task>" in instruction
+    assert "<task id=\"2\">\nsecond\n</task>" in instruction
+    assert batch.get_system_prompt() == "system"
+
+
+def test_split_returns_one_response_per_prompt():
+    first, second = _prompt("first"), _prompt("second")
+    batch = BatchPrompt([first, second])
+    response = BedrockResponse(rationale="why", sources="", usage={"input_tokens": 10},
+                               response="<shape id=\"2\"> two </shape>\n<shape id=\"1\">one</shape>")
+
+    responses = batch.split(response)
+
+    assert responses[first].response == "one"
+    assert responses[second].response == "two"
+    assert responses[second].rationale == "why"
+    assert responses[first].usage == {"input_tokens": 10}
+    assert responses[second].usage is None
+
+
+def test_split_fails_on_missing_or_duplicate_shapes():
+    batch = BatchPrompt([_prompt("first"), _prompt("second")])
+
+    assert batch.split(BedrockResponse(rationale="", sources="", response="<shape id=\"1\">one</shape>")) is None
+    assert batch.split(BedrockResponse(rationale="", sources="", response=(
+        "<shape id=\"1\">one</shape><shape id=\"1\">again</shape><shape id=\"2\">two</shape>"))) is None
+
+
+def test_decoder_batches_prompts_per_slide():
+    decoder = PptxDecoder.__new__(PptxDecoder)
+    decoder.batching = {"max_shapes": 2}
+    prompts = [_prompt("a", slide_id=1), _prompt("b", slide_id=2), _prompt("c", slide_id=1),
+               _prompt("d", slide_id=1), _prompt("e", slide_id=1, prefix="")]
+
+    batched = decoder.batch(prompts)
+
+    assert [[p.get_instruction_suffix() for p in b.prompts] if isinstance(b, BatchPrompt)
+            else b.get_instruction_suffix() for b in batched] == [["a", "c"], "d", "b", "e"]
+
+
+def test_decoder_does_not_batch_by_default():
+    decoder = PptxDecoder.__new__(PptxDecoder)
+    decoder.batching = {}
+    prompts = [_prompt("a"), _prompt("b")]
+
+    assert decoder.batch(prompts) == prompts
@@ -0,0 +1,78 @@
+from unittest.mock import MagicMock
+
+from bisheng.decoders.pptx_decoder import PptxDecoder
+from bisheng.engines.bedrock.response import BedrockResponse
+from bisheng.prompting.prompt_graph import PromptGraph, dependency_order, find_cycle
+from bisheng.prompting.templates.prompt_templates import GaabWithKnowledgeBasePromptTemplate
+
+
+def _prompt(generate_prompt, **dependencies):
+    parameters = {"generate_prompt": generate_prompt, "shot_text": "shot", "output_filter": "format"}
+    instruction = GaabWithKnowledgeBasePromptTemplate.create_instruction(**parameters)
+    prompt = PptxDecoder.PptxPromptBehavior(MagicMock(), MagicMock(), "system", instruction,
+                                            instruction_template=GaabWithKnowledgeBasePromptTemplate,
+                                            instruction_parameters=parameters)
+    prompt.dependencies = dependencies
+    return prompt
+
+
+def _response(text):
+    return BedrockResponse(rationale="", sources="", response=text)
+
+
+def test_dependents_are_ready_once_every_dependency_completed():
+    title, body = _prompt("title"), _prompt("body")
+    summary = _prompt("Summarize {{ref:Title}} and {{ref: 3/Body }}", **{"Title": title, "3/Body": body})
+    graph = PromptGraph([title, body, summary])
+
+    assert graph.is_ready(title) and not graph.is_ready(summary)
+    assert graph.complete(title, _response("The title")) == []
+    assert graph.complete(body, _response(" The body ")) == [summary]
+    assert summary.get_instruction_prompt().startswith("INPUT DATA:Summarize The title and The body\n")
+    assert graph.complete(body, _response("again")) == []
+
+
+def test_descendants_include_indirect_dependents_once():
+    title = _prompt("title")
+    body = _prompt("{{ref:Title}}", Title=title)
+    summary = _prompt("{{ref:Title}} {{ref:Body}}", Title=title, Body=body)
+    graph = PromptGraph([title, body, summary])
+
+    assert sorted(graph.descendants(title), key=id) == sorted([body, summary], key=id)
+    assert graph.descendants(summary) == []
+
+
+def test_find_cycle():
+    title = _prompt("title")
+    body = _prompt("{{ref:Title}}", Title=title)
+    assert find_cycle([title, body]) is None
+
+    title.dependencies = {"Body": body}
+    assert find_cycle([title, body]) == [title, body, title]
+
+    body.dependencies = {"Body": body}
+    assert find_cycle([body]) == [body, body]
+
+
+def test_added_prompt_is_resolved_when_its_dependencies_completed():
+    title, body = _prompt("title"), _prompt("body")
+    graph = PromptGraph([title, body])
+    graph.complete(title, _response("The title"))
+
+    summary = _prompt("Summarize {{ref:Title}}", Title=title)
+    assert graph.add(summary)
+    assert summary.get_instruction_prompt().startswith("INPUT DATA:Summarize The title\n")
+
+    both = _prompt("{{ref:Title}} {{ref:Body}}", Title=title, Body=body)
+    assert not graph.add(both)
+    assert graph.complete(body, _response("The body")) == [both]
+
+
+def test_dependency_order_lists_dependencies_first():
+    title = _prompt("title")
+    agenda = _prompt("{{ref:Summary}}")
+    summary = _prompt("{{ref:Title}}", Title=title)
+    agenda.dependencies = {"Summary": summary}
+
+    assert dependency_order([agenda, summary]) == [summary, agenda]
+    assert dependency_order([summary, title, agenda]) == [title, summary, agenda]
@@ -0,0 +1,85 @@
+import asyncio
+import time
+
+import pytest
+from botocore.exceptions import ClientError
+
+from bisheng.runner.concurrency import AimdConcurrencyController
+
+
+def _throttling_error():
+    return ClientError({"Error": {"Code": "ThrottlingException", "Message": "Too many requests"}}, "InvokeModel")
+
+
+def test_limit_grows_by_one_per_round_of_successes():
+    controller = AimdConcurrencyController(initial=2, maximum=10)
+
+    for _ in range(2):
+        controller.release(controller.acquire())
+    assert controller.limit == 2
+
+    for _ in range(3):
+        controller.release(controller.acquire())
+    assert controller.limit == 3
+
+
+def test_limit_is_halved_on_congestion_and_clamped():
+    controller = AimdConcurrencyController(initial=8, minimum=3, maximum=8)
+
+    controller.release(controller.acquire(), congested=True)
+    assert controller.limit == 4
+
+    controller.release(controller.acquire(), congested=True)
+    assert controller.limit == 3
+    assert [limit for _, limit in controller.history] == [8, 4, 3]
+
+
+def test_requests_in_flight_before_a_decrease_do_not_decrease_again():
+    controller = AimdConcurrencyController(initial=8)
+    tickets = [controller.acquire() for _ in range(4)]
+    time.sleep(0.001)
+
+    for ticket in tickets:
+        controller.release(ticket, congested=True)
+
+    assert controller.limit == 4
+
+
+def test_slot_counts_throttling_errors_as_congestion():
+    controller = AimdConcurrencyController(initial=4)
+
+    with pytest.raises(ClientError):
+        with controller.slot():
+            raise _throttling_error()
+
+    assert controller.limit == 2
+
+
+def test_slot_does_not_count_other_errors_as_congestion():
+    controller = AimdConcurrencyController(initial=4)
+
+    with pytest.raises(ValueError):
+        with controller.slot():
+            raise ValueError("bad prompt")
+
+    assert controller.limit == 4
+
+
+def test_aslot_limits_prompts_in_flight():
+    controller = AimdConcurrencyController(initial=2, maximum=2)
+    in_flight = []
+    peak = []
+
+    async def run_prompt():
+        async with controller.aslot():
+            in_flight.append(1)
+            peak.append(len(in_flight))
+            await asyncio.sleep(0.01)
+            in_flight.pop()
+
+    async def run():
+        await asyncio.gather(*(run_prompt() for _ in range(6)))
+
+    asyncio.run(run())
+
+    assert max(peak) == 2
@@ -0,0 +1,64 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from bisheng.decoders.pptx_decoder import PptxDecoder
+from bisheng.prompting.batch_prompt import BatchPrompt
+from bisheng.runner.estimator import RunEstimator, output_word_limit, simulate_makespan
+from bisheng.utils import defaults
+
+
+def _prompt(output_format, instruction="x" * 350):
+    return PptxDecoder.PptxPromptBehavior(MagicMock(), MagicMock(), "", instruction, output_format=output_format)
+
+
+@pytest.mark.parametrize("output_format, expected", [
+    ("Limit to between 10 - 50 words.", 50),
+    ("Up to 120 words, in 3 bullet points", 120),
+    ("One short sentence.", None),
+    ("", None),
+])
+def test_output_word_limit(output_format, expected):
+    assert output_word_limit(output_format) == expected
+
+
+def test_simulate_makespan():
+    assert simulate_makespan([4, 1, 1, 1, 1], workers=2) == 4
+    assert simulate_makespan([1, 1, 1, 1, 4], workers=2) == 6
+    assert simulate_makespan([], workers=4) == 0
+
+
+def test_estimate_prompt_uses_word_limit_and_max_tokens():
+    estimator = RunEstimator({"hyperparameters": {"max_tokens": 1000}},
+                             {"first_token_seconds": 1, "output_tokens_per_second": 10})
+
+    estimate = estimator.estimate_prompt(_prompt("at most 100 words"))
+
+    expected_output = defaults.ESTIMATED_RATIONALE_TOKENS + 135
+    assert estimate.input_tokens == 100
+    assert estimate.output_tokens == expected_output
+    assert estimate.seconds == 1 + expected_output / 10
+    assert RunEstimator({"hyperparameters": {"max_tokens": 50}}).estimate_prompt(_prompt("")).output_tokens == 50
+
+
+def test_estimate_prompt_sums_batch_outputs():
+    estimator = RunEstimator({})
+    batch = BatchPrompt([_prompt("50 words"), _prompt("100 words")])
+
+    assert estimator.estimate_prompt(batch).output_tokens == defaults.ESTIMATED_RATIONALE_TOKENS + 68 + 135
+
+
+def test_estimate_run_is_bound_by_rate_limit_and_priced():
+    estimator = RunEstimator(
+        {"hyperparameters": {"max_tokens": 500}, "rate_limit": {"requests_per_minute": 6}},
+        {"first_token_seconds": 1, "output_tokens_per_second": 1000,
+         "input_price_per_1k_tokens": 1.0, "output_price_per_1k_tokens": 2.0},
+    )
+
+    estimate = estimator.estimate_run([_prompt("10 words") for _ in range(3)], concurrency=3)
+
+    assert estimate.requests == 3
+    assert estimate.bound == "requests_per_minute"
+    assert estimate.wall_seconds == 30
+    assert estimate.reserved_tokens == 3 * (100 + 500)
+    assert estimate.cost == pytest.approx((300 * 1.0 + estimate.output_tokens * 2.0) / 1000)
@@ -0,0 +1,117 @@
+import asyncio
+import concurrent.futures
+import time
+from contextlib import contextmanager
+from unittest.mock import MagicMock
+
+import pytest
+
+from bisheng.engines.request_context import current_request_context
+from bisheng.runner.dispatch import PromptDispatcher
+from bisheng.runner.hedging import HedgingPolicy
+from bisheng.utils.exceptions import PromptCancelledError
+
+
+def test_delay_is_unknown_until_min_samples():
+    policy = HedgingPolicy(percentile=50, min_samples=3, min_delay=0)
+    policy.observe(1.0)
+    policy.observe(2.0)
+    assert policy.delay() is None
+
+    policy.observe(3.0)
+    assert policy.delay() == 2.0
+
+
+def test_delay_uses_percentile_with_floor():
+    policy = HedgingPolicy(percentile=95, min_samples=1, min_delay=0.5)
+    for latency in range(1, 101):
+        policy.observe(latency / 1000)
+
+    assert policy.delay() == 0.5
+
+    policy = HedgingPolicy(percentile=95, min_samples=1, min_delay=0)
+    for latency in range(1, 101):
+        policy.observe(latency)
+    assert policy.delay() == 95
+
+
+def test_budget_caps_hedged_fraction():
+    policy = HedgingPolicy(budget=0.25)
+    for _ in range(8):
+        policy.on_dispatch()
+
+    assert [policy.try_hedge() for _ in range(3)] == [True, True, False]
+
+
+class _Engine:
+    def __init__(self, delay, response):
+        self.delay = delay
+        self.response = response
+        self.cancelled = False
+
+    async def ainvoke(self, prompt):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return self.response
+
+
+@pytest.fixture
+def dispatcher():
+    hedging = HedgingPolicy(min_samples=1, min_delay=0.01, budget=1)
+    hedging.observe(0.01)
+    return PromptDispatcher(MagicMock(), MagicMock(), MagicMock(), MagicMock(), MagicMock(), hedging=hedging)
+
+
+def test_hedge_wins_and_slow_request_is_cancelled(dispatcher):
+    slow, fast = _Engine(5, "slow"), _Engine(0, "fast")
+
+    start = time.monotonic()
+    results, _ = asyncio.run(dispatcher._ainvoke_hedged(slow, fast, "prompt"))
+
+    assert results == "fast"
+    assert slow.cancelled
+    assert time.monotonic() - start < 1
+
+
+def test_fast_request_is_not_hedged(dispatcher):
+    fast, hedge = _Engine(0, "fast"), _Engine(0, "hedge")
+
+    results, _ = asyncio.run(dispatcher._ainvoke_hedged(fast, hedge, "prompt"))
+
+    assert results == "fast"
+
+
+class _Pool:
+    def __init__(self, engine):
+        self.engine = engine
+
+    @contextmanager
+    def checkout(self):
+        yield self.engine
+
+
+class _SyncEngine(_Engine):
+    def invoke(self, prompt):
+        deadline = time.monotonic() + self.delay
+        while time.monotonic() < deadline:
+            try:
+                current_request_context().check()
+            except PromptCancelledError:
+                self.cancelled = True
+                raise
+            time.sleep(0.01)
+        return self.response
+
+
+def test_thread_hedge_wins_and_slow_request_is_cancelled(dispatcher):
+    slow, fast = _SyncEngine(5, "slow"), _SyncEngine(0, "fast")
+    dispatcher._engine_pool, dispatcher._hedge_pool = _Pool(slow), _Pool(fast)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as dispatcher._hedge_executor:
+        results, _ = dispatcher._invoke_hedged("prompt")
+
+    assert results == "fast"
+    assert slow.cancelled
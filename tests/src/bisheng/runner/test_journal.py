@@ -0,0 +1,101 @@
+import os
+import threading
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from bisheng.engines.bedrock.response import BedrockResponse
+from bisheng.runner.journal import RunJournal
+
+_ENGINE_CONFIG = {"type": "bedrock", "model_id": "model"}
+
+
+def _prompt(shape_id, instruction="instruction"):
+    prompt = MagicMock()
+    prompt.to_json.return_value = {"shape_id": shape_id, "instruction": instruction}
+    return prompt
+
+
+def _journal(path, **kwargs):
+    return RunJournal(str(path), kwargs.pop("engine_config", _ENGINE_CONFIG), batch_size=kwargs.pop("batch_size", 2),
+                      flush_interval=kwargs.pop("flush_interval", 60))
+
+
+@pytest.fixture
+def path(tmp_path):
+    return tmp_path / "Output.journal.jsonl"
+
+
+def test_resume_returns_finished_prompts(path):
+    journal = _journal(path)
+    journal.open(resume=False)
+    journal.append(_prompt(1), BedrockResponse(rationale="r", response="first", sources=""))
+    journal.close()
+
+    resumed = _journal(path)
+    resumed.open(resume=True)
+
+    assert resumed.get(_prompt(1)).response == "first"
+    assert resumed.get(_prompt(2)) is None
+    assert resumed.get(_prompt(1, instruction="edited")) is None
+    resumed.close()
+
+
+def test_resume_ignores_records_from_other_engine_settings(path):
+    journal = _journal(path)
+    journal.open(resume=False)
+    journal.append(_prompt(1), BedrockResponse(rationale="r", response="first", sources=""))
+    journal.close()
+
+    resumed = _journal(path, engine_config={**_ENGINE_CONFIG, "model_id": "other"})
+    resumed.open(resume=True)
+
+    assert resumed.get(_prompt(1)) is None
+    resumed.close()
+
+
+def test_torn_last_line_is_ignored(path):
+    journal = _journal(path)
+    journal.open(resume=False)
+    journal.append(_prompt(1), BedrockResponse(rationale="r", response="first", sources=""))
+    journal.close()
+    with open(path, "a") as file:
+        file.write('{"key": "trunc')
+
+    resumed = _journal(path)
+    resumed.open(resume=True)
+
+    assert resumed.get(_prompt(1)).response == "first"
+    resumed.close(delete=True)
+    assert not os.path.exists(path)
+
+
+def test_fsyncs_once_a_batch_is_pending(path):
+    synced = threading.Event()
+    with patch("bisheng.runner.journal.os.fsync", side_effect=lambda _: synced.set()) as mock_fsync:
+        journal = _journal(path, batch_size=2)
+        journal.open(resume=False)
+        journal.append(_prompt(1), BedrockResponse(rationale="r", response="first", sources=""))
+        assert not synced.wait(0.1)
+
+        journal.append(_prompt(2), BedrockResponse(rationale="r", response="second", sources=""))
+        assert synced.wait(5)
+        journal.close()
+
+    assert mock_fsync.call_count == 1
+
+
+def test_without_resume_starts_afresh(path):
+    journal = _journal(path)
+    journal.open(resume=False)
+    journal.append(_prompt(1), BedrockResponse(rationale="r", response="first", sources=""))
+    journal.close()
+
+    restarted = _journal(path)
+    restarted.open(resume=False)
+    restarted.close()
+    resumed = _journal(path)
+    resumed.open(resume=True)
+
+    assert resumed.get(_prompt(1)) is None
+    resumed.close()
@@ -0,0 +1,110 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from bisheng.runner.manifest import ShapeManifest, find_output_deck
+
+_ENGINE_CONFIG = {"type": "bedrock", "model_id": "model"}
+
+
+def _prompt(shape_id, instruction):
+    prompt = MagicMock()
+    prompt.get_slide_id.return_value = 256
+    prompt.get_shape.return_value.shape_id = shape_id
+    prompt.get_system_prompt.return_value = "system"
+    prompt.get_instruction_prompt.return_value = instruction
+    return prompt
+
+
+@pytest.fixture
+def output_path(tmp_path):
+    path = tmp_path / "Output.pptx"
+    path.write_bytes(b"deck")
+    return str(path)
+
+
+def test_only_changed_or_new_shapes_are_regenerated(output_path):
+    title, body = _prompt(2, "title"), _prompt(3, "body")
+    ShapeManifest(output_path, _ENGINE_CONFIG).save([title, body], {title: MagicMock(), body: MagicMock()})
+
+    manifest = ShapeManifest(output_path, _ENGINE_CONFIG)
+    assert manifest.load()
+
+    edited_body, new_shape = _prompt(3, "edited body"), _prompt(4, "footer")
+    assert manifest.changed([_prompt(2, "title"), edited_body, new_shape]) == [edited_body, new_shape]
+
+
+def test_engine_config_change_regenerates_every_shape(output_path):
+    title = _prompt(2, "title")
+    ShapeManifest(output_path, _ENGINE_CONFIG).save([title], {title: MagicMock()})
+
+    manifest = ShapeManifest(output_path, {**_ENGINE_CONFIG, "model_id": "other"})
+    manifest.load()
+
+    assert manifest.changed([title]) == [title]
+
+
+def test_manifest_is_ignored_when_output_deck_changed(output_path):
+    title = _prompt(2, "title")
+    ShapeManifest(output_path, _ENGINE_CONFIG).save([title], {title: MagicMock()})
+    with open(output_path, "wb") as file:
+        file.write(b"fresh copy of the template")
+
+    manifest = ShapeManifest(output_path, _ENGINE_CONFIG)
+
+    assert not manifest.load()
+    assert manifest.changed([title]) == [title]
+
+
+def test_failed_shapes_are_not_recorded(output_path):
+    title, body = _prompt(2, "title"), _prompt(3, "body")
+    ShapeManifest(output_path, _ENGINE_CONFIG).save([title, body], {title: MagicMock(), body: None})
+
+    manifest = ShapeManifest(output_path, _ENGINE_CONFIG)
+    manifest.load()
+
+    assert manifest.changed([title, body]) == [body]
+
+
+def test_shape_depending_on_a_changed_shape_is_regenerated(output_path):
+    title, summary = _prompt(2, "title"), _prompt(3, "summary of {{ref:Title}}")
+    summary.get_dependencies.return_value = [title]
+    manifest = ShapeManifest(output_path, _ENGINE_CONFIG)
+    manifest.changed([title, summary])
+    # resolving the instruction during the run does not change the recorded hash
+    summary.get_instruction_prompt.return_value = "summary of the title"
+    manifest.save([title, summary], {title: MagicMock(), summary: MagicMock()})
+
+    def decode(title_instruction):
+        title = _prompt(2, title_instruction)
+        summary = _prompt(3, "summary of {{ref:Title}}")
+        summary.get_dependencies.return_value = [title]
+        return title, summary
+
+    manifest = ShapeManifest(output_path, _ENGINE_CONFIG)
+    manifest.load()
+    assert manifest.changed(decode("title")) == []
+    edited_title, summary = decode("edited title")
+    assert manifest.changed([edited_title, summary]) == [edited_title, summary]
+
+
+def test_long_chains_of_dependent_shapes_are_hashed(output_path):
+    chain = [_prompt(0, "first")]
+    for index in range(1, 1500):
+        chain.append(_prompt(index, "next"))
+        chain[-1].get_dependencies.return_value = [chain[-2]]
+    # the last shape first, so that no hash of the chain is memoized yet
+    chain.reverse()
+    ShapeManifest(output_path, _ENGINE_CONFIG).save(chain, {prompt: MagicMock() for prompt in chain})
+
+    manifest = ShapeManifest(output_path, _ENGINE_CONFIG)
+    manifest.load()
+    chain[-1].get_instruction_prompt.return_value = "edited"
+
+    assert manifest.changed(chain) == chain
+
+
+def test_find_output_deck():
+    assert find_output_deck([{"type": "transparency-report", "report_dir": "reports"},
+                             {"type": "pptx", "path": "Output.pptx"}]) == "Output.pptx"
+    assert find_output_deck([{"type": "transparency-report", "report_dir": "reports"}]) is None
@@ -0,0 +1,51 @@
+from unittest.mock import patch
+
+from botocore.exceptions import ClientError
+
+from bisheng.runner.retry import Outcome, RetryPolicy, RetryQueue, classify_error
+from bisheng.utils.exceptions import PromptCancelledError, PromptTimeoutError
+
+
+def _throttling_error():
+    return ClientError({"Error": {"Code": "ThrottlingException", "Message": "slow down"}}, "InvokeModel")
+
+
+def test_classify_error():
+    assert classify_error(_throttling_error()) is Outcome.THROTTLED
+    assert classify_error(PromptTimeoutError("late")) is Outcome.TIMED_OUT
+    assert classify_error(ValueError("bad")) is Outcome.FAILED
+
+
+def test_retry_policy_retries_transient_errors_up_to_max_attempts():
+    policy = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=20.0)
+
+    assert policy.next_delay(1, _throttling_error()) is not None
+    assert policy.next_delay(2, ConnectionResetError()) is not None
+    assert policy.next_delay(3, _throttling_error()) is None
+
+
+def test_retry_policy_does_not_retry_other_errors():
+    policy = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=20.0)
+
+    assert policy.next_delay(1, ValueError("bad")) is None
+    assert policy.next_delay(1, PromptCancelledError("aborted")) is None
+
+
+def test_retry_policy_backoff_is_jittered_and_capped():
+    policy = RetryPolicy(max_attempts=10, base_delay=1.0, max_delay=5.0)
+
+    with patch("bisheng.runner.retry.random.uniform", side_effect=lambda low, high: high) as uniform:
+        assert policy.next_delay(1, TimeoutError()) == 1.0
+        assert policy.next_delay(3, TimeoutError()) == 4.0
+        assert policy.next_delay(6, TimeoutError()) == 5.0
+    assert all(call.args[0] == 0 for call in uniform.call_args_list)
+
+
+def test_retry_queue_returns_prompts_once_due():
+    queue = RetryQueue()
+    queue.push("later", 60)
+    queue.push("now", 0)
+
+    assert queue.pop_due() == ["now"]
+    assert len(queue) == 1
+    assert 0 < queue.next_due_in() <= 60
@@ -1,10 +1,19 @@
 import os
-from unittest.mock import patch, mock_open
+from unittest.mock import MagicMock, patch, mock_open
 
 import pytest
 import yaml
-from src.bisheng.runner import Runner
-from src.bisheng.utils.defaults import CONFIG_FILE_NAME, MAX_NUM_THREADS
+from bisheng.decoders.pptx_decoder import PptxDecoder
+from bisheng.engines.bedrock.response import BedrockResponse
+from bisheng.prompting.batch_prompt import BatchPrompt
+from bisheng.prompting.prompt_graph import PromptGraph
+from bisheng.runner import Runner
+from bisheng.runner.admission import PromptAdmission, coalesce_prompts
+from bisheng.runner.concurrency import AimdConcurrencyController
+from bisheng.runner.dispatch import PromptDispatcher
+from bisheng.runner.retry import RetryPolicy
+from bisheng.runner.streaming import PromptStream
+from bisheng.utils.defaults import CONFIG_FILE_NAME, MAX_NUM_THREADS
 
 
 @pytest.fixture
@@ -20,7 +29,7 @@ def mock_getcwd():
 
 @pytest.fixture
 def mock_load_yaml():
-    with patch('src.bisheng.runner.Runner._load_yaml') as mock:
+    with patch('bisheng.runner.Runner._load_yaml') as mock:
         yield mock
 
 
@@ -195,6 +204,16 @@ def test_generate_initial_config_empty_string(mock_generate_gaab, mock_generate_
     mock_generate_bedrock.assert_not_called()
 
 
+@pytest.mark.parametrize("engine", [{"type": "bedrock-streaming"},
+                                    {"type": "router", "backends": [{"type": "bedrock"},
+                                                                    {"type": "bedrock-streaming"}]}])
+def test_run_rejects_bedrock_streaming_in_async_mode(engine):
+    with pytest.raises(ValueError) as exc_info:
+        Runner(config={"engine": engine}).run(mode="async")
+    assert str(exc_info.value) == ("The bedrock-streaming engine does not stream responses in async mode; run it in "
+                                   "thread mode")
+
+
 def test_generate_template_gaab_config():
     config = Runner._generate_template_gaab_config()
     assert "engine" in config
@@ -236,3 +255,75 @@ def test_resolve_num_threads_with_negative_num_threads():
 ])
 def test_resolve_num_threads_parametrized(num_tests, num_threads, expected):
     assert Runner._resolve_num_threads(num_tests, num_threads) == expected
+
+
+def _prompt(system_prompt, instruction):
+    prompt = MagicMock()
+    prompt.get_system_prompt.return_value = system_prompt
+    prompt.get_instruction_prompt.return_value = instruction
+    return prompt
+
+
+def test_coalesce_prompts_groups_identical_requests():
+    footer, agenda, footer_again, other_system = (_prompt("s", "footer"), _prompt("s", "agenda"),
+                                                  _prompt("s", "footer"), _prompt("t", "footer"))
+
+    with patch("bisheng.runner.admission.metrics") as mock_metrics:
+        duplicates = coalesce_prompts([footer, agenda, footer_again, other_system])
+
+    assert duplicates == {footer: [footer_again], agenda: [], other_system: []}
+    mock_metrics.increment.assert_called_once_with("runner.calls_saved", 1)
+
+
+def test_streamed_prompts_are_dispatched_as_decoded_and_coalesced():
+    footer, agenda, footer_again = _prompt("s", "footer"), _prompt("s", "agenda"), _prompt("s", "footer")
+    for prompt in (footer, agenda, footer_again):
+        prompt.get_dependencies.return_value = []
+    decoder, journal, progress = MagicMock(), MagicMock(), MagicMock()
+    decoder.iter_prompts.return_value = iter([footer, agenda, footer_again])
+    journal.get.return_value = None
+    admission = PromptAdmission({}, PromptGraph([]), journal, progress, 0, stream=True)
+
+    stream = iter(PromptStream(decoder, admission))
+    assert next(stream) is footer
+    response = MagicMock()
+    admission.record(footer, response)
+
+    assert list(stream) == [agenda]
+    assert admission.results == {footer: response, agenda: None, footer_again: response}
+    progress.update.assert_called_with(0, total=3)
+
+
+def _pptx_prompt(suffix, output_format=""):
+    return PptxDecoder.PptxPromptBehavior(MagicMock(slide_id=256), MagicMock(), "system", "CONTEXT\n" + suffix,
+                                          "CONTEXT\n", suffix, output_format)
+
+
+def test_batch_over_the_output_budget_is_split():
+    prompts = [_pptx_prompt(f"shape {index}", "At most 100 words.") for index in range(4)]
+    runner = Runner(config={"engine": {"type": "bedrock", "hyperparameters": {"max_tokens": 400}}})
+
+    fitted = runner._fit_output_budget([BatchPrompt(prompts)])
+
+    assert [prompt.prompts for prompt in fitted] == [prompts[:2], prompts[2:]]
+
+
+def test_batch_whose_response_cannot_be_split_falls_back_to_one_request_per_prompt():
+    first, second = _pptx_prompt("first"), _pptx_prompt("second")
+    engine = MagicMock()
+    engine.invoke.side_effect = lambda prompt: BedrockResponse(rationale="", sources="",
+                                                              response=prompt.get_instruction_suffix())
+    engine_factory = MagicMock()
+    engine_factory.create.return_value = engine
+    admission = PromptAdmission({first: None, second: None}, PromptGraph([first, second]), MagicMock(), MagicMock(),
+                                0)
+    dispatcher = PromptDispatcher(engine_factory, admission, AimdConcurrencyController(initial=2, minimum=2, maximum=2),
+                                  RetryPolicy(max_attempts=1, base_delay=0, max_delay=0), MagicMock())
+
+    with patch("bisheng.runner.dispatch.metrics") as mock_metrics:
+        dispatcher.run_threads([BatchPrompt([first, second])], 2)
+
+    assert engine.invoke.call_count == 3
+    assert admission.results[first].response == "first"
+    assert admission.results[second].response == "second"
+    mock_metrics.increment.assert_any_call("batching.fallbacks")
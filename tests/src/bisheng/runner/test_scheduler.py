@@ -0,0 +1,91 @@
+from unittest.mock import MagicMock
+
+import pytest
+
+from bisheng.decoders.pptx_decoder import PptxDecoder
+from bisheng.prompting.prompt_graph import PromptGraph
+from bisheng.runner.estimator import RunEstimator
+from bisheng.runner.scheduler import PromptScheduler
+
+_ENGINE = {"type": "bedrock", "model_id": "model"}
+
+
+def _prompt(instruction, output_format):
+    slide, shape = MagicMock(slide_id=1), MagicMock(shape_id=instruction)
+    slide.name, shape.name = "slide", "shape"
+    return PptxDecoder.PptxPromptBehavior(slide, shape, "", instruction, output_format=output_format)
+
+
+def _scheduler(path, order="longest_first"):
+    scheduler = PromptScheduler(str(path), _ENGINE, RunEstimator(_ENGINE), order)
+    scheduler.load()
+    return scheduler
+
+
+@pytest.fixture
+def prompts():
+    return [_prompt("short", "10 words"), _prompt("long", "200 words"), _prompt("medium", "50 words")]
+
+
+def test_longest_expected_prompts_are_dispatched_first(tmp_path, prompts):
+    short, long, medium = prompts
+
+    ordered, makespan = _scheduler(tmp_path / "history.json").schedule(prompts, concurrency=1)
+
+    assert ordered == [long, medium, short]
+    assert makespan == pytest.approx(sum(RunEstimator(_ENGINE).estimate_prompt(p).seconds for p in prompts))
+    assert _scheduler(tmp_path / "history.json", "deck").schedule(prompts, 1)[0] == prompts
+    assert _scheduler(tmp_path / "history.json", "shortest_first").schedule(prompts, 1)[0] == [short, medium, long]
+
+
+def test_history_of_previous_runs_overrides_estimates(tmp_path, prompts):
+    short, long, medium = prompts
+    scheduler = _scheduler(tmp_path / "history.json")
+    scheduler.observe(short, 60.0)
+    scheduler.save()
+
+    assert _scheduler(tmp_path / "history.json").predict(short) == 60.0
+    assert _scheduler(tmp_path / "other.json").predict(short) < 60.0
+
+
+def test_calibration_scales_unseen_prompts(tmp_path, prompts):
+    short, long, medium = prompts
+    estimate = RunEstimator(_ENGINE).estimate_prompt(long).seconds
+    scheduler = _scheduler(tmp_path / "history.json")
+    scheduler.observe(short, 2 * RunEstimator(_ENGINE).estimate_prompt(short).seconds)
+    scheduler.save()
+
+    assert _scheduler(tmp_path / "history.json").predict(long) == pytest.approx(2 * estimate)
+
+
+def test_corrupt_history_is_ignored(tmp_path, prompts):
+    path = tmp_path / "history.json"
+    path.write_text("{not json")
+
+    scheduler = _scheduler(path)
+
+    assert scheduler.predict(prompts[0]) == RunEstimator(_ENGINE).estimate_prompt(prompts[0]).seconds
+
+
+def test_unwritable_history_does_not_fail_the_run(tmp_path, prompts):
+    path = tmp_path / "history.json"
+    path.mkdir()
+    scheduler = _scheduler(path)
+    scheduler.observe(prompts[0], 60.0)
+
+    scheduler.save()
+
+    assert path.is_dir()
+
+
+def test_long_chains_of_dependent_prompts_are_ranked(tmp_path):
+    chain = [_prompt("first", "10 words")]
+    for index in range(2000):
+        chain.append(_prompt(f"step {index}", "10 words"))
+        chain[-1].dependencies["previous"] = chain[-2]
+    scheduler = _scheduler(tmp_path / "history.json")
+
+    ordered, makespan = scheduler.schedule(chain[:1], concurrency=1, graph=PromptGraph(chain))
+
+    assert ordered == chain[:1]
+    assert makespan == pytest.approx(sum(scheduler.predict(prompt) for prompt in chain))
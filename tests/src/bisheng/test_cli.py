@@ -7,13 +7,13 @@ import pytest
 from click.testing import CliRunner
 from unittest.mock import patch, MagicMock
 
-from src.bisheng.runner import Runner
+from bisheng.runner import Runner
 
-from src.bisheng.utils.exceptions import PrintFailureError
+from bisheng.utils.exceptions import PrintFailureError
 
-from src.bisheng.cli import init, validate_directory, ExitCode
-from src.bisheng.utils.defaults import CONFIG_FILE_NAME
-from src.bisheng.cli import cli, run
+from bisheng.cli import init, validate_directory, ExitCode
+from bisheng.utils.defaults import CONFIG_FILE_NAME
+from bisheng.cli import cli, run
 
 
 @pytest.fixture
@@ -68,7 +68,7 @@ def test_validate_directory_raises_no_write_permissions(tmp_path):
 
 
 def test_run_command_user_abort(runner):
-    with patch('src.bisheng.runner.Runner.load') as mock_load, \
+    with patch('bisheng.runner.Runner.load') as mock_load, \
             patch('click.confirm') as mock_confirm:
         mock_load.return_value = MagicMock()
         mock_confirm.return_value = False
@@ -79,9 +79,9 @@ def test_run_command_user_abort(runner):
 
 
 def test_run_command_print_failure(runner, tmp_path):
-    with patch('src.bisheng.runner.Runner.load') as mock_load, \
+    with patch('bisheng.runner.Runner.load') as mock_load, \
             patch('click.confirm') as mock_confirm, \
-            patch('src.bisheng.runner.Runner.run') as mock_run:
+            patch('bisheng.runner.Runner.run') as mock_run:
         mock_load.return_value = MagicMock()
         mock_confirm.return_value = True
         mock_run.side_effect = PrintFailureError("")
@@ -97,7 +97,7 @@ def test_run_command_missing_config_dir(runner):
     assert "Missing option '--config-dir'" in result.output
 
 
-@patch('src.bisheng.cli.validate_directory')
+@patch('bisheng.cli.validate_directory')
 def test_run_command_invalid_directory(mock_validate, runner, tmp_path):
     mock_validate.side_effect = click.BadParameter("Invalid directory")
     result = runner.invoke(run, ['--config-dir', tmp_path])
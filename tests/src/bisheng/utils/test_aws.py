@@ -0,0 +1,90 @@
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.exceptions import ClientError
+
+from bisheng.utils.aws import CognitoTokenProvider
+
+
+def _auth_result(access_token, expires_in=3600, refresh_token=None):
+    result = {"AccessToken": access_token, "ExpiresIn": expires_in}
+    if refresh_token:
+        result["RefreshToken"] = refresh_token
+    return {"AuthenticationResult": result}
+
+
+@pytest.fixture
+def client():
+    return MagicMock()
+
+
+def test_get_token_authenticates_once(client):
+    client.initiate_auth.return_value = _auth_result("token-1", refresh_token="refresh")
+    provider = CognitoTokenProvider(client, "client-id", "user", "password")
+
+    assert provider.get_token() == "token-1"
+    assert provider.get_token() == "token-1"
+
+    client.initiate_auth.assert_called_once_with(
+        ClientId="client-id",
+        AuthFlow="USER_PASSWORD_AUTH",
+        AuthParameters={"USERNAME": "user", "PASSWORD": "password"},
+    )
+
+
+def test_get_token_refreshes_ahead_of_expiry(client):
+    client.initiate_auth.side_effect = [
+        _auth_result("token-1", expires_in=200, refresh_token="refresh"),
+        _auth_result("token-2"),
+    ]
+    provider = CognitoTokenProvider(client, "client-id", "user", "password", refresh_margin=300)
+
+    assert provider.get_token() == "token-1"
+    assert provider.get_token() == "token-2"
+    assert client.initiate_auth.call_args.kwargs["AuthFlow"] == "REFRESH_TOKEN_AUTH"
+    assert client.initiate_auth.call_args.kwargs["AuthParameters"] == {"REFRESH_TOKEN": "refresh"}
+
+
+def test_get_token_signs_in_again_when_refresh_fails(client):
+    client.initiate_auth.side_effect = [
+        _auth_result("token-1", expires_in=0, refresh_token="refresh"),
+        ClientError({"Error": {"Code": "NotAuthorizedException"}}, "InitiateAuth"),
+        _auth_result("token-2", refresh_token="refresh-2"),
+    ]
+    provider = CognitoTokenProvider(client, "client-id", "user", "password", refresh_margin=0)
+
+    provider.get_token()
+
+    assert provider.get_token() == "token-2"
+    assert client.initiate_auth.call_args.kwargs["AuthFlow"] == "USER_PASSWORD_AUTH"
+
+
+def test_concurrent_callers_share_a_single_authentication(client):
+    def slow_auth(**kwargs):
+        time.sleep(0.1)
+        return _auth_result("token-1")
+
+    client.initiate_auth.side_effect = slow_auth
+    provider = CognitoTokenProvider(client, "client-id", "user", "password")
+    tokens = []
+
+    threads = [threading.Thread(target=lambda: tokens.append(provider.get_token())) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert tokens == ["token-1"] * 10
+    client.initiate_auth.assert_called_once()
+
+
+def test_invalidate_forces_renewal(client):
+    client.initiate_auth.side_effect = [_auth_result("token-1"), _auth_result("token-2")]
+    provider = CognitoTokenProvider(client, "client-id", "user", "password")
+
+    provider.get_token()
+    provider.invalidate()
+
+    assert provider.get_token() == "token-2"
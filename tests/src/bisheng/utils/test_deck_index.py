@@ -0,0 +1,45 @@
+import pptx
+from pptx.util import Inches
+
+from bisheng.utils.deck_index import DeckIndex
+
+
+def _deck(num_slides):
+    deck = pptx.Presentation()
+    for slide_number in range(num_slides):
+        slide = deck.slides.add_slide(deck.slide_layouts[6])
+        for shape_number in range(3):
+            textbox = slide.shapes.add_textbox(Inches(1), Inches(shape_number + 1), Inches(4), Inches(1))
+            textbox.text_frame.text = f"{slide_number}.{shape_number}"
+    return deck
+
+
+def test_positions_match_list_positions():
+    deck = _deck(4)
+    index = DeckIndex(deck.slides)
+
+    for slide_position, slide in enumerate(deck.slides):
+        assert index.slide_position(slide.slide_id) == slide_position
+        for shape_position, shape in enumerate(slide.shapes):
+            assert index.position(slide.slide_id, shape.shape_id) == (slide_position, shape_position)
+
+
+def test_position_locates_shape_in_structurally_identical_deck():
+    prompts, shots = _deck(3), _deck(3)
+    prompts_index, shots_index = DeckIndex(prompts.slides), DeckIndex(shots.slides)
+    slide = prompts.slides[2]
+    shape = slide.shapes[1]
+
+    shot_shape = shots_index.get_shape(*prompts_index.position(slide.slide_id, shape.shape_id))
+
+    assert shot_shape.text_frame.text == "2.1"
+    assert shots_index.get_slide(2).slide_id == shots.slides[2].slide_id
+
+
+def test_locate_finds_slide_objects_of_any_iteration():
+    deck = _deck(3)
+    index = DeckIndex(deck.slides)
+    slide = list(deck.slides)[1]
+
+    assert index.slide_id(slide) == slide.slide_id
+    assert index.locate(slide, slide.shapes[2]) == (1, 2)